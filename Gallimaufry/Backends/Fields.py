@@ -0,0 +1,189 @@
+import logging
+logger = logging.getLogger("Gallimaufry.Backends.Fields")
+
+import functools
+import io
+import json
+import subprocess
+from collections import OrderedDict
+
+from .. import settings
+from ..Packet import Packet
+from .TShark import TShark, aiter_lines, tshark_process
+
+class Fields(TShark):
+    """Backend that asks tshark only for the fields the library uses.
+
+    Every packet is extracted with ``tshark -T fields`` straight into a
+    Packet, which is far cheaper to produce and parse than the full json
+    tree. Full json is only requested for the handful of frames carrying
+    descriptors, since those are needed to build out the
+    Device/Configuration/Interface tree.
+
+    Args:
+        pcap_filename (str): Path to the pcap file to parse.
+    """
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def endpoint_designator() -> str:
+        """str: The name this tshark uses for the endpoint address field."""
+        tshark_fields = subprocess.check_output(["tshark","-G","fields"]).decode('cp1252')
+
+        for designator in ("usb.endpoint_address", "usb.endpoint_number"):
+            if "\t{0}\t".format(designator) in tshark_fields:
+                return designator
+
+        logger.warning("Unable to dynamically determine endpoint_number designator in pcap. Results may be skewed.")
+        return settings.usb_endpoint_designator
+
+    @staticmethod
+    def field_names(designator: str) -> list:
+        """list: The fields extracted for every packet, in column order.
+
+        These are every field Packet.from_layers reads, so packets come out
+        the same as from the json backend. The direction is the top bit of
+        the endpoint address, as it is there.
+        """
+        return ["frame.number", "frame.time_epoch", "usb.bus_id", "usb.device_address", designator, "usb.transfer_type",
+                "usb.urb_status", "usb.usbd_status", "usb.request_in", "usb.capdata"]
+
+    @staticmethod
+    def packet_from_fields(line: str) -> Packet:
+        """Build a Packet from one line of field output."""
+        number, time_epoch, bus_id, device_address, endpoint, transfer_type, urb_status, usbd_status, request_in, capdata = \
+                line.rstrip("\r\n").split("\t")
+
+        packet = Packet(int(number), float(time_epoch) if time_epoch != "" else 0.0)
+
+        if bus_id != "":
+            packet.bus_id = int(bus_id)
+            packet.device_address = int(device_address)
+
+            if endpoint != "":
+                packet.endpoint = int(endpoint, 16)
+
+            if transfer_type != "":
+                packet.transfer_type = int(transfer_type, 16)
+
+            # usbmon captures have a URB status, USBPcap ones a USBD status
+            status = urb_status if urb_status != "" else usbd_status
+            if status != "":
+                packet.urb_status = int(status, 0)
+
+            if request_in != "":
+                packet.request_in = int(request_in)
+
+        if capdata != "":
+            # Older tshark separates the bytes with colons
+            packet.data = bytes.fromhex(capdata.replace(":", ""))
+
+        return packet
+
+    def descriptor_packets(self) -> dict:
+        """Full json for every frame carrying a descriptor.
+
+        Returns:
+            dict: frame number -> Gallimaufry.Packet.Packet
+        """
+        return self.packets_by_number(self.rename_duplicates(subprocess.check_output(self.descriptor_command).decode('cp1252')))
+
+    @staticmethod
+    def packets_by_number(output: str) -> dict:
+        """Decode tshark's (preprocessed) json output into frame number -> Gallimaufry.Packet.Packet."""
+        packets = json.loads(output, object_pairs_hook=OrderedDict)
+        packets = (Packet.from_json(packet) for packet in packets)
+        return {packet.number: packet for packet in packets}
+
+    def parse(self) -> list:
+        """Run tshark over the capture.
+
+        Returns:
+            list: Gallimaufry.Packet.Packet for each frame.
+        """
+        settings.usb_endpoint_designator = self.endpoint_designator()
+
+        with self.stats.stage("tshark") as timer:
+            descriptor_output = subprocess.check_output(self.descriptor_command).decode('cp1252')
+            output = subprocess.check_output(self.command).decode('cp1252')
+            timer.count = len(descriptor_output) + len(output)
+
+        with self.stats.stage("preprocess", len(descriptor_output)):
+            descriptor_output = self.rename_duplicates(descriptor_output)
+
+        with self.stats.stage("decode") as timer:
+            descriptors = self.packets_by_number(descriptor_output)
+            packets = [descriptors.pop(packet.number, packet) for packet in map(self.packet_from_fields, output.splitlines())]
+            timer.count = len(packets)
+
+        return packets
+
+    def iter_packets(self):
+        """Run tshark over the capture, decoding its field output as it is produced.
+
+        Yields:
+            Gallimaufry.Packet.Packet: One per frame.
+        """
+        settings.usb_endpoint_designator = self.endpoint_designator()
+        descriptors = self.descriptor_packets()
+
+        proc = subprocess.Popen(self.command, stdout=subprocess.PIPE)
+        finished = False
+
+        try:
+            for line in io.TextIOWrapper(proc.stdout, encoding='cp1252'):
+                packet = self.packet_from_fields(line)
+                yield descriptors.pop(packet.number, packet)
+            finished = True
+        finally:
+            proc.stdout.close()
+            returncode = proc.wait()
+
+        if finished and returncode != 0:
+            raise subprocess.CalledProcessError(returncode, self.command)
+
+    async def aiter_packets(self):
+        """Run tshark over the capture without blocking the event loop.
+
+        Yields:
+            Gallimaufry.Packet.Packet: One per frame.
+        """
+        import asyncio
+
+        # Cached after the first run, so this only blocks a worker thread once
+        settings.usb_endpoint_designator = await asyncio.get_running_loop().run_in_executor(None, self.endpoint_designator)
+
+        async with tshark_process(self.descriptor_command) as proc:
+            output = await proc.stdout.read()
+
+        descriptors = self.packets_by_number(self.rename_duplicates(output.decode('cp1252')))
+
+        async with tshark_process(self.command) as proc:
+            async for lines in aiter_lines(proc.stdout):
+                for line in lines:
+                    packet = self.packet_from_fields(line)
+                    yield descriptors.pop(packet.number, packet)
+
+                await asyncio.sleep(0)
+
+    @property
+    def descriptor_command(self) -> list:
+        """list: The tshark command line used to get the full json of the descriptor frames."""
+        display_filter = "usb.bDescriptorType"
+        if self.display_filter is not None:
+            display_filter += " && ({0})".format(self.display_filter)
+
+        return ["tshark","-r",self.pcap_filename,"-T","json","-O","usb","-Y",display_filter]
+
+    @property
+    def command(self) -> list:
+        """list: The tshark command line used to extract the fields."""
+        command = ["tshark","-r",self.pcap_filename,"-T","fields","-E","separator=/t","-E","occurrence=f"]
+        for field in self.field_names(self.endpoint_designator()):
+            command += ["-e", field]
+        if self.display_filter is not None:
+            command += ["-Y", self.display_filter]
+        return command
+
+    def __repr__(self) -> str:
+        return "<Backend fields>"
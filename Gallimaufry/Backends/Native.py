@@ -0,0 +1,981 @@
+import logging
+logger = logging.getLogger("Gallimaufry.Backends.Native")
+
+import mmap
+import os
+import struct
+from collections import OrderedDict, namedtuple
+
+from .. import settings
+from ..Packet import Packet
+from ..Stats import Stats
+from ..Version import version
+
+# Link layer types we know how to decode
+DLT_USB_LINUX        = 189
+DLT_USB_LINUX_MMAPPED = 220
+DLT_USBPCAP          = 249
+
+# URB transfer types (shared by usbmon and USBPcap)
+URB_ISOCHRONOUS = 0
+URB_INTERRUPT   = 1
+URB_CONTROL     = 2
+URB_BULK        = 3
+
+# Standard descriptor types
+DESC_DEVICE        = 0x01
+DESC_CONFIGURATION = 0x02
+DESC_STRING        = 0x03
+DESC_INTERFACE     = 0x04
+DESC_ENDPOINT      = 0x05
+DESC_HID           = 0x21
+DESC_CS_INTERFACE  = 0x24
+
+# Standard requests
+GET_DESCRIPTOR = 6
+
+# USBPcap control stages
+USBPCAP_STAGE_SETUP    = 0
+USBPCAP_STAGE_DATA     = 1
+USBPCAP_STAGE_STATUS   = 2
+USBPCAP_STAGE_COMPLETE = 3
+
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_IDB = 0x00000001
+PCAPNG_OPB = 0x00000002
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+
+# Packets read between giving the event loop a turn, for aiter_packets
+ASYNC_BATCH = 1000
+
+usbmon_header = struct.Struct("<QBBBBHbbqiiII8s")
+usbpcap_header = struct.Struct("<HQIHBHHBBI")
+
+class Native:
+    """Backend that reads pcap and pcapng files directly, without tshark.
+
+    Understands the Linux usbmon (DLT 189/220) and USBPcap (DLT 249) link
+    layers and decodes the standard descriptors itself. Packets are produced
+    as the same Packet records as the tshark backends so the rest of the
+    library does not care which backend was used.
+
+    Args:
+        pcap_filename (str): Path to the pcap file to parse.
+        stats (Gallimaufry.Stats.Stats, optional): Where to record how long
+            parse() takes.
+    """
+
+    def __init__(self, pcap_filename: str, stats: Stats = None) -> None:
+        self.pcap_filename = pcap_filename
+        self.stats = stats if stats is not None else Stats()
+
+    @staticmethod
+    def available() -> bool:
+        """bool: The native backend has no external requirements."""
+        return True
+
+    @staticmethod
+    def version() -> str:
+        """str: The native backend is versioned along with Gallimaufry."""
+        return version
+
+    def parse(self, checkpoint: "Checkpoint" = None) -> list:
+        """Read the capture.
+
+        Args:
+            checkpoint (Checkpoint, optional): See iter_packets.
+
+        Returns:
+            list: Gallimaufry.Packet.Packet for each frame.
+        """
+        with self.stats.stage("decode") as timer:
+            packets = list(self.iter_packets(checkpoint))
+            timer.count = len(packets)
+
+        return packets
+
+    def iter_packets(self, checkpoint: "Checkpoint" = None):
+        """Read the capture one packet at a time.
+
+        Args:
+            checkpoint (Checkpoint, optional): Keep this updated with how far
+                reading got, see iter_appended.
+
+        Yields:
+            Gallimaufry.Packet.Packet: One per frame.
+        """
+        settings.usb_endpoint_designator = "usb.endpoint_address"
+
+        if checkpoint is not None:
+            yield from self.iter_appended(checkpoint)
+            return
+
+        decoder = URBDecoder()
+        for number, (linktype, timestamp, data) in enumerate(iter_frames(self.pcap_filename), 1):
+            yield decoder.decode(number, linktype, timestamp, data)
+
+    def iter_appended(self, checkpoint: "Checkpoint"):
+        """Read only the frames written since checkpoint, for captures that
+        are still growing.
+
+        The checkpoint is moved along as frames are read, so calling this
+        again later carries on where it left off. A record still being
+        written at the end of the capture is left for next time.
+
+        Args:
+            checkpoint (Checkpoint): Where reading got to last time. A new
+                Checkpoint starts from the beginning.
+
+        Yields:
+            Gallimaufry.Packet.Packet: One per new frame.
+        """
+        decoder = URBDecoder()
+        decoder.requests = checkpoint.requests
+
+        for number, (linktype, timestamp, data) in enumerate(iter_frames(self.pcap_filename, cursor=checkpoint), checkpoint.frame):
+            yield decoder.decode(number, linktype, timestamp, data)
+            checkpoint.frame = number + 1
+
+    async def aiter_packets(self):
+        """Read the capture, handing control back to the event loop every
+        ASYNC_BATCH packets.
+
+        Yields:
+            Gallimaufry.Packet.Packet: One per frame.
+        """
+        import asyncio
+
+        for number, packet in enumerate(self.iter_packets(), 1):
+            yield packet
+
+            if number % ASYNC_BATCH == 0:
+                await asyncio.sleep(0)
+
+    def parse_chunk(self, chunk: "Chunk") -> tuple:
+        """Read one chunk of the capture (see Gallimaufry.Backends.parse_parallel).
+
+        Returns:
+            tuple: (packets, requests still outstanding at the end of the
+                chunk, completions whose submission came before the chunk)
+        """
+        decoder = URBDecoder(unmatched=True)
+        packets = [decoder.decode(number, linktype, timestamp, data)
+                for number, (linktype, timestamp, data) in enumerate(iter_frames(self.pcap_filename, chunk), chunk.first)]
+
+        return packets, decoder.requests, decoder.unmatched
+
+    def merge(self, results: list) -> list:
+        """Join the chunks back together, in frame order.
+
+        Completions whose submission was in an earlier chunk are decoded
+        again with the requests left outstanding by the chunks before them,
+        which fills in request_in and any descriptors they carry.
+
+        Returns:
+            list: Gallimaufry.Packet.Packet for each frame.
+        """
+        settings.usb_endpoint_designator = "usb.endpoint_address"
+
+        decoder = URBDecoder()
+        packets = []
+
+        for chunk_packets, requests, unmatched in results:
+            packets.extend(chunk_packets)
+
+            for number, linktype, timestamp, data in unmatched:
+                packets[number - 1] = decoder.decode(number, linktype, timestamp, data)
+
+            # Anything submitted in this chunk supersedes what was outstanding before it
+            decoder.requests.update(requests)
+
+        return packets
+
+    def __repr__(self) -> str:
+        return "<Backend native>"
+
+
+class URBDecoder:
+    """Turns raw link layer frames into Packets.
+
+    Keeps track of outstanding requests so that completions can be matched
+    back up with their submission (``request_in``) and have their
+    descriptors decoded.
+
+    Args:
+        unmatched (bool, optional): Keep the frames of completions whose
+            submission wasn't seen in unmatched, as (number, linktype,
+            timestamp, data), so they can be decoded again once it is known.
+            Used when decoding a capture in chunks.
+    """
+
+    def __init__(self, unmatched: bool = False):
+        # urb/irp id -> (frame number, setup bytes)
+        self.requests = {}
+        self.unmatched = [] if unmatched else None
+
+    def decode(self, number: int, linktype: int, timestamp: float, data: bytes) -> Packet:
+        """Decode a single frame."""
+        packet = Packet(number, timestamp)
+
+        if linktype in (DLT_USB_LINUX, DLT_USB_LINUX_MMAPPED):
+            descriptors = self._decode_usbmon(packet, linktype, data)
+
+        elif linktype == DLT_USBPCAP:
+            descriptors = self._decode_usbpcap(packet, data)
+
+        else:
+            descriptors = None
+
+        # Only frames with descriptors keep a layer tree
+        if descriptors and any('usb.bDescriptorType' in layer for layer in descriptors.values()):
+            layers = packet.layers
+            layers.update(descriptors)
+            packet.raw_layers = layers
+
+        return packet
+
+    def _decode_usbmon(self, packet, linktype, data):
+        if len(data) < usbmon_header.size:
+            return None
+
+        (urb_id, event_type, transfer_type, endpoint, device_address, bus_id, setup_flag,
+            data_flag, ts_sec, ts_usec, status, urb_len, data_len, setup) = usbmon_header.unpack_from(data)
+
+        header_len = 64 if linktype == DLT_USB_LINUX_MMAPPED else 48
+        payload = data[header_len:header_len + data_len] if data_flag == 0 else b''
+
+        packet.bus_id = bus_id
+        packet.device_address = device_address
+        packet.endpoint = endpoint
+        packet.transfer_type = transfer_type
+        packet.urb_status = status
+
+        if event_type == ord('S'):
+            self.requests[urb_id] = (packet.number, setup if setup_flag == 0 else None)
+            if setup_flag == 0:
+                return OrderedDict([('URB setup', decode_setup(setup))])
+        else:
+            request = self.requests.pop(urb_id, None)
+            if request is not None:
+                packet.request_in = request[0]
+                if transfer_type == URB_CONTROL and request[1] is not None:
+                    return decode_control_response(request[1], payload)
+            elif self.unmatched is not None:
+                self.unmatched.append((packet.number, linktype, packet.timestamp, bytes(data)))
+
+        if transfer_type in (URB_INTERRUPT, URB_BULK) and payload:
+            packet.data = bytes(payload)
+
+        return None
+
+    def _decode_usbpcap(self, packet, data):
+        if len(data) < usbpcap_header.size:
+            return None
+
+        (header_len, irp_id, status, function, info, bus_id, device_address,
+            endpoint, transfer_type, data_len) = usbpcap_header.unpack_from(data)
+
+        payload = data[header_len:header_len + data_len]
+        completion = info & 1 == 1
+
+        packet.bus_id = bus_id
+        packet.device_address = device_address
+        packet.endpoint = endpoint
+        packet.transfer_type = transfer_type
+        packet.urb_status = status
+
+        if transfer_type == URB_CONTROL and header_len > usbpcap_header.size:
+            stage = data[usbpcap_header.size]
+
+            if stage == USBPCAP_STAGE_SETUP and len(payload) >= 8:
+                self.requests[irp_id] = (packet.number, bytes(payload[:8]))
+                return OrderedDict([('URB setup', decode_setup(payload[:8]))])
+
+            # Responses arrive in the data stage, or in a single complete stage
+            descriptors = None
+            if completion:
+                request = self.requests.get(irp_id)
+                if request is not None:
+                    packet.request_in = request[0]
+                    if stage in (USBPCAP_STAGE_DATA, USBPCAP_STAGE_COMPLETE):
+                        descriptors = decode_control_response(request[1], payload)
+                    if stage in (USBPCAP_STAGE_STATUS, USBPCAP_STAGE_COMPLETE):
+                        del self.requests[irp_id]
+                elif self.unmatched is not None:
+                    self.unmatched.append((packet.number, DLT_USBPCAP, packet.timestamp, bytes(data)))
+            return descriptors
+
+        if not completion:
+            self.requests[irp_id] = (packet.number, None)
+        else:
+            request = self.requests.pop(irp_id, None)
+            if request is not None:
+                packet.request_in = request[0]
+            elif self.unmatched is not None:
+                self.unmatched.append((packet.number, DLT_USBPCAP, packet.timestamp, bytes(data)))
+
+        if transfer_type in (URB_INTERRUPT, URB_BULK) and payload:
+            packet.data = bytes(payload)
+
+        return None
+
+
+#
+# Descriptor decoding
+#
+
+def decode_setup(setup: bytes) -> OrderedDict:
+    """Decode an 8 byte setup packet into the tshark 'URB setup' layer."""
+    bmRequestType, bRequest, wValue, wIndex, wLength = struct.unpack("<BBHHH", setup)
+
+    layer = OrderedDict([
+        ('usb.bmRequestType', "0x{0:02x}".format(bmRequestType)),
+        ('usb.setup.bRequest', str(bRequest)),
+        ])
+
+    if bRequest == GET_DESCRIPTOR and bmRequestType & 0x60 == 0:
+        layer['usb.DescriptorIndex'] = "0x{0:02x}".format(wValue & 0xff)
+        layer['usb.bDescriptorType'] = "0x{0:02x}".format(wValue >> 8)
+        layer['usb.LanguageId'] = "0x{0:04x}".format(wIndex)
+    else:
+        layer['usb.setup.wValue'] = "0x{0:04x}".format(wValue)
+        layer['usb.setup.wIndex'] = str(wIndex)
+
+    layer['usb.setup.wLength'] = str(wLength)
+    return layer
+
+def decode_control_response(setup: bytes, payload: bytes) -> OrderedDict:
+    """Decode the data stage of a completed control transfer into layers."""
+    layers = OrderedDict()
+
+    if setup is None or len(setup) < 8 or not payload:
+        return layers
+
+    bmRequestType, bRequest, wValue = struct.unpack_from("<BBH", setup)
+
+    # Only standard GET_DESCRIPTOR responses are decoded
+    if bRequest != GET_DESCRIPTOR or bmRequestType & 0x60 != 0:
+        return layers
+
+    descriptor_type = wValue >> 8
+
+    if len(payload) < 2 or payload[1] != descriptor_type:
+        return layers
+
+    if descriptor_type == DESC_DEVICE:
+        layer = decode_device_descriptor(payload)
+        if layer is not None:
+            layers['DEVICE DESCRIPTOR'] = layer
+
+    elif descriptor_type == DESC_CONFIGURATION:
+        for name, layer in decode_configuration_descriptors(payload):
+            layers[name] = layer
+
+    elif descriptor_type == DESC_STRING:
+        layers['STRING DESCRIPTOR'] = decode_string_descriptor(payload, wValue & 0xff)
+
+    return layers
+
+def _descriptor_layer(payload: bytes) -> OrderedDict:
+    return OrderedDict([
+        ('usb.bLength', str(payload[0])),
+        ('usb.bDescriptorType', "0x{0:02x}".format(payload[1])),
+        ])
+
+def decode_device_descriptor(payload: bytes) -> OrderedDict:
+    """Decode a device descriptor. Returns None if it was truncated."""
+    if len(payload) < 18:
+        return None
+
+    (bcdUSB, bDeviceClass, bDeviceSubClass, bDeviceProtocol, bMaxPacketSize0, idVendor, idProduct,
+        bcdDevice, iManufacturer, iProduct, iSerialNumber, bNumConfigurations) = struct.unpack_from("<HBBBBHHHBBBB", payload, 2)
+
+    layer = _descriptor_layer(payload)
+    layer['usb.bcdUSB'] = "0x{0:04x}".format(bcdUSB)
+    layer['usb.bDeviceClass'] = "0x{0:02x}".format(bDeviceClass)
+    layer['usb.bDeviceSubClass'] = str(bDeviceSubClass)
+    layer['usb.bDeviceProtocol'] = str(bDeviceProtocol)
+    layer['usb.bMaxPacketSize0'] = str(bMaxPacketSize0)
+    layer['usb.idVendor'] = str(idVendor)
+    layer['usb.idProduct'] = "0x{0:04x}".format(idProduct)
+    layer['usb.bcdDevice'] = "0x{0:04x}".format(bcdDevice)
+    layer['usb.iManufacturer'] = str(iManufacturer)
+    layer['usb.iProduct'] = str(iProduct)
+    layer['usb.iSerialNumber'] = str(iSerialNumber)
+    layer['usb.bNumConfigurations'] = str(bNumConfigurations)
+    return layer
+
+def decode_string_descriptor(payload: bytes, index: int) -> OrderedDict:
+    """Decode a string descriptor. Index 0 holds the supported language ids."""
+    length = min(payload[0], len(payload))
+    layer = _descriptor_layer(payload)
+
+    if index == 0:
+        for offset in range(2, length - 1, 2):
+            layer['usb.wLANGID'] = "0x{0:04x}".format(struct.unpack_from("<H", payload, offset)[0])
+    else:
+        layer['usb.bString'] = payload[2:length].decode('utf-16-le', errors='replace')
+
+    return layer
+
+def decode_configuration_descriptors(payload: bytes):
+    """Walk a full configuration descriptor, yielding (layer name, layer) pairs."""
+    offset = 0
+    interface_class = interface_subclass = None
+    counts = {}
+
+    while offset + 2 <= len(payload):
+        length = payload[offset]
+
+        # Malformed descriptor, stop before we loop forever
+        if length < 2:
+            break
+
+        descriptor = payload[offset:offset + length]
+        descriptor_type = descriptor[1]
+        offset += length
+
+        layer = _descriptor_layer(descriptor)
+
+        if descriptor_type == DESC_CONFIGURATION and len(descriptor) >= 9:
+            wTotalLength, bNumInterfaces, bConfigurationValue, iConfiguration, bmAttributes, bMaxPower = struct.unpack_from("<HBBBBB", descriptor, 2)
+            layer['usb.wTotalLength'] = str(wTotalLength)
+            layer['usb.bNumInterfaces'] = str(bNumInterfaces)
+            layer['usb.bConfigurationValue'] = str(bConfigurationValue)
+            layer['usb.iConfiguration'] = str(iConfiguration)
+            layer['usb.configuration.bmAttributes'] = "0x{0:02x}".format(bmAttributes)
+            layer['usb.configuration.bmAttributes_tree'] = OrderedDict([
+                ('usb.configuration.legacy10buspowered', str((bmAttributes >> 7) & 1)),
+                ('usb.configuration.selfpowered', str((bmAttributes >> 6) & 1)),
+                ('usb.configuration.remotewakeup', str((bmAttributes >> 5) & 1)),
+                ])
+            layer['usb.bMaxPower'] = str(bMaxPower)
+            name = "CONFIGURATION DESCRIPTOR"
+
+        elif descriptor_type == DESC_INTERFACE and len(descriptor) >= 9:
+            bInterfaceNumber, bAlternateSetting, bNumEndpoints, interface_class, interface_subclass, bInterfaceProtocol, iInterface = struct.unpack_from("<BBBBBBB", descriptor, 2)
+            layer['usb.bInterfaceNumber'] = str(bInterfaceNumber)
+            layer['usb.bAlternateSetting'] = str(bAlternateSetting)
+            layer['usb.bNumEndpoints'] = str(bNumEndpoints)
+            layer['usb.bInterfaceClass'] = str(interface_class)
+            layer['usb.bInterfaceSubClass'] = "0x{0:02x}".format(interface_subclass)
+            layer['usb.bInterfaceProtocol'] = "0x{0:02x}".format(bInterfaceProtocol)
+            layer['usb.iInterface'] = str(iInterface)
+            name = "INTERFACE DESCRIPTOR ({0}.{1})".format(bInterfaceNumber, bAlternateSetting)
+
+        elif descriptor_type == DESC_ENDPOINT and len(descriptor) >= 7:
+            bEndpointAddress, bmAttributes, wMaxPacketSize, bInterval = struct.unpack_from("<BBHB", descriptor, 2)
+            layer['usb.bEndpointAddress'] = "0x{0:02x}".format(bEndpointAddress)
+            layer['usb.bmAttributes'] = "0x{0:02x}".format(bmAttributes)
+            layer['usb.wMaxPacketSize'] = str(wMaxPacketSize)
+            layer['usb.bInterval'] = str(bInterval)
+            name = "ENDPOINT DESCRIPTOR"
+
+        elif descriptor_type == DESC_HID and interface_class == 0x3 and len(descriptor) >= 9:
+            bcdHID, bCountryCode, bNumDescriptors, bDescriptorType, wDescriptorLength = struct.unpack_from("<HBBBH", descriptor, 2)
+            layer['usbhid.descriptor.hid.bcdHID'] = "0x{0:04x}".format(bcdHID)
+            layer['usbhid.descriptor.hid.bCountryCode'] = "0x{0:02x}".format(bCountryCode)
+            layer['usbhid.descriptor.hid.bNumDescriptors'] = str(bNumDescriptors)
+            layer['usbhid.descriptor.hid.bDescriptorType'] = str(bDescriptorType)
+            layer['usbhid.descriptor.hid.wDescriptorLength'] = str(wDescriptorLength)
+            name = "HID DESCRIPTOR"
+
+        elif descriptor_type == DESC_CS_INTERFACE and interface_class == 0xe and len(descriptor) >= 3:
+            # Video class, 1 == control interface, 2 == streaming interface
+            if interface_subclass == 1:
+                layer['usbvideo.control.descriptorSubType'] = "0x{0:02x}".format(descriptor[2])
+            elif interface_subclass == 2:
+                layer['usbvideo.streaming.descriptorSubType'] = "0x{0:02x}".format(descriptor[2])
+            name = "VIDEO CLASS DESCRIPTOR"
+
+        else:
+            name = "DESCRIPTOR 0x{0:02x}".format(descriptor_type)
+
+        # Layer names need to be unique within a packet
+        counts[name] = counts.get(name, -1) + 1
+        if counts[name] > 0 or name in ("HID DESCRIPTOR", "ENDPOINT DESCRIPTOR"):
+            name = "{0} {1}".format(name, counts[name])
+
+        yield name, layer
+
+
+#
+# File formats
+#
+
+PCAP_MAGICS = (b'\xd4\xc3\xb2\xa1', b'\xa1\xb2\xc3\xd4', b'\x4d\x3c\xb2\xa1', b'\xa1\xb2\x3c\x4d')
+PCAPNG_MAGIC = b'\x0a\x0d\x0d\x0a'
+
+# A run of whole frames in a capture. first is the frame number of the first
+# one, offset/stop the byte range holding them and state whatever the reader
+# needs to start part way through (pcapng byte order and interfaces).
+Chunk = namedtuple("Chunk", ["first", "count", "offset", "stop", "state"])
+
+class Checkpoint:
+    """How far a capture has been read, so that reading can carry on from
+    there once more has been written to it (see Native.iter_appended).
+
+    Attributes:
+        frame (int): Frame number of the next frame.
+        offset (int): Byte offset of the next record. None for the start of the capture.
+        state (tuple): What reading pcapng needs to start at offset, as for Chunk.
+        requests (dict): URBs submitted but not yet completed (see URBDecoder).
+    """
+
+    __slots__ = 'frame', 'offset', 'state', 'requests'
+
+    def __init__(self) -> None:
+        self.frame = 1
+        self.offset = None
+        self.state = None
+        self.requests = {}
+
+    def __repr__(self) -> str:
+        return "<Checkpoint frame={0} offset={1}>".format(self.frame, self.offset)
+
+def iter_frames(pcap_filename: str, chunk: Chunk = None, cursor: Checkpoint = None):
+    """Iterate over the frames of a pcap or pcapng file.
+
+    Args:
+        pcap_filename (str): The capture to read.
+        chunk (Chunk, optional): Only read this chunk's frames (see split_frames).
+        cursor (Checkpoint, optional): Start at its offset rather than the
+            beginning, and move it past each whole record as it is read. A
+            truncated record at the end is expected then, since the capture
+            is still being written, and is left for next time.
+
+    Yields:
+        tuple: (linktype, timestamp, data) for each captured frame.
+    """
+    with open(pcap_filename, "rb") as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file
+            return
+
+        with buf:
+            magic = buf[:4]
+
+            if cursor is not None and cursor.offset is not None and cursor.offset > len(buf):
+                raise Exception("{0} is shorter than when it was last read. Was it replaced?".format(pcap_filename))
+
+            if magic == PCAPNG_MAGIC:
+                if cursor is not None:
+                    yield from _iter_pcapng(buf, cursor.offset or 0, None, cursor.state, cursor)
+                else:
+                    yield from _iter_pcapng(buf, *(chunk[2:] if chunk is not None else ()))
+
+            elif magic in PCAP_MAGICS:
+                if cursor is not None:
+                    # The file header itself may not be all there yet
+                    if len(buf) >= 24:
+                        yield from _iter_pcap(buf, cursor.offset or 24, None, cursor)
+                else:
+                    yield from _iter_pcap(buf, *(chunk[2:4] if chunk is not None else ()))
+
+            elif cursor is not None and cursor.offset is None and len(buf) < 4:
+                return
+
+            else:
+                raise Exception("Unknown capture file format for {0}".format(pcap_filename))
+
+def split_frames(pcap_filename: str, chunks: int) -> list:
+    """Split a capture into about equally sized chunks of whole frames.
+
+    Only the record headers are read, which is far cheaper than decoding.
+
+    Args:
+        pcap_filename (str): The capture to split.
+        chunks (int): How many chunks to aim for. Small captures may get fewer.
+
+    Returns:
+        list: Chunk for each part of the capture, in order.
+    """
+    with open(pcap_filename, "rb") as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return []
+
+        with buf:
+            magic = buf[:4]
+
+            if magic == PCAPNG_MAGIC:
+                records = _records_pcapng(buf)
+            elif magic in PCAP_MAGICS:
+                records = _records_pcap(buf)
+            else:
+                raise Exception("Unknown capture file format for {0}".format(pcap_filename))
+
+            end = len(buf)
+            boundaries = iter([end * i // chunks for i in range(1, chunks)])
+            boundary = next(boundaries, None)
+
+            # (first frame number, offset, state) of each chunk
+            starts = []
+            count = 0
+
+            for offset, frames, state in records:
+                if not starts or boundary is not None and offset >= boundary:
+                    starts.append((count + 1, offset, state))
+
+                    while boundary is not None and offset >= boundary:
+                        boundary = next(boundaries, None)
+
+                count += frames
+
+    stops = [(first, offset) for first, offset, _ in starts[1:]] + [(count + 1, end)]
+    return [Chunk(first, next_first - first, offset, stop, state)
+            for (first, offset, state), (next_first, stop) in zip(starts, stops)]
+
+def count_frames(pcap_filename: str) -> int:
+    """Count the frames in a capture, reading only the record headers.
+
+    Args:
+        pcap_filename (str): The capture to count.
+
+    Returns:
+        int: Number of whole frames in it.
+    """
+    with open(pcap_filename, "rb") as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return 0
+
+        with buf:
+            magic = buf[:4]
+
+            if magic == PCAPNG_MAGIC:
+                records = _records_pcapng(buf)
+            elif magic in PCAP_MAGICS:
+                records = _records_pcap(buf)
+            else:
+                raise Exception("Unknown capture file format for {0}".format(pcap_filename))
+
+            return sum(frames for _, frames, _ in records)
+
+def _iter_pcap(buf, offset: int = 24, stop: int = None, cursor: Checkpoint = None):
+    magic = buf[:4]
+    endian = '<' if magic in (b'\xd4\xc3\xb2\xa1', b'\x4d\x3c\xb2\xa1') else '>'
+    resolution = 1e-9 if magic in (b'\x4d\x3c\xb2\xa1', b'\xa1\xb2\x3c\x4d') else 1e-6
+
+    linktype = struct.unpack_from(endian + "I", buf, 20)[0] & 0x0fffffff
+    record = struct.Struct(endian + "IIII")
+    header_bytes = usbmon_header_for(endian)
+
+    end = len(buf)
+    stop = end if stop is None else stop
+
+    while offset + record.size <= end and offset < stop:
+        ts_sec, ts_frac, incl_len, orig_len = record.unpack_from(buf, offset)
+        offset += record.size
+
+        if offset + incl_len > end:
+            if cursor is None:
+                logger.warning("Capture file appears to be truncated.")
+            break
+
+        yield linktype, ts_sec + ts_frac * resolution, header_bytes(linktype, buf[offset:offset + incl_len])
+        offset += incl_len
+
+        if cursor is not None:
+            cursor.offset = offset
+
+def _records_pcap(buf):
+    """Yields (offset, frames, state) for each record, as split_frames needs."""
+    endian = '<' if buf[:4] in (b'\xd4\xc3\xb2\xa1', b'\x4d\x3c\xb2\xa1') else '>'
+    incl_len = struct.Struct(endian + "I")
+
+    offset = 24
+    end = len(buf)
+
+    while offset + 16 <= end:
+        length = incl_len.unpack_from(buf, offset + 8)[0]
+
+        if offset + 16 + length > end:
+            break
+
+        yield offset, 1, None
+        offset += 16 + length
+
+def _iter_pcapng(buf, offset: int = 0, stop: int = None, state: tuple = None, cursor: Checkpoint = None):
+    endian, interfaces = state if state is not None else ('<', [])
+    header_bytes = usbmon_header_for(endian)
+    interfaces = list(interfaces)
+
+    end = len(buf)
+    stop = end if stop is None else stop
+
+    while offset + 12 <= end and offset < stop:
+        block_type = struct.unpack_from(endian + "I", buf, offset)[0]
+
+        # New section, figure out the byte order from the magic
+        if block_type == PCAPNG_SHB:
+            endian = '<' if buf[offset + 8:offset + 12] == b'\x4d\x3c\x2b\x1a' else '>'
+            header_bytes = usbmon_header_for(endian)
+            interfaces = []
+
+        block_len = struct.unpack_from(endian + "I", buf, offset + 4)[0]
+
+        if block_len < 12 or offset + block_len > end:
+            if cursor is None:
+                logger.warning("Capture file appears to be truncated.")
+            break
+
+        body = offset + 8
+
+        if block_type == PCAPNG_IDB:
+            linktype, _, snaplen = struct.unpack_from(endian + "HHI", buf, body)
+            interfaces.append((linktype, _pcapng_tsresol(buf, endian, body + 8, offset + block_len - 4)))
+
+        elif block_type == PCAPNG_EPB:
+            interface_id, ts_high, ts_low, cap_len, orig_len = struct.unpack_from(endian + "IIIII", buf, body)
+            linktype, resolution = interfaces[interface_id]
+            data = buf[body + 20:body + 20 + cap_len]
+            yield linktype, ((ts_high << 32) | ts_low) * resolution, header_bytes(linktype, data)
+
+        elif block_type == PCAPNG_SPB:
+            orig_len = struct.unpack_from(endian + "I", buf, body)[0]
+            linktype, resolution = interfaces[0]
+            cap_len = min(orig_len, block_len - 16)
+            yield linktype, 0.0, header_bytes(linktype, buf[body + 4:body + 4 + cap_len])
+
+        elif block_type == PCAPNG_OPB:
+            interface_id, drops, ts_high, ts_low, cap_len, orig_len = struct.unpack_from(endian + "HHIIII", buf, body)
+            linktype, resolution = interfaces[interface_id]
+            data = buf[body + 20:body + 20 + cap_len]
+            yield linktype, ((ts_high << 32) | ts_low) * resolution, header_bytes(linktype, data)
+
+        offset += block_len
+
+        if cursor is not None:
+            cursor.offset = offset
+
+            if block_type in (PCAPNG_SHB, PCAPNG_IDB):
+                cursor.state = (endian, tuple(interfaces))
+
+def _records_pcapng(buf):
+    """Yields (offset, frames, state) for each block, as split_frames needs.
+    state is what _iter_pcapng needs to start reading at that block."""
+    endian = '<'
+    interfaces = ()
+    offset = 0
+    end = len(buf)
+
+    while offset + 12 <= end:
+        block_type = struct.unpack_from(endian + "I", buf, offset)[0]
+        state = (endian, interfaces)
+
+        if block_type == PCAPNG_SHB:
+            endian = '<' if buf[offset + 8:offset + 12] == b'\x4d\x3c\x2b\x1a' else '>'
+            interfaces = ()
+
+        block_len = struct.unpack_from(endian + "I", buf, offset + 4)[0]
+
+        if block_len < 12 or offset + block_len > end:
+            break
+
+        if block_type == PCAPNG_IDB:
+            linktype = struct.unpack_from(endian + "H", buf, offset + 8)[0]
+            interfaces += ((linktype, _pcapng_tsresol(buf, endian, offset + 16, offset + block_len - 4)),)
+
+        yield offset, 1 if block_type in (PCAPNG_EPB, PCAPNG_SPB, PCAPNG_OPB) else 0, state
+        offset += block_len
+
+def iter_stream_frames(stream):
+    """Iterate over the frames of a pcap or pcapng stream as they arrive.
+
+    Unlike iter_frames, nothing is read ahead, so this works on pipes such
+    as ``tshark -i usbmon1 -w -`` or stdin. Frames are read one at a time
+    and nothing is kept once they are yielded.
+
+    Args:
+        stream (file): Binary file object positioned at the start of the capture.
+
+    Yields:
+        tuple: (linktype, timestamp, data) for each captured frame.
+    """
+    magic = _read_exact(stream, 4)
+
+    if magic is None:
+        return
+
+    if magic == PCAPNG_MAGIC:
+        yield from _iter_pcapng_stream(stream, magic)
+    elif magic in PCAP_MAGICS:
+        yield from _iter_pcap_stream(stream, magic)
+    else:
+        raise Exception("Unknown capture stream format.")
+
+def _read_exact(stream, size: int):
+    """Read exactly size bytes, or None at the end of the stream."""
+    data = stream.read(size)
+
+    # Pipes can hand over less than asked for
+    while data and len(data) < size:
+        more = stream.read(size - len(data))
+        if not more:
+            break
+        data += more
+
+    if len(data) < size:
+        if data:
+            logger.warning("Capture stream appears to be truncated.")
+        return None
+
+    return data
+
+def _iter_pcap_stream(stream, magic: bytes):
+    endian = '<' if magic in (b'\xd4\xc3\xb2\xa1', b'\x4d\x3c\xb2\xa1') else '>'
+    resolution = 1e-9 if magic in (b'\x4d\x3c\xb2\xa1', b'\xa1\xb2\x3c\x4d') else 1e-6
+
+    header = _read_exact(stream, 20)
+    if header is None:
+        return
+
+    linktype = struct.unpack_from(endian + "I", header, 16)[0] & 0x0fffffff
+    record = struct.Struct(endian + "IIII")
+    header_bytes = usbmon_header_for(endian)
+
+    while True:
+        header = _read_exact(stream, record.size)
+        if header is None:
+            return
+
+        ts_sec, ts_frac, incl_len, orig_len = record.unpack(header)
+
+        data = _read_exact(stream, incl_len) if incl_len else b''
+        if data is None:
+            return
+
+        yield linktype, ts_sec + ts_frac * resolution, header_bytes(linktype, data)
+
+def _iter_pcapng_stream(stream, magic: bytes):
+    endian = '<'
+    header_bytes = usbmon_header_for(endian)
+    interfaces = []
+
+    # The first block type was read to find the format
+    block_type = magic
+
+    while True:
+        if block_type is None:
+            block_type = _read_exact(stream, 4)
+            if block_type is None:
+                return
+
+        # New section, figure out the byte order from the magic that follows the length
+        if block_type == PCAPNG_MAGIC:
+            header = _read_exact(stream, 8)
+            if header is None:
+                return
+
+            endian = '<' if header[4:8] == b'\x4d\x3c\x2b\x1a' else '>'
+            header_bytes = usbmon_header_for(endian)
+            interfaces = []
+
+            block_len = struct.unpack_from(endian + "I", header)[0]
+            if block_len < 28 or _read_exact(stream, block_len - 12) is None:
+                return
+
+            block_type = None
+            continue
+
+        header = _read_exact(stream, 4)
+        if header is None:
+            return
+
+        block, block_len = struct.unpack(endian + "II", block_type + header)
+        block_type = None
+
+        if block_len < 12:
+            logger.warning("Capture stream appears to be corrupt.")
+            return
+
+        # Everything after the block length, including the trailing copy of it
+        body = _read_exact(stream, block_len - 8)
+        if body is None:
+            return
+
+        if block == PCAPNG_IDB:
+            linktype, _, snaplen = struct.unpack_from(endian + "HHI", body)
+            interfaces.append((linktype, _pcapng_tsresol(body, endian, 8, len(body) - 4)))
+
+        elif block == PCAPNG_EPB:
+            interface_id, ts_high, ts_low, cap_len, orig_len = struct.unpack_from(endian + "IIIII", body)
+            linktype, resolution = interfaces[interface_id]
+            yield linktype, ((ts_high << 32) | ts_low) * resolution, header_bytes(linktype, body[20:20 + cap_len])
+
+        elif block == PCAPNG_SPB:
+            orig_len = struct.unpack_from(endian + "I", body)[0]
+            linktype, resolution = interfaces[0]
+            cap_len = min(orig_len, block_len - 16)
+            yield linktype, 0.0, header_bytes(linktype, body[4:4 + cap_len])
+
+        elif block == PCAPNG_OPB:
+            interface_id, drops, ts_high, ts_low, cap_len, orig_len = struct.unpack_from(endian + "HHIIII", body)
+            linktype, resolution = interfaces[interface_id]
+            yield linktype, ((ts_high << 32) | ts_low) * resolution, header_bytes(linktype, body[20:20 + cap_len])
+
+def iter_usbmon(bus: int = 0, snaplen: int = 65536):
+    """Iterate over the events of a Linux usbmon device as they happen.
+
+    Reads /dev/usbmonN directly (the usbmon kernel module must be loaded,
+    and reading it usually needs root). Bus 0 captures every bus.
+
+    Args:
+        bus (int, optional): USB bus number to capture.
+        snaplen (int, optional): Most bytes of data to keep per event.
+
+    Yields:
+        tuple: (linktype, timestamp, data) for each event.
+    """
+    path = "/dev/usbmon{0}".format(bus)
+
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError as e:
+        raise Exception("Unable to open {0} ({1}). Is the usbmon module loaded, and are you root?".format(path, e.strerror))
+
+    try:
+        while True:
+            # Each read gets one event: a 48 byte header then its data
+            data = os.read(fd, usbmon_header.size + snaplen)
+
+            if not data:
+                return
+
+            ts_sec, ts_usec = struct.unpack_from("<qi", data, 16)
+            yield DLT_USB_LINUX, ts_sec + ts_usec * 1e-6, data
+    finally:
+        os.close(fd)
+
+def _pcapng_tsresol(buf, endian, offset, end) -> float:
+    """Find the if_tsresol option of an interface description block."""
+    while offset + 4 <= end:
+        code, length = struct.unpack_from(endian + "HH", buf, offset)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            value = buf[offset + 4]
+            return 2 ** -(value & 0x7f) if value & 0x80 else 10 ** -value
+        offset += 4 + ((length + 3) & ~3)
+    return 1e-6
+
+def usbmon_header_for(endian: str):
+    """usbmon headers are written in the capturing host's byte order. Returns
+    a function that normalizes them to little endian so one decoder works."""
+
+    if endian == '<':
+        return lambda linktype, data: data
+
+    def swap(linktype, data):
+        if linktype not in (DLT_USB_LINUX, DLT_USB_LINUX_MMAPPED) or len(data) < usbmon_header.size:
+            return data
+        fields = struct.unpack_from(">QBBBBHbbqiiII8s", data)
+        return struct.pack("<QBBBBHbbqiiII8s", *fields) + data[usbmon_header.size:]
+
+    return swap
@@ -0,0 +1,259 @@
+import logging
+logger = logging.getLogger("Gallimaufry.Backends.TShark")
+
+import contextlib
+import functools
+import io
+import json
+import shutil
+import subprocess
+import typing
+from collections import OrderedDict
+
+from .. import settings
+from ..Packet import Packet
+from ..Stats import Stats
+
+class TShark:
+    """Backend that translates the capture through ``tshark -T json``.
+
+    Args:
+        pcap_filename (str): Path to the pcap file to parse.
+        display_filter (str, optional): Only output the frames matching this
+            tshark display filter.
+        stats (Gallimaufry.Stats.Stats, optional): Where to record how long
+            each stage of parse() takes.
+    """
+
+    def __init__(self, pcap_filename: str, display_filter: str = None, stats: Stats = None) -> None:
+        self.pcap_filename = pcap_filename
+        self.display_filter = display_filter
+        self.stats = stats if stats is not None else Stats()
+
+    @staticmethod
+    def available() -> bool:
+        """bool: Is tshark installed on this host?"""
+        return shutil.which("tshark") != None
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def version() -> str:
+        """str: The installed tshark version."""
+        return subprocess.check_output(["tshark","--version"]).decode('cp1252').split("\n")[0].strip()
+
+    @staticmethod
+    def determine_endpoint_designator(pcap: str) -> None:
+        """tshark has been changing names of fields... Try to determine what the endpoint designator field is called."""
+        if "usb.endpoint_address" in pcap:
+            settings.usb_endpoint_designator = "usb.endpoint_address"
+        elif "usb.endpoint_number" in pcap:
+            settings.usb_endpoint_designator = "usb.endpoint_number"
+        else:
+            logger.warn("Unable to dynamically determine endpoint_number designator in pcap. Results may be skewed.")
+
+    @staticmethod
+    def rename_duplicates(pcap: str) -> str:
+        """Work around the tshark issue where the json fields are not unique...
+        For now, just give them each a unique int. Because who cares."""
+        bad_words = ["HID DESCRIPTOR","ENDPOINT DESCRIPTOR"]
+        pcap2 = []
+        i = 0
+        for line in pcap.split("\n"):
+            for bad_word in bad_words:
+                if bad_word in line:
+                    line = line.replace(bad_word, "{0} {1}".format(bad_word, i))
+                    i += 1
+            pcap2.append(line)
+        return '\n'.join(pcap2)
+
+    @staticmethod
+    def preprocess(pcap: str) -> str:
+        TShark.determine_endpoint_designator(pcap)
+        return TShark.rename_duplicates(pcap)
+
+    @staticmethod
+    def iter_json_packets(lines):
+        """Split tshark's json output into packets without reading all of it.
+
+        Args:
+            lines (iterable): Lines of tshark json output.
+
+        Yields:
+            Gallimaufry.Packet.Packet: One packet at a time.
+        """
+        splitter = JsonPackets()
+
+        for line in lines:
+            packet = splitter.feed(line)
+            if packet is not None:
+                yield packet
+
+        splitter.close()
+
+    def parse(self) -> list:
+        """Run tshark over the capture.
+
+        Returns:
+            list: Gallimaufry.Packet.Packet for each packet output by tshark.
+        """
+        with self.stats.stage("tshark") as timer:
+            output = subprocess.check_output(self.command).decode('cp1252')
+            timer.count = len(output)
+
+        with self.stats.stage("preprocess", len(output)):
+            output = self.preprocess(output)
+
+        with self.stats.stage("decode") as timer:
+            packets = [Packet.from_json(packet) for packet in json.loads(output, object_pairs_hook=OrderedDict)]
+            timer.count = len(packets)
+
+        return packets
+
+    def iter_packets(self):
+        """Run tshark over the capture, decoding its output as it is produced.
+
+        Only one packet's worth of json is held at a time, rather than the
+        whole document.
+
+        Yields:
+            Gallimaufry.Packet.Packet: packets as output by tshark.
+        """
+        proc = subprocess.Popen(self.command, stdout=subprocess.PIPE)
+        finished = False
+
+        try:
+            yield from self.iter_json_packets(io.TextIOWrapper(proc.stdout, encoding='cp1252'))
+            finished = True
+        finally:
+            proc.stdout.close()
+            returncode = proc.wait()
+
+        if finished and returncode != 0:
+            raise subprocess.CalledProcessError(returncode, self.command)
+
+    @property
+    def command(self) -> list:
+        """list: The tshark command line used to translate the capture."""
+        command = ["tshark","-r",self.pcap_filename,"-T","json","-O","usb"]
+        if self.display_filter is not None:
+            command += ["-Y", self.display_filter]
+        return command
+
+    async def aiter_packets(self):
+        """Run tshark over the capture without blocking the event loop.
+
+        tshark runs as an asyncio subprocess and its output is decoded as it
+        arrives, handing control back to the event loop between each block
+        of output.
+
+        Yields:
+            Gallimaufry.Packet.Packet: packets as output by tshark.
+        """
+        import asyncio
+
+        splitter = JsonPackets()
+
+        async with tshark_process(self.command) as proc:
+            async for lines in aiter_lines(proc.stdout):
+                for line in lines:
+                    packet = splitter.feed(line)
+                    if packet is not None:
+                        yield packet
+
+                await asyncio.sleep(0)
+
+        splitter.close()
+
+    def __repr__(self) -> str:
+        return "<Backend tshark>"
+
+
+class JsonPackets:
+    """Splits tshark's json output into packets, fed a line at a time.
+
+    tshark writes one packet object per array element, opened by a line
+    starting with "  {" and closed by one starting with "  }".
+    """
+
+    def __init__(self) -> None:
+        self.designator_found = False
+        self.lines = []
+
+    def feed(self, line: str) -> typing.Optional[Packet]:
+        """Take the next line of output.
+
+        Returns:
+            Gallimaufry.Packet.Packet: The packet this line finished, or None.
+        """
+        if not self.lines:
+            if line.startswith("  {"):
+                self.lines.append(line)
+            return None
+
+        self.lines.append(line)
+
+        if not line.startswith("  }"):
+            return None
+
+        text = "".join(self.lines).rstrip().rstrip(",")
+        self.lines = []
+
+        if not self.designator_found and ("usb.endpoint_address" in text or "usb.endpoint_number" in text):
+            TShark.determine_endpoint_designator(text)
+            self.designator_found = True
+
+        return Packet.from_json(json.loads(TShark.rename_duplicates(text), object_pairs_hook=OrderedDict))
+
+    def close(self) -> None:
+        """The output is finished."""
+        if not self.designator_found:
+            logger.warning("Unable to dynamically determine endpoint_number designator in pcap. Results may be skewed.")
+
+
+async def aiter_lines(stream, size: int = 256*1024):
+    """Read an asyncio stream in blocks, yielding the lines of each block.
+
+    Args:
+        stream (asyncio.StreamReader): tshark's stdout.
+        size (int, optional): Bytes to read at a time.
+
+    Yields:
+        list: The complete lines read so far, with their line endings.
+    """
+    remainder = ""
+
+    while True:
+        # cp1252 is one byte per character, so blocks never split a character
+        block = (await stream.read(size)).decode('cp1252')
+
+        if not block:
+            break
+
+        lines = (remainder + block).splitlines(keepends=True)
+        remainder = lines.pop() if not lines[-1].endswith("\n") else ""
+        yield lines
+
+    if remainder:
+        yield [remainder]
+
+@contextlib.asynccontextmanager
+async def tshark_process(command: list):
+    """Run tshark as an asyncio subprocess, killing it if it isn't read to the end.
+
+    Raises:
+        subprocess.CalledProcessError: tshark failed.
+    """
+    import asyncio
+
+    proc = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE)
+
+    try:
+        yield proc
+    except BaseException:
+        if proc.returncode is None:
+            proc.kill()
+        await proc.wait()
+        raise
+
+    if await proc.wait() != 0:
+        raise subprocess.CalledProcessError(proc.returncode, command)
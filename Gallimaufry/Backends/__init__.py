@@ -0,0 +1,91 @@
+import logging
+
+logger = logging.getLogger("Gallimaufry.Backends")
+
+import importlib
+
+
+def get_backend(name: str):
+    """Returns the backend class registered under the given name.
+
+    Args:
+        name (str): Name of the backend, or "auto" to use tshark when it is
+            installed and fall back to the native reader otherwise.
+    """
+
+    if name == "auto":
+        name = "tshark" if get_backend("tshark").available() else "native"
+
+    if name not in backends:
+        raise Exception("Unknown backend {0}. Valid backends are: {1}".format(name, ", ".join(sorted(backends))))
+
+    # Backends are only imported once asked for
+    module, backend = backends[name]
+    return getattr(importlib.import_module(module, __name__), backend)
+
+
+def parse_parallel(backend: type, pcap_filename: str, jobs: int) -> list:
+    """Parse a capture in chunks, one process per chunk.
+
+    The capture is split into frame ranges of about equal size (see
+    Gallimaufry.Backends.Native.split_frames), each range is parsed by
+    backend.parse_chunk in a process pool and backend.merge joins the
+    results back up in frame order, stitching together the requests and
+    responses that straddle chunks.
+
+    Args:
+        backend (type): The backend class.
+        pcap_filename (str): Path to the capture.
+        jobs (int): Number of processes to use.
+
+    Backends without parse_chunk (tshark and fields) are run in one process.
+    tshark has to dissect every frame before a chunk's to pair up transfers
+    and decode their descriptors, so splitting the output would have it
+    read the whole capture once per job.
+
+    Returns:
+        list: Gallimaufry.Packet.Packet for each frame, as backend.parse would.
+    """
+    if not hasattr(backend, "parse_chunk"):
+        logger.warning("The {0} backend can't split a capture up, parsing it in one process. "
+                "Use backend='native' to parse in parallel.".format(backend.__name__.lower()))
+        return backend(pcap_filename).parse()
+
+    # Only pulled in when parsing in parallel
+    import concurrent.futures
+    import gc
+    from ..Packet import Packet
+    from .Native import split_frames
+
+    chunks = split_frames(pcap_filename, jobs)
+
+    if len(chunks) <= 1:
+        return backend(pcap_filename).parse()
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = pool.map(_parse_chunk, [backend] * len(chunks), [pcap_filename] * len(chunks), chunks)
+
+        # Millions of new objects would otherwise set off full collections
+        # over and over, and packets can't form cycles anyway
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            results = [(Packet.from_columns(columns),) + tuple(rest) for columns, *rest in results]
+            return backend(pcap_filename).merge(results)
+        finally:
+            if enabled:
+                gc.enable()
+
+def _parse_chunk(backend: type, pcap_filename: str, chunk) -> tuple:
+    from ..Packet import Packet
+
+    packets, *rest = backend(pcap_filename).parse_chunk(chunk)
+    return (Packet.to_columns(packets),) + tuple(rest)
+
+
+# Enumerate the backends we have added, name -> (module, class)
+backends = {
+        'tshark': ('.TShark', 'TShark'),
+        'fields': ('.Fields', 'Fields'),
+        'native': ('.Native', 'Native'),
+        }
@@ -0,0 +1,224 @@
+import logging
+logger = logging.getLogger("Gallimaufry.Batch")
+
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+import traceback
+import typing
+from collections import OrderedDict
+
+from .USB import USB
+
+# Capture files picked up when given a directory
+CAPTURE_EXTENSIONS = (".pcap", ".pcapng", ".cap")
+
+class Result:
+    """What was found in one capture, without any of its packets.
+
+    Results are small and picklable, so they are cheap to send back from
+    worker processes.
+
+    Args:
+        path (str): The capture this is the result for.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.error = None
+        self.traceback = None
+        self.elapsed = 0.0
+        self.packets = 0
+        self.summary = None
+        self.devices = []
+        self.keyboards = []
+        self.mice = []
+
+    @classmethod
+    def from_usb(cls, path: str, usb: USB) -> "Result":
+        """Build the result for an already parsed capture.
+
+        Args:
+            path (str): The capture.
+            usb (Gallimaufry.USB.USB): It, parsed.
+        """
+        result = cls(path)
+        result.packets = len(usb.pcap)
+        result.summary = usb.summary
+
+        for device in usb.devices:
+            result.devices.append(OrderedDict([
+                ('bus_id', device.bus_id),
+                ('device_address', device.device_address),
+                ('idVendor', device.idVendor),
+                ('idProduct', device.idProduct),
+                ('vendor', device.vendor),
+                ('product', device.product),
+                ('string_descriptors', dict(device.string_descriptors)),
+                ]))
+
+            for configuration in device.configurations:
+                for interface in configuration.interfaces:
+                    for endpoint in interface.endpoints:
+                        where = OrderedDict([
+                            ('bus_id', device.bus_id),
+                            ('device_address', device.device_address),
+                            ('endpoint', endpoint.bEndpointAddress),
+                            ])
+
+                        if endpoint.keyboard is not None:
+                            result.keyboards.append(OrderedDict(where, **{
+                                'keystrokes': endpoint.keyboard.keystrokes,
+                                'interpreted': endpoint.keyboard.keystrokes_interpret,
+                                }))
+
+                        if endpoint.mouse is not None:
+                            mouse = endpoint.mouse
+                            result.mice.append(OrderedDict(where, **{
+                                'reports': len(mouse.reports),
+                                'x': int(mouse.x[-1]) if len(mouse.reports) else 0,
+                                'y': int(mouse.y[-1]) if len(mouse.reports) else 0,
+                                }))
+
+        return result
+
+    @property
+    def ok(self) -> bool:
+        """bool: Was the capture analysed without error?"""
+        return self.error is None
+
+    def to_dict(self) -> OrderedDict:
+        """OrderedDict: The result as plain types, i.e.: for json."""
+        return OrderedDict((name, getattr(self, name)) for name in
+                ('path', 'error', 'traceback', 'elapsed', 'packets', 'summary', 'devices', 'keyboards', 'mice'))
+
+    def __repr__(self) -> str:
+        if not self.ok:
+            return "<Result path={0} error={1!r}>".format(self.path, self.error)
+
+        return "<Result path={0} packets={1} devices={2}>".format(self.path, self.packets, len(self.devices))
+
+
+def analyse(path: str, backend: str = "auto") -> Result:
+    """Analyse a single capture, catching anything that goes wrong.
+
+    This is what each worker runs.
+
+    Args:
+        path (str): The capture.
+        backend (str, optional): See Gallimaufry.USB.USB.
+
+    Returns:
+        Result: The result, with error set if the capture couldn't be analysed.
+    """
+    start = time.perf_counter()
+
+    try:
+        result = Result.from_usb(path, USB(path, backend=backend))
+    except Exception as e:
+        result = Result(path)
+        result.error = "{0}: {1}".format(type(e).__name__, e)
+        result.traceback = traceback.format_exc()
+
+    result.elapsed = time.perf_counter() - start
+    return result
+
+def batch(paths: typing.Iterable[str], jobs: int = None, backend: str = "auto") -> typing.Iterator[Result]:
+    """Analyse many captures at once, in a pool of processes.
+
+    Results are yielded as each capture finishes, so not in the order
+    given. A capture that fails, or even kills its worker process, only
+    gives a Result with error set; the rest carry on. After a worker dies,
+    the captures it may have taken down with it are retried one process
+    each, so only the one at fault is reported.
+
+    Args:
+        paths (iterable): Captures to analyse.
+        jobs (int, optional): Number of processes. Defaults to one per core.
+        backend (str, optional): See Gallimaufry.USB.USB.
+
+    Yields:
+        Result: One per capture.
+
+    Example:
+        To print any keystrokes found in a directory of captures::
+
+            >> from Gallimaufry.USB import USB
+            >> for result in USB.batch(glob.glob("captures/*.pcap"), jobs=8):
+            ..     for keyboard in result.keyboards:
+            ..         print(result.path, keyboard['keystrokes'])
+    """
+    paths = list(paths)
+    jobs = jobs or os.cpu_count() or 1
+
+    # Captures left unfinished when a worker died
+    unfinished = []
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(analyse, path, backend): path for path in paths}
+
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                yield future.result()
+            except concurrent.futures.process.BrokenProcessPool:
+                unfinished.append(futures[future])
+
+    for path in unfinished:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as pool:
+            try:
+                yield pool.submit(analyse, path, backend).result()
+            except concurrent.futures.process.BrokenProcessPool:
+                result = Result(path)
+                result.error = "Worker process died while analysing this capture."
+                yield result
+
+def find_captures(paths: typing.Iterable[str]) -> typing.List[str]:
+    """Expand any directories in paths into the captures inside them."""
+    captures = []
+
+    for path in paths:
+        if not os.path.isdir(path):
+            captures.append(path)
+            continue
+
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            captures.extend(os.path.join(root, name) for name in sorted(files) if name.endswith(CAPTURE_EXTENSIONS))
+
+    return captures
+
+def main(argv: typing.List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m Gallimaufry.Batch", description="Analyse many USB captures at once.")
+    parser.add_argument("paths", nargs="+", help="Captures, or directories to search for them.")
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="Number of processes. Defaults to one per core.")
+    parser.add_argument("--backend", default="auto")
+    parser.add_argument("--json", action="store_true", help="Print one json object per capture.")
+    args = parser.parse_args(argv)
+
+    failed = 0
+
+    for result in batch(find_captures(args.paths), jobs=args.jobs, backend=args.backend):
+        failed += not result.ok
+
+        if args.json:
+            print(json.dumps(result.to_dict()), flush=True)
+            continue
+
+        if not result.ok:
+            print("{0}: FAILED {1}".format(result.path, result.error), flush=True)
+            continue
+
+        print("{0}: {1} packets, {2} devices ({3:.2f}s)".format(result.path, result.packets, len(result.devices), result.elapsed))
+        for keyboard in result.keyboards:
+            print("    keyboard {bus_id}.{device_address} endpoint 0x{endpoint:02x}: {keystrokes!r}".format(**keyboard))
+        for mouse in result.mice:
+            print("    mouse {bus_id}.{device_address} endpoint 0x{endpoint:02x}: {reports} reports".format(**mouse))
+        sys.stdout.flush()
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+import logging
+logger = logging.getLogger("Gallimaufry.Benchmark")
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import typing
+from collections import OrderedDict
+
+from .Backends import get_backend
+from .Generator import Generator
+from .Stats import Stats
+from .USB import USB
+from .Version import version
+
+# Order stages are reported in, see Gallimaufry.Stats.Stats. Which of the
+# backend stages run depends on the backend. Handlers come after these.
+STAGES = ["tshark", "preprocess", "decode", "enumeration", "strings", "configurations"]
+
+class Benchmark:
+    """Times each stage of loading captures of increasing size.
+
+    Captures are made with Gallimaufry.Generator.Generator, then loaded with
+    Gallimaufry.USB.USB and decoded, exactly as any other capture would be.
+    The stages are those recorded in usb.stats (see Gallimaufry.Stats.Stats),
+    with each stage's totals as Stage.to_dict gives them: calls, count, wall
+    and cpu, and peak and retained memory when measuring memory.
+
+    Args:
+        sizes (list, optional): Approximate packet counts to benchmark.
+        backend (str, optional): Backend to benchmark. See Gallimaufry.USB.USB.
+        memory (bool, optional): Also record peak and retained memory per
+            stage. Uses tracemalloc, which slows everything down, so this is
+            measured in a second load of each capture.
+        stream (bool, optional): Load the captures streaming. See Gallimaufry.USB.USB.
+        directory (str, optional): Where to write the captures. Defaults to a
+            temporary directory, removed afterwards.
+        **generator (optional): Passed on to Generator, i.e.: devices=4.
+
+    Example:
+        To benchmark and compare against an earlier run::
+
+            >> from Gallimaufry.Benchmark import Benchmark
+            >> results = Benchmark(sizes=[10000, 100000]).run()
+            >> Benchmark.compare(results, Benchmark.load("baseline.json"))
+            []
+
+        Or from the command line::
+
+            $ python -m Gallimaufry.Benchmark --sizes 10000 100000 --output results.json --baseline baseline.json
+    """
+
+    def __init__(self, sizes: typing.List[int] = (1000, 10000, 100000), backend: str = "auto", memory: bool = True,
+            stream: bool = False, directory: str = None, **generator) -> None:
+        self.sizes = list(sizes)
+        self.backend = get_backend(backend)
+        self.memory = memory
+        self.stream = stream
+        self.directory = directory
+        self.generator = generator
+
+        if not self.backend.available():
+            raise Exception("{0} backend is not available. Please install tshark or use backend='native'.".format(self.backend.__name__))
+
+    def run(self) -> OrderedDict:
+        """Run the benchmark over every size.
+
+        Returns:
+            OrderedDict: The results, as saved by save().
+        """
+        results = OrderedDict([
+            ('version', version),
+            ('backend', self.backend.__name__.lower()),
+            ('stream', self.stream),
+            ('python', platform.python_version()),
+            ('results', []),
+            ])
+
+        with tempfile.TemporaryDirectory() as temporary:
+            directory = self.directory or temporary
+
+            for size in self.sizes:
+                generator = self.generator_for(size)
+                filename = os.path.join(directory, "benchmark_{0}.pcap".format(size))
+                packets = generator.write(filename)
+
+                logger.info("Benchmarking {0} packets".format(packets))
+                results['results'].append(self.run_capture(filename, packets))
+
+        return results
+
+    def generator_for(self, size: int) -> Generator:
+        """Generator: Makes a capture of about size packets."""
+        options = dict(devices=4, endpoints=3)
+        options.update(self.generator)
+
+        # Each report is a submission and a completion
+        generator = Generator(reports=0, **options)
+        options['reports'] = max(size - generator.packet_count, 0) // 2
+        return Generator(**options)
+
+    def run_capture(self, filename: str, packets: int = None) -> OrderedDict:
+        """Benchmark one capture.
+
+        Args:
+            filename (str): The capture to load.
+            packets (int, optional): Packets in the capture, for the results.
+
+        Returns:
+            OrderedDict: packets, size (bytes), time (wall seconds over every
+                stage) and stage -> its totals.
+        """
+        stats = self.load_capture(filename, Stats())
+        stages = stats.to_dict()
+
+        if self.memory:
+            memory = Stats(memory=True)
+            try:
+                self.load_capture(filename, memory)
+            finally:
+                memory.stop()
+
+            for stage in memory:
+                if stage.name in stages:
+                    stages[stage.name].update(peak=stage.peak, retained=stage.retained)
+
+        return OrderedDict([
+            ('packets', packets),
+            ('size', os.path.getsize(filename)),
+            ('time', stats.wall),
+            ('stages', stages),
+            ])
+
+    def load_capture(self, filename: str, stats: Stats) -> Stats:
+        """Load and decode the capture the way anyone using the library would, recording into stats."""
+        USB(filename, backend=self.backend.__name__.lower(), stream=self.stream, stats=stats).decode()
+        return stats
+
+    ###########
+    # Results #
+    ###########
+
+    @staticmethod
+    def save(results: dict, filename: str) -> None:
+        """Write results out as json."""
+        with open(filename, "w") as f:
+            json.dump(results, f, indent=2)
+
+    @staticmethod
+    def load(filename: str) -> OrderedDict:
+        """Read results written by save()."""
+        with open(filename, "r") as f:
+            return json.load(f, object_pairs_hook=OrderedDict)
+
+    @staticmethod
+    def compare(results: dict, baseline: dict, tolerance: float = 1.5, min_time: float = 0.01,
+            min_memory: int = 1024*1024) -> typing.List[str]:
+        """Find the stages that got slower or hungrier than the baseline.
+
+        Runs are matched up by packet count. Small absolute differences are
+        ignored, since they are mostly noise.
+
+        Args:
+            results (dict): The new results.
+            baseline (dict): Results to compare against.
+            tolerance (float, optional): How many times the baseline a stage
+                may take before it counts as a regression.
+            min_time (float, optional): Seconds a stage must slow down by to count.
+            min_memory (int, optional): Bytes a stage must grow by to count.
+
+        Returns:
+            list: A description of each regression. Empty if there were none.
+        """
+        regressions = []
+        baselines = {run['packets']: run for run in baseline['results']}
+
+        for run in results['results']:
+            base = baselines.get(run['packets'])
+
+            if base is None:
+                logger.warning("No baseline for {0} packets.".format(run['packets']))
+                continue
+
+            for stage, measured in run['stages'].items():
+                if stage not in base['stages']:
+                    continue
+
+                for metric, minimum, unit in (('wall', min_time, 's'), ('peak', min_memory, 'B')):
+                    new, old = measured.get(metric), base['stages'][stage].get(metric)
+
+                    if new is None or old is None:
+                        continue
+
+                    if new > old * tolerance and new - old > minimum:
+                        regressions.append("{0} packets: {1} {2} went from {3:.6g}{5} to {4:.6g}{5}".format(
+                            run['packets'], stage, metric, old, new, unit))
+
+        return regressions
+
+    @staticmethod
+    def table(results: dict) -> str:
+        """str: The results, one row per capture and one column per stage."""
+        stages = [stage for stage in STAGES if any(stage in run['stages'] for run in results['results'])]
+        stages += sorted(set(stage for run in results['results'] for stage in run['stages']) - set(stages))
+
+        lines = ["{0:>10} {1}".format("packets", " ".join("{0:>18}".format(stage) for stage in stages))]
+
+        for run in results['results']:
+            cells = []
+            for stage in stages:
+                measured = run['stages'].get(stage, {})
+                cell = "{0:.3f}s".format(measured['wall']) if 'wall' in measured else "-"
+                if measured.get('peak') is not None:
+                    cell += " {0:.1f}M".format(measured['peak'] / 1024 / 1024)
+                cells.append("{0:>18}".format(cell))
+
+            lines.append("{0:>10} {1}".format(run['packets'], " ".join(cells)))
+
+        return "\n".join(lines)
+
+    def __repr__(self) -> str:
+        return "<Benchmark sizes={0} backend={1}>".format(self.sizes, self.backend.__name__)
+
+
+def main(argv: typing.List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m Gallimaufry.Benchmark", description="Time each stage of loading captures of increasing size.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Approximate packet counts to benchmark.")
+    parser.add_argument("--backend", default="auto")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the (slower) peak memory runs.")
+    parser.add_argument("--stream", action="store_true", help="Load the captures streaming.")
+    parser.add_argument("--devices", type=int, default=4, help="Devices per bus in the generated captures.")
+    parser.add_argument("--endpoints", type=int, default=3, help="Endpoints per device in the generated captures.")
+    parser.add_argument("--directory", help="Keep the generated captures here.")
+    parser.add_argument("--output", help="Write the results to this json file.")
+    parser.add_argument("--baseline", help="Compare against results from this json file.")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Slowdown factor that counts as a regression.")
+    parser.add_argument("--min-time", type=float, default=0.01, help="Seconds a stage must slow down by to count as a regression.")
+    args = parser.parse_args(argv)
+
+    benchmark = Benchmark(sizes=args.sizes, backend=args.backend, memory=not args.no_memory, stream=args.stream, directory=args.directory,
+            devices=args.devices, endpoints=args.endpoints)
+    results = benchmark.run()
+
+    print(Benchmark.table(results))
+
+    if args.output:
+        Benchmark.save(results, args.output)
+
+    if args.baseline:
+        regressions = Benchmark.compare(results, Benchmark.load(args.baseline), tolerance=args.tolerance, min_time=args.min_time)
+
+        for regression in regressions:
+            print("REGRESSION: " + regression)
+
+        if regressions:
+            return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
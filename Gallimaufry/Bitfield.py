@@ -0,0 +1,136 @@
+import logging
+logger = logging.getLogger("Gallimaufry.Bitfield")
+
+import typing
+from collections import OrderedDict
+
+import numpy
+
+class Bitfield:
+    """Layout of the bit fields in a report, compiled to shift/mask extractors.
+
+    Offsets are in bits, counting from the least significant bit of the first
+    byte, with multi-byte fields read little endian (as USB is). I.e.: bit
+    offset 12 is bit 4 of byte 1.
+
+    Args:
+        fields (OrderedDict): field name -> (bit offset, bit width)
+        tables (bool, optional): Use lookup tables, rather than shifting and
+            masking, to decode fields that sit within a single byte.
+
+    Example:
+        To declare a byte holding a 4 bit dpad and four buttons::
+
+            >> buttons = Bitfield(OrderedDict([
+                ('dpad',   (0, 4)),
+                ('square', (4, 1)),
+                ('x',      (5, 1)),
+                ('circle', (6, 1)),
+                ('triangle', (7, 1)),
+                ]))
+            >> buttons.extract(0x28)
+            OrderedDict([('dpad', 8), ('square', False), ('x', True), ('circle', False), ('triangle', False)])
+            >> buttons.decode(reports)['x']
+            array([ True, False, ...])
+    """
+
+    def __init__(self, fields: "OrderedDict[str, typing.Tuple[int, int]]", tables: bool = False) -> None:
+        self.fields = OrderedDict(fields)
+        self.tables = tables
+
+        for name, (offset, width) in self.fields.items():
+            if offset % 8 + width > 64:
+                raise Exception("Bit field {0} spans more than 64 bits.".format(name))
+
+        # name -> (shift, mask), for single ints
+        self.extractors = OrderedDict((name, (offset, (1 << width) - 1)) for name, (offset, width) in self.fields.items())
+
+        self.dtype = numpy.dtype([(name, self._field_dtype(width)) for name, (_, width) in self.fields.items()])
+
+        # name -> 256 entry table of the field's value for every value of its byte
+        self.lookup = {}
+        if tables:
+            for name, (offset, width) in self.fields.items():
+                if offset // 8 == (offset + width - 1) // 8:
+                    shift, mask = offset % 8, (1 << width) - 1
+                    self.lookup[name] = ((numpy.arange(256) >> shift) & mask).astype(self.dtype[name])
+
+    @staticmethod
+    def _field_dtype(width: int) -> numpy.dtype:
+        if width == 1:
+            return numpy.dtype(numpy.bool_)
+
+        for dtype in (numpy.uint8, numpy.uint16, numpy.uint32):
+            if width <= numpy.dtype(dtype).itemsize * 8:
+                return numpy.dtype(dtype)
+
+        return numpy.dtype(numpy.uint64)
+
+    def get(self, value: typing.Union[int, bytes], name: str) -> typing.Union[int, bool]:
+        """Extract one field from a single report.
+
+        Args:
+            value (int, bytes): The report, as an int or its raw bytes.
+            name (str): The field to extract.
+        """
+        if not isinstance(value, int):
+            value = int.from_bytes(value, 'little')
+
+        shift, mask = self.extractors[name]
+        value = (value >> shift) & mask
+
+        return bool(value) if mask == 1 else value
+
+    def extract(self, value: typing.Union[int, bytes]) -> OrderedDict:
+        """Extract every field from a single report.
+
+        Args:
+            value (int, bytes): The report, as an int or its raw bytes.
+
+        Returns:
+            OrderedDict: field name -> value. Single bit fields are bools.
+        """
+        if not isinstance(value, int):
+            value = int.from_bytes(value, 'little')
+
+        return OrderedDict((name, bool((value >> shift) & mask) if mask == 1 else (value >> shift) & mask)
+                for name, (shift, mask) in self.extractors.items())
+
+    def decode(self, reports: typing.Union[numpy.ndarray, bytes]) -> numpy.ndarray:
+        """Extract every field from many reports at once.
+
+        Args:
+            reports (numpy.ndarray, bytes): N x report length array of uint8,
+                or the raw bytes of a single report.
+
+        Returns:
+            numpy.ndarray: Structured array with one named field per bit field.
+        """
+        if not isinstance(reports, numpy.ndarray):
+            reports = numpy.frombuffer(reports, dtype=numpy.uint8).reshape(1, -1)
+
+        decoded = numpy.zeros(len(reports), dtype=self.dtype)
+
+        for name, (offset, width) in self.fields.items():
+            first, last = offset // 8, (offset + width - 1) // 8
+
+            if name in self.lookup:
+                decoded[name] = self.lookup[name][reports[:, first]]
+                continue
+
+            # Gather the bytes the field spans, little endian
+            column = reports[:, first].astype(numpy.uint64)
+            for i in range(first + 1, last + 1):
+                column |= reports[:, i].astype(numpy.uint64) << numpy.uint64(8 * (i - first))
+
+            decoded[name] = (column >> numpy.uint64(offset % 8)) & numpy.uint64((1 << width) - 1)
+
+        return decoded
+
+    @property
+    def size(self) -> int:
+        """int: Number of bytes a report needs to hold every field."""
+        return max(((offset + width + 7) // 8 for offset, width in self.fields.values()), default=0)
+
+    def __repr__(self) -> str:
+        return "<Bitfield fields={0}>".format(len(self.fields))
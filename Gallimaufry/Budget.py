@@ -0,0 +1,155 @@
+import logging
+logger = logging.getLogger("Gallimaufry.Budget")
+
+import os
+import sys
+import typing
+
+# Rough bytes a decoded Packet takes on top of its payload, with its place in
+# the PacketList index. Measured on the native backend at about 250-330.
+PACKET_MEMORY = 256
+
+# Loading without streaming, or in several processes, holds the backend's
+# output (or the pickled chunks) alongside the packets built from it.
+BUFFERED = 2
+
+class Budget:
+    """Keeps loading a capture within a memory budget, or stops it early.
+
+    Memory is measured with tracemalloc if it is tracing (i.e.: with
+    Stats(memory=True)), and as the resident size of the process otherwise.
+    Either way only what is used on top of what was already in use when the
+    Budget was made counts against it.
+
+    Checks are made:
+
+    * Up front, see plan. A capture that won't fit as asked is streamed in
+      one process instead, and one that plainly won't fit even so is
+      refused before any of it is parsed.
+    * As each stage finishes. The Budget is a Gallimaufry.Stats.Stats hook.
+    * Every so many packets while they are read, see watch.
+
+    Args:
+        max_memory (int): Bytes loading may use.
+        what (str, optional): What is being loaded, for the error message.
+
+    Example:
+        USB sets one up when given max_memory::
+
+            >> from Gallimaufry.USB import USB
+            >> pcap = USB("pcap.pcap", max_memory=512*1024*1024)
+    """
+
+    def __init__(self, max_memory: int, what: str = "capture") -> None:
+        self.max_memory = max_memory
+        self.what = what
+        self.baseline = self.memory() or 0
+
+    @staticmethod
+    def memory() -> typing.Optional[int]:
+        """int: Bytes in use now, or None if there's no way to tell on this platform."""
+        tracemalloc = sys.modules.get("tracemalloc")
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            return tracemalloc.get_traced_memory()[0]
+
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return None
+
+    @property
+    def used(self) -> typing.Optional[int]:
+        """int: Bytes used since the Budget was made, or None if unknown."""
+        memory = self.memory()
+        return memory - self.baseline if memory is not None else None
+
+    def check(self, stage: str) -> None:
+        """Raise if over budget.
+
+        Args:
+            stage (str): What was running, for the error message.
+        """
+        used = self.used
+
+        if used is not None and used > self.max_memory:
+            raise Exception("Loading {0} went over max_memory during {1}: {2} bytes used, {3} allowed.".format(
+                self.what, stage, used, self.max_memory))
+
+    def __call__(self, stage: str, wall: float, cpu: float, count: int) -> None:
+        self.check(stage)
+
+    def estimate(self, pcap_filename: str) -> typing.Optional[int]:
+        """Estimate the memory loading a capture will take, raising if it won't fit.
+
+        Only the record headers are read to count the frames.
+
+        Returns:
+            int: Estimated bytes, or None if the capture isn't a format the
+                native backend can count (the checks as it loads still apply).
+        """
+        from .Backends.Native import count_frames
+
+        try:
+            frames = count_frames(pcap_filename)
+        except Exception as e:
+            logger.debug("Couldn't count the frames of {0}: {1}".format(pcap_filename, e))
+            return None
+
+        estimate = frames * PACKET_MEMORY + os.path.getsize(pcap_filename)
+
+        if estimate > self.max_memory:
+            raise Exception("Loading {0} would need about {1} bytes for its {2} packets, but max_memory is {3}.".format(
+                self.what, estimate, frames, self.max_memory))
+
+        return estimate
+
+    def plan(self, pcap_filename: str, stream: bool, jobs: int) -> typing.Tuple[bool, int]:
+        """Work out how to load a capture within the budget.
+
+        Loading is left as asked if it looks like it fits. Otherwise it
+        falls back to streaming the capture in this process, which holds
+        about half as much at once, and raises if even that won't fit (see
+        estimate).
+
+        Args:
+            pcap_filename (str): The capture.
+            stream (bool): Was streaming asked for?
+            jobs (int): How many processes were asked for?
+
+        Returns:
+            tuple: (stream, jobs) to load with.
+        """
+        estimate = self.estimate(pcap_filename)
+
+        if stream and jobs == 1:
+            return stream, jobs
+
+        if estimate is not None and estimate * BUFFERED <= self.max_memory:
+            return stream, jobs
+
+        logger.info("Streaming {0} in one process to keep within max_memory, loading it as asked would need about {1}.".format(
+            self.what, "{0} bytes".format(estimate * BUFFERED) if estimate is not None else "an unknown amount"))
+        return True, 1
+
+    def fits(self, size: int) -> bool:
+        """bool: Is there room for size more bytes?"""
+        used = self.used
+        return used is None or used + size <= self.max_memory
+
+    def watch(self, iterable: typing.Iterable, stage: str, every: int = 4096) -> typing.Iterator:
+        """Pass iterable through, checking the budget every so many items.
+
+        Args:
+            iterable (iterable): i.e.: the packets as they are read.
+            stage (str): What is running, for the error message.
+            every (int, optional): Items between checks.
+        """
+        for i, item in enumerate(iterable, 1):
+            yield item
+
+            if not i % every:
+                self.check(stage)
+
+    def __repr__(self) -> str:
+        return "<Budget max_memory={0} used={1}>".format(self.max_memory, self.used)
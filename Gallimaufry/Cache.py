@@ -0,0 +1,193 @@
+import logging
+logger = logging.getLogger("Gallimaufry.Cache")
+
+import glob
+import hashlib
+import os
+import pickle
+import tempfile
+
+from . import settings
+from .Version import version
+
+class Cache:
+    """On-disk cache of parsed packet captures.
+
+    Entries are keyed by the content hash of the capture, the backend (and
+    its version, i.e. the tshark version) and the Gallimaufry version, so
+    any of those changing is a cache miss rather than a stale result.
+
+    Args:
+        directory (str, optional): Where to keep cache entries. Defaults to
+            $GALLIMAUFRY_CACHE_DIR, or ~/.cache/gallimaufry.
+        max_size (int, optional): Maximum total size of the cache in bytes.
+            Least recently used entries are evicted past this.
+
+    Example:
+        To keep cache entries next to the captures themselves::
+
+            >> from Gallimaufry.USB import USB
+            >> from Gallimaufry.Cache import Cache
+            >> pcap = USB("pcaps/pcap.pcap", cache=Cache("pcaps"))
+
+    Note:
+        Entries are pickles. Only point this at a directory you trust.
+    """
+
+    def __init__(self, directory: str = None, max_size: int = 2 * 1024**3) -> None:
+        self.directory = directory
+        self.max_size = max_size
+
+        # Absolute path -> (size, mtime, sha256), so a miss doesn't hash the capture for both load and store
+        self.__hashes = {}
+
+    @staticmethod
+    def default_directory() -> str:
+        """str: $GALLIMAUFRY_CACHE_DIR, or ~/.cache/gallimaufry."""
+        return os.environ.get("GALLIMAUFRY_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "gallimaufry"))
+
+    @staticmethod
+    def hash_file(pcap_filename: str) -> str:
+        """str: sha256 of the capture file's contents."""
+        h = hashlib.sha256()
+        with open(pcap_filename, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def key(self, pcap_filename: str) -> str:
+        """str: sha256 of the capture file's contents, only rehashed if its size or mtime changed."""
+        path = os.path.abspath(pcap_filename)
+        stat = os.stat(path)
+        cached = self.__hashes.get(path)
+
+        if cached is None or cached[:2] != (stat.st_size, stat.st_mtime_ns):
+            cached = self.__hashes[path] = (stat.st_size, stat.st_mtime_ns, self.hash_file(path))
+
+        return cached[2]
+
+    def _path(self, pcap_filename: str, backend) -> str:
+        environment = "{0}-{1}-{2}".format(backend.__name__, backend.version(), version)
+        name = "{0}-{1}.pickle".format(self.key(pcap_filename), hashlib.sha256(environment.encode()).hexdigest()[:16])
+        return os.path.join(self.directory, name)
+
+    def load(self, pcap_filename: str, backend):
+        """Look up a parsed capture.
+
+        Args:
+            pcap_filename (str): Path to the capture.
+            backend (type): The backend class the packets would be parsed with.
+
+        Returns:
+            list: The cached packets, or None on a miss.
+        """
+        path = self._path(pcap_filename, backend)
+
+        try:
+            with open(path, "rb") as f:
+                designator, packets = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("Ignoring unreadable cache entry {0}: {1}".format(path, e))
+            return None
+
+        # Mark as recently used for eviction
+        os.utime(path)
+
+        settings.usb_endpoint_designator = designator
+        return packets
+
+    def store(self, pcap_filename: str, backend, packets: list) -> None:
+        """Save a parsed capture, then evict old entries if over max_size."""
+        path = self._path(pcap_filename, backend)
+
+        # Write to a temp file first so a crash never leaves a partial entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((settings.usb_endpoint_designator, packets), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the cache fits in max_size."""
+        entries = []
+        for path in self.entries:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def invalidate(self, pcap_filename: str = None) -> None:
+        """Drop cached entries.
+
+        Args:
+            pcap_filename (str, optional): Only drop entries for this capture.
+                By default the entire cache is cleared.
+        """
+        if pcap_filename is None:
+            paths = self.entries
+        else:
+            paths = glob.glob(os.path.join(glob.escape(self.directory), self.key(pcap_filename) + "-*.pickle"))
+
+        for path in paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def __repr__(self) -> str:
+        return "<Cache directory={0} entries={1}>".format(self.directory, len(self.entries))
+
+    ##############
+    # Properties #
+    ##############
+
+    @property
+    def entries(self) -> list:
+        """list: Paths of all entries in this cache."""
+        return glob.glob(os.path.join(glob.escape(self.directory), "*.pickle"))
+
+    @property
+    def size(self) -> int:
+        """int: Total size in bytes of this cache."""
+        return sum(os.path.getsize(path) for path in self.entries)
+
+    @property
+    def directory(self) -> str:
+        """str: Directory holding the cache entries."""
+        return self.__directory
+
+    @directory.setter
+    def directory(self, directory: str) -> None:
+        if directory is None:
+            directory = self.default_directory()
+
+        self.__directory = os.path.abspath(directory)
+        os.makedirs(self.__directory, exist_ok=True)
+
+    @property
+    def max_size(self) -> int:
+        """int: Maximum total size of this cache in bytes."""
+        return self.__max_size
+
+    @max_size.setter
+    def max_size(self, max_size: int) -> None:
+        self.__max_size = max_size
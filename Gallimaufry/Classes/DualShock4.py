@@ -1,8 +1,9 @@
 import logging
 logger = logging.getLogger("USB.Classes.DualShock4")
 
-from ..helpers import Bits
-import matplotlib.pyplot as plt
+import numpy
+from collections import OrderedDict
+from ..Bitfield import Bitfield
 
 # Based on: https://www.psdevwiki.com/ps4/DS4-USB
 
@@ -12,85 +13,65 @@ class DualShock4:
         """DualShock PS4 controller parsing.
 
         pcap == packet capture from tshark with ONLY those packets for a specific endpoint.
+
+        All reports are decoded at once into the structured array reports,
+        with one named field per axis, button, etc. actions wraps that in
+        DualShock4Action objects, which are only created as they are accessed.
         """
         self.pcap = pcap
-        self.actions = []
         self._parse_pcap()
 
     def _parse_pcap(self):
 
-        for packet in self.pcap:
-            # Not interrupt packet
-            if 'usb.capdata' not in packet['_source']['layers']:
-                continue
-
-            cap_data = packet['_source']['layers']['usb.capdata'].split(":")
-
-            if len(cap_data) != 64:
-                logging.warn('Expecting capdata length of 64, got {} instead'.format(len(cap_data)))
-
-            action = DualShock4Action()
-            action.report_id = int(cap_data[0],16)
-            action.l_x_axis = int(cap_data[1],16) # 0 == left
-            action.l_y_axis = int(cap_data[2],16) # 0 == up
-            action.r_x_axis = int(cap_data[3],16) # 0 == left
-            action.r_y_axis = int(cap_data[4],16) # 0 == up
-
-            buttons = Bits(int(cap_data[5],16), 8) # Bits of size 8
-            action.button_triangle = buttons[7]
-            action.button_circle = buttons[6]
-            action.button_x = buttons[5]
-            action.button_square = buttons[4]
-            action.dpad = buttons[0:3]
+        # Not interrupt packet
+        data = [packet.data for packet in self.pcap if packet.data is not None]
 
-            buttons = Bits(int(cap_data[6],16), 8) # Bits of size 8
-            action.button_r3 = buttons[7]
-            action.button_l3 = buttons[6]
-            action.button_options = buttons[5]
-            action.button_share = buttons[4]
-            action.button_r2 = buttons[3]
-            action.button_l2 = buttons[2]
-            action.button_r1 = buttons[1]
-            action.button_l1 = buttons[0]
+        bad_lengths = sum(1 for d in data if len(d) != REPORT_LENGTH)
+        if bad_lengths:
+            logger.warning('Expecting capdata length of {0}, got a different length for {1} reports'.format(REPORT_LENGTH, bad_lengths))
+            data = [d[:REPORT_LENGTH].ljust(REPORT_LENGTH, b"\x00") for d in data]
 
-            counter = Bits(int(cap_data[7],16), 8) # Bits of size 8
-            action.counter = counter[2:7]
-            action.button_tpad_click = counter[1]
-            action.button_ps = counter[0]
+        raw = numpy.frombuffer(b"".join(data), dtype=numpy.uint8).reshape(-1, REPORT_LENGTH)
+        self.reports = DualShock4.decode_reports(raw)
 
-            action.l2_pressure = int(cap_data[8], 16) # 0 released, 0xff full pressure
-            action.r2_pressure = int(cap_data[9], 16)
+    @staticmethod
+    def decode_reports(raw: numpy.ndarray) -> numpy.ndarray:
+        """Decode DualShock4 reports.
 
-            action.battery = int(cap_data[12], 16)
+        Args:
+            raw (numpy.ndarray): N x 64 array of uint8 reports.
 
-            self.actions.append(action)
+        Returns:
+            numpy.ndarray: Structured array of report_layout.dtype, one entry per report.
+        """
+        return report_layout.decode(raw)
 
     def __repr__(self) -> str:
-        return "<DualShock4 actions={0}>".format(len(self.actions))
+        return "<DualShock4 actions={0}>".format(len(self.reports))
 
     def save_movement_plot(self, fname):
-        """Attempt to render left and right stick movement on a plot."""
+        """Attempt to render left and right stick movement on a plot.
 
-        x = [0]
-        y = [0]
+        Requires matplotlib (pip install gallimaufry[plot]).
+        """
+        import matplotlib.pyplot as plt
 
-        for action in self.actions:
-            x.append( x[-1] + action.r_x_normalized )
-            y.append( y[-1] + action.r_y_normalized )
+        x = numpy.concatenate(([0], numpy.cumsum((self.reports['r_x_axis'] - 128.) / 127)))
+        y = numpy.concatenate(([0], numpy.cumsum((128. - self.reports['r_y_axis']) / 127)))
 
         plt.plot(x, y, '-')
 
-        x = [0]
-        y = [0]
-
-        for action in self.actions:
-            x.append( x[-1] + action.l_x_normalized )
-            y.append( y[-1] + action.l_y_normalized )
+        x = numpy.concatenate(([0], numpy.cumsum((self.reports['l_x_axis'] - 128.) / 127)))
+        y = numpy.concatenate(([0], numpy.cumsum((128. - self.reports['l_y_axis']) / 127)))
 
         plt.plot(x, y, '.')
 
         plt.savefig(fname)
-        
+
+    @property
+    def actions(self) -> "DualShock4Actions":
+        """DualShock4Actions: Sequence of DualShock4Action, one per report."""
+        return DualShock4Actions(self.reports)
 
     @property
     def pcap(self):
@@ -100,6 +81,28 @@ class DualShock4:
     def pcap(self, pcap) -> None:
         self.__pcap = pcap
 
+class DualShock4Actions:
+    """Read-only sequence of DualShock4Action, built from the decoded reports as they are accessed."""
+
+    def __init__(self, reports: numpy.ndarray):
+        self.reports = reports
+
+    def __len__(self) -> int:
+        return len(self.reports)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return DualShock4Actions(self.reports[item])
+
+        return DualShock4Action.from_report(self.reports[item])
+
+    def __iter__(self):
+        for report in self.reports:
+            yield DualShock4Action.from_report(report)
+
+    def __repr__(self) -> str:
+        return "<DualShock4Actions actions={0}>".format(len(self))
+
 class DualShock4Action(object):
     __slots__ = 'report_id', 'l_x_axis', 'l_y_axis', 'r_x_axis', \
                 'r_y_axis', 'button_triangle', 'button_circle', \
@@ -109,6 +112,14 @@ class DualShock4Action(object):
                 'counter', 'button_tpad_click', 'button_ps', \
                 'l2_pressure', 'r2_pressure', 'battery'
 
+    @classmethod
+    def from_report(cls, report: numpy.void) -> "DualShock4Action":
+        """Build an action from one entry of DualShock4.reports."""
+        action = cls()
+        for name, value in zip(report_layout.dtype.names, report.item()):
+            setattr(action, name, value)
+        return action
+
     def __repr__(self):
         info = ['DS4Action']
 
@@ -164,3 +175,33 @@ class DualShock4Action(object):
     def r_y_normalized(self):
         """Normalize the y direction for the right stick. Negative is moving down, positive is moving up."""
         return (128 - self.r_y_axis) / 127
+
+REPORT_LENGTH = 64
+
+# Same order as DualShock4Action.__slots__
+report_layout = Bitfield(OrderedDict([
+    ('report_id',         (0, 8)),
+    ('l_x_axis',          (8, 8)),  # 0 == left
+    ('l_y_axis',          (16, 8)), # 0 == up
+    ('r_x_axis',          (24, 8)), # 0 == left
+    ('r_y_axis',          (32, 8)), # 0 == up
+    ('button_triangle',   (47, 1)),
+    ('button_circle',     (46, 1)),
+    ('button_x',          (45, 1)),
+    ('button_square',     (44, 1)),
+    ('dpad',              (40, 4)),
+    ('button_r3',         (55, 1)),
+    ('button_l3',         (54, 1)),
+    ('button_options',    (53, 1)),
+    ('button_share',      (52, 1)),
+    ('button_r2',         (51, 1)),
+    ('button_l2',         (50, 1)),
+    ('button_r1',         (49, 1)),
+    ('button_l1',         (48, 1)),
+    ('counter',           (58, 6)),
+    ('button_tpad_click', (57, 1)),
+    ('button_ps',         (56, 1)),
+    ('l2_pressure',       (64, 8)), # 0 released, 0xff full pressure
+    ('r2_pressure',       (72, 8)),
+    ('battery',           (96, 8)),
+    ]), tables=True)
@@ -0,0 +1,210 @@
+import logging
+logger = logging.getLogger("USB.Classes.HID.Editor")
+
+import typing
+
+
+class GapBuffer:
+    """Sequence with a movable gap, so edits near the last edit are cheap.
+
+    Items before the gap are kept in order in before, items after it are
+    kept in reverse order in after. Inserting or deleting at the gap is
+    O(1); moving the gap costs the distance moved.
+
+    Args:
+        items (iterable, optional): Initial contents.
+    """
+
+    __slots__ = 'before', 'after'
+
+    def __init__(self, items: typing.Iterable = ()) -> None:
+        self.before = list(items)
+        self.after = []
+
+    def move(self, position: int) -> None:
+        """Move the gap to just before the given position."""
+        before, after = self.before, self.after
+
+        if position < len(before):
+            moved = before[position:]
+            del before[position:]
+            after.extend(reversed(moved))
+
+        elif position > len(before):
+            count = position - len(before)
+            moved = after[len(after) - count:]
+            del after[len(after) - count:]
+            before.extend(reversed(moved))
+
+    def insert(self, position: int, item) -> None:
+        self.move(position)
+        self.before.append(item)
+
+    def pop(self, position: int):
+        """Remove and return the item at position."""
+        self.move(position + 1)
+        return self.before.pop()
+
+    def split(self, position: int) -> "GapBuffer":
+        """Cut off everything from position onwards, returning it as a new GapBuffer."""
+        self.move(position)
+        tail = GapBuffer(reversed(self.after))
+        self.after = []
+        return tail
+
+    def extend(self, items: typing.Iterable) -> None:
+        """Append items at the end."""
+        self.move(len(self))
+        self.before.extend(items)
+
+    def __len__(self) -> int:
+        return len(self.before) + len(self.after)
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += len(self)
+
+        if index < len(self.before):
+            return self.before[index]
+
+        return self.after[len(self) - 1 - index]
+
+    def __iter__(self):
+        yield from self.before
+        yield from reversed(self.after)
+
+    def __repr__(self) -> str:
+        return "<GapBuffer items={0}>".format(len(self))
+
+
+class Editor:
+    """Replays keystrokes as if typed into a simple text editor (think notepad).
+
+    Each line is a GapBuffer of keys and the lines themselves are held in a
+    GapBuffer, so typing, backspace/delete, arrows, home/end and enter
+    are all amortised O(1) while the cursor stays local. Moving up and down
+    remembers the column the cursor started on, like most editors do.
+
+    Keys without a meaning to the editor (i.e.: "[F1]") are inserted as text.
+    """
+
+    def __init__(self) -> None:
+        self.lines = GapBuffer([GapBuffer()])
+        self.row = 0
+        self.col = 0
+
+        # Column to return to when moving up/down through shorter lines
+        self.goal = None
+
+        self.actions = {
+            "\r": self._ignore,
+            "\n": self._enter,
+            "[Up Arrow]": self._up,
+            "[Down Arrow]": self._down,
+            "[Left Arrow]": self._left,
+            "[Right Arrow]": self._right,
+            "[Home]": self._home,
+            "[End]": self._end,
+            "[DELETE]": self._backspace,
+            "[Backspace]": self._backspace,
+            "[Delete Fwd]": self._delete,
+            }
+
+    def feed(self, key: str) -> None:
+        """Apply a single keystroke."""
+        action = self.actions.get(key)
+
+        if action is None:
+            self.goal = None
+            self.lines[self.row].insert(self.col, key)
+            self.col += 1
+            return
+
+        action()
+
+    def replay(self, keys: typing.Iterable[str]) -> "Editor":
+        """Apply each keystroke in turn. Returns self."""
+        feed, actions, lines = self.feed, self.actions, self.lines
+
+        for key in keys:
+            # Plain typing is by far the most common, so skip the call
+            if key not in actions:
+                self.goal = None
+                lines[self.row].insert(self.col, key)
+                self.col += 1
+            else:
+                feed(key)
+
+        return self
+
+    def _ignore(self) -> None:
+        pass
+
+    def _enter(self) -> None:
+        self.goal = None
+        tail = self.lines[self.row].split(self.col)
+        self.row += 1
+        self.col = 0
+        self.lines.insert(self.row, tail)
+
+    def _vertical(self, row: int) -> None:
+        if self.goal is None:
+            self.goal = self.col
+
+        self.row = row
+        self.col = min(self.goal, len(self.lines[row]))
+
+    def _up(self) -> None:
+        self._vertical(max(self.row - 1, 0))
+
+    def _down(self) -> None:
+        self._vertical(min(self.row + 1, len(self.lines) - 1))
+
+    def _left(self) -> None:
+        self.goal = None
+        self.col = max(self.col - 1, 0)
+
+    def _right(self) -> None:
+        self.goal = None
+        self.col = min(self.col + 1, len(self.lines[self.row]))
+
+    def _home(self) -> None:
+        self.goal = None
+        self.col = 0
+
+    def _end(self) -> None:
+        self.goal = None
+        self.col = len(self.lines[self.row])
+
+    def _backspace(self) -> None:
+        self.goal = None
+
+        if self.col > 0:
+            self.col -= 1
+            self.lines[self.row].pop(self.col)
+
+        # Join with the previous line
+        elif self.row > 0:
+            line = self.lines.pop(self.row)
+            self.row -= 1
+            self.col = len(self.lines[self.row])
+            self.lines[self.row].extend(line)
+
+    def _delete(self) -> None:
+        self.goal = None
+        line = self.lines[self.row]
+
+        if self.col < len(line):
+            line.pop(self.col)
+
+        # Join the next line onto this one
+        elif self.row + 1 < len(self.lines):
+            line.extend(self.lines.pop(self.row + 1))
+
+    @property
+    def text(self) -> str:
+        """str: The current contents of the editor."""
+        return "\n".join("".join(line) for line in self.lines)
+
+    def __repr__(self) -> str:
+        return "<Editor lines={0} row={1} col={2}>".format(len(self.lines), self.row, self.col)
@@ -1,6 +1,10 @@
 import logging
 logger = logging.getLogger("USB.Classes.HID.Keyboard")
 
+import functools
+import numpy
+from .Editor import Editor
+
 
 class Keyboard:
 
@@ -16,42 +20,48 @@ class Keyboard:
 
     def _parse_pcap(self):
         # TODO: Handle parsing non-interrupt based?
+        self.keystrokes_list = Keyboard.decode_reports(Keyboard._reports(self.pcap))
 
-        for packet in self.pcap:
-            # Not interrupt packet
-            if 'usb.capdata' not in packet['_source']['layers']:
-                continue
+    def update(self, packets) -> None:
+        """Add the keystrokes from packets appended to the capture since.
 
-            cap_data = packet['_source']['layers']['usb.capdata']
-            modifier, _, key1, key2, key3, key4, key5, key6 = [int(field,16) for field in cap_data.split(":")]
-            
-            modifier = Keyboard._parse_modifier(modifier)
+        Args:
+            packets (list): The new packets for this endpoint.
+        """
+        self.keystrokes_list.extend(Keyboard.decode_reports(Keyboard._reports(packets)))
 
-            stroke = ""
+    @staticmethod
+    def _reports(packets) -> numpy.ndarray:
+        # Boot protocol reports are always 8 bytes. Skip anything else (i.e.: non-interrupt packets).
+        data = b"".join(packet.data for packet in packets if packet.data is not None and len(packet.data) == 8)
+        return numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, 8)
 
-            # Usually only one key is pressed at a time... but more than one is allowed
-            for key in (key1, key2, key3, key4, key5, key6):
-                # 0 means no key pressed
-                if key != 0:
-    
-                    # Shift
-                    if modifier['LEFT_SHIFT'] or modifier['RIGHT_SHIFT']:
-                        key = key_codes[key][1]
-                    else:
-                        key = key_codes[key][0]
+    @staticmethod
+    def decode_reports(reports: numpy.ndarray) -> list:
+        """Decode boot keyboard reports to keystrokes.
 
-                    # Other mods
-                    for k, v in modifier.items():
-                        if k not in ["LEFT_SHIFT", "RIGHT_SHIFT"] and v == True:
-                            key = "[{0}]".format(k) + key
+        Args:
+            reports (numpy.ndarray): N x 8 array of uint8 reports.
 
-                    stroke += key
+        Returns:
+            list: The keystroke string for each report that pressed something.
+        """
+        if len(reports) == 0:
+            return []
 
-            # If this was not a clear command
-            if stroke != "":
-                self.keystrokes_list.append(stroke)
+        # Only look at reports, and key slots, that have something pressed
+        pressed = reports[:, 2:] != 0
+        reports = reports[pressed.any(axis=1)]
+        slots = [i for i in range(6) if pressed[:, i].any()]
 
+        # Usually only one key is pressed at a time... but more than one is allowed
+        table = stroke_table()
+        strokes = table[reports[:, 0], reports[:, 2 + slots[0]]] if slots else numpy.array([], dtype=object)
+        for i in slots[1:]:
+            strokes = strokes + table[reports[:, 0], reports[:, 2 + i]]
 
+        # Drop the clear commands
+        return strokes[strokes != ""].tolist()
 
     @staticmethod
     def _parse_modifier(modifier):
@@ -77,62 +87,11 @@ class Keyboard:
 
     @property
     def keystrokes_interpret(self) -> str:
-        """Attempt to interpret keystrokes as typing in a document. This means interpret up/down/right/left arrows and stuff."""
-        page = [[]]
-        row = 0
-        col = 0
-
-        for key in self.keystrokes_list:
-
-            # Ignoring this for now
-            if key == "\r":
-                continue
-
-            if key == "[Up Arrow]":
-                row = row - 1
-
-                # Normalize
-                if row < 0:
-                    row = 0
-                continue
-
-            elif key == "[Down Arrow]":
-                row = row + 1
-
-                if row >= len(page):
-                    row = len(page) - 1
-
-                continue 
-
-            elif key == "[Right Arrow]":
-                col = col + 1
-
-                if col >= len(page[row]):
-                    col = len(page[row]) - 1
+        """Attempt to interpret keystrokes as typing in a document. This means interpret up/down/right/left arrows, backspace/delete, home/end and stuff.
 
-                continue
-
-            elif key == "[Left Arrow]":
-                col = col - 1
-            
-                if col < 0:
-                    col = 0
-
-                continue
-
-            # Enter
-            if key == "\n":
-                row += 1
-                col = 0
-                page.insert(row, [])
-                continue
-
-            # Chars will take up one position
-            col += 1
-
-            page[row].insert(col, key)
-
-        return "\n".join("".join(row) for row in page)
+        See Gallimaufry.Classes.HID.Editor.Editor.
+        """
+        return Editor().replay(self.keystrokes_list).text
 
     @property
     def keystrokes(self) -> str:
@@ -379,3 +338,31 @@ key_codes = {
         0xe7: ['[Right-GUI]','[Right-GUI]'],
 }
 
+
+MOD_SHIFT = 0b00100010 # LEFT_SHIFT | RIGHT_SHIFT
+
+def _modifier_prefix(modifier: int) -> str:
+    # Each non-shift modifier is prepended in turn, so the last one ends up first
+    prefix = ""
+    for k, v in Keyboard._parse_modifier(modifier).items():
+        if k not in ["LEFT_SHIFT", "RIGHT_SHIFT"] and v == True:
+            prefix = "[{0}]".format(k) + prefix
+    return prefix
+
+@functools.lru_cache(maxsize=1)
+def stroke_table() -> numpy.ndarray:
+    """numpy.ndarray: Lookup of [modifier, key code] -> keystroke, for decode_reports.
+
+    Key code 0 (nothing pressed) and unknown key codes decode to "".
+    """
+    keys = numpy.full((2, 256), "", dtype=object)
+    for code, (normal, shifted) in key_codes.items():
+        keys[0, code] = normal
+        keys[1, code] = shifted
+
+    modifiers = numpy.arange(256)
+    prefixes = numpy.array([_modifier_prefix(modifier) for modifier in modifiers], dtype=object)
+
+    table = prefixes[:, None] + keys[((modifiers & MOD_SHIFT) != 0).astype(numpy.intp)]
+    table[:, 0] = ""
+    return table
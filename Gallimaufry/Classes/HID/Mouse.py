@@ -1,6 +1,8 @@
 import logging
 logger = logging.getLogger("USB.Classes.HID.Mouse")
 
+import numpy
+
 
 class Mouse:
 
@@ -8,55 +10,148 @@ class Mouse:
         """Basic Mouse parsing class.
 
         pcap == packet capture from tshark with ONLY those packets for a specific endpoint.
+
+        The reports are decoded into columns: button, dx, dy and wheel, one
+        entry per report. x and y are the cumulative position of the pointer
+        after each report, starting from 0,0.
         """
         self.pcap = pcap
-        self.actions_list = []
 
         self._parse_pcap()
 
     def _parse_pcap(self):
+        self.reports = Mouse._reports(self.pcap)
 
-        for packet in self.pcap:
-            # Not interrupt packet
-            if 'usb.capdata' not in packet['_source']['layers']:
-                continue
-
-            cap_data = packet['_source']['layers']['usb.capdata']
-            button, x, y, wheel = [int(field,16) for field in cap_data.split(":")]
-            
-            if x > 127:
-                x = x - 256
-            if y > 127:
-                y = y - 256
-            if wheel > 127:
-                wheel = wheel - 256
-
-            action = {
-                'x': x,
-                'y': y,
-                'wheel': wheel,
-                'button': button
-                }
-
-            self.actions_list.append(action)
+    def update(self, packets) -> None:
+        """Add the reports from packets appended to the capture since.
+
+        Only the new reports are decoded, and x and y carry on from where
+        the pointer was. Reports and positions are kept in buffers with room
+        to grow, so this takes time in proportion to the new reports rather
+        than to all of them.
+
+        Args:
+            packets (list): The new packets for this endpoint.
+        """
+        reports = Mouse._reports(packets)
+        count, new = self.__count, len(reports)
+
+        if not new:
+            return
+
+        x, y = (self.__x[count - 1], self.__y[count - 1]) if count else (0, 0)
+        _, dx, dy, _ = self.decode_reports(reports)
+
+        if count + new > len(self.__buffer):
+            size = max(count + new, 2 * len(self.__buffer))
+            self.__buffer = Mouse._grow(self.__buffer, count, size)
+            self.__x = Mouse._grow(self.__x, count, size)
+            self.__y = Mouse._grow(self.__y, count, size)
+
+        self.__buffer[count:count + new] = reports
+        numpy.cumsum(dx, dtype=numpy.int64, out=self.__x[count:count + new])
+        numpy.cumsum(dy, dtype=numpy.int64, out=self.__y[count:count + new])
+        self.__x[count:count + new] += x
+        self.__y[count:count + new] += y
+        self.__count = count + new
+
+    @staticmethod
+    def _grow(buffer: numpy.ndarray, count: int, size: int) -> numpy.ndarray:
+        """Copy the first count rows of buffer into a new one of size rows."""
+        grown = numpy.empty((size,) + buffer.shape[1:], dtype=buffer.dtype)
+        grown[:count] = buffer[:count]
+        return grown
+
+    @staticmethod
+    def _reports(packets) -> numpy.ndarray:
+        # Boot protocol reports are 3 bytes (no wheel), most mice send at least 4. Anything past that is ignored.
+        data = [packet.data for packet in packets if packet.data is not None and len(packet.data) >= 3]
+
+        if all(len(d) == 4 for d in data):
+            data = b"".join(data)
+        else:
+            data = b"".join(d[:4].ljust(4, b"\x00") for d in data)
+
+        return numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, 4)
+
+    @staticmethod
+    def decode_reports(reports: numpy.ndarray) -> tuple:
+        """Split mouse reports into columns.
+
+        Args:
+            reports (numpy.ndarray): N x 4 array of uint8 reports.
+
+        Returns:
+            tuple: (button, dx, dy, wheel). button is uint8, the rest are int8.
+        """
+        movement = reports[:, 1:].view(numpy.int8)
+        return reports[:, 0], movement[:, 0], movement[:, 1], movement[:, 2]
 
     def __repr__(self) -> str:
-        return "<Mouse actions={0}>".format(len(self.actions_list))
+        return "<Mouse actions={0}>".format(len(self.reports))
+
+    ##############
+    # Properties #
+    ##############
 
+    @property
+    def reports(self) -> numpy.ndarray:
+        """numpy.ndarray: N x 4 uint8 array of the raw reports."""
+        return self.__buffer[:self.__count]
+
+    @reports.setter
+    def reports(self, reports: numpy.ndarray) -> None:
+        self.__buffer = numpy.array(reports, dtype=numpy.uint8).reshape(-1, 4)
+        self.__count = len(self.__buffer)
+
+        # Widen before summing so long drags can't overflow
+        _, dx, dy, _ = self.decode_reports(self.__buffer)
+        self.__x = numpy.cumsum(dx, dtype=numpy.int64)
+        self.__y = numpy.cumsum(dy, dtype=numpy.int64)
+
+    # The columns are views of the reports, nothing is copied
+
+    @property
+    def button(self) -> numpy.ndarray:
+        """numpy.ndarray: uint8 button state of each report."""
+        return self.decode_reports(self.reports)[0]
+
+    @property
+    def dx(self) -> numpy.ndarray:
+        """numpy.ndarray: int8 x movement of each report."""
+        return self.decode_reports(self.reports)[1]
+
+    @property
+    def dy(self) -> numpy.ndarray:
+        """numpy.ndarray: int8 y movement of each report."""
+        return self.decode_reports(self.reports)[2]
+
+    @property
+    def wheel(self) -> numpy.ndarray:
+        """numpy.ndarray: int8 wheel movement of each report."""
+        return self.decode_reports(self.reports)[3]
+
+    @property
+    def x(self) -> numpy.ndarray:
+        """numpy.ndarray: int64 x position of the pointer after each report."""
+        return self.__x[:self.__count]
+
+    @property
+    def y(self) -> numpy.ndarray:
+        """numpy.ndarray: int64 y position of the pointer after each report."""
+        return self.__y[:self.__count]
 
     @property
     def actions(self) -> str:
         """Returns the actions captured as a string."""
-        return ''.join("X={:d} Y={:d} W={:d}] B={:d}\n".format(action['x'], action['y'], action['wheel'], action['button']) for action in self.actions_list)
+        return ''.join("X={:d} Y={:d} W={:d}] B={:d}\n".format(x, y, wheel, button) for button, x, y, wheel in
+                zip(self.button.tolist(), self.dx.tolist(), self.dy.tolist(), self.wheel.tolist()))
 
     @property
     def actions_list(self) -> list:
         """Returns the actions captured as a list."""
-        return self.__actions_list
-
-    @actions_list.setter
-    def actions_list(self, actions_list: list) -> None:
-        self.__actions_list = actions_list
+        return [{'x': x, 'y': y, 'wheel': wheel, 'button': button} for button, x, y, wheel in
+                zip(self.button.tolist(), self.dx.tolist(), self.dy.tolist(), self.wheel.tolist())]
 
     @property
     def pcap(self):
@@ -65,4 +160,3 @@ class Mouse:
     @pcap.setter
     def pcap(self, pcap) -> None:
         self.__pcap = pcap
-
@@ -39,11 +39,12 @@ class HID:
         # TODO: Actually use the HID descriptors...
         # Using subclass and proto for now
 
-        # Loop through each endpoint
+        # Loop through each endpoint. Decoding is deferred until first access.
         for endpoint in self.interface.endpoints:
             if self.interface.bInterfaceProtocol == PROTO_KEYBOARD:
-                endpoint.keyboard = Keyboard(endpoint.pcap)
-            # TODO: mouse
+                endpoint.handlers['keyboard'] = '.HID.Keyboard:Keyboard'
+            elif self.interface.bInterfaceProtocol == PROTO_MOUSE:
+                endpoint.handlers['mouse'] = '.HID.Mouse:Mouse'
         
 
     def _parse_interface(self):
@@ -73,5 +74,3 @@ class HID:
     @interface.setter
     def interface(self, interface) -> None:
         self.__interface = interface
-
-from .Keyboard import Keyboard
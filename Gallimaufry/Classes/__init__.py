@@ -2,6 +2,8 @@ import logging
 
 logger = logging.getLogger("USB.Classes")
 
+import importlib
+
 
 def get_class_handler(class_id: int):
     """Returns the handler for the given class id."""
@@ -10,14 +12,21 @@ def get_class_handler(class_id: int):
         logger.warn("Could not find handler for class id of {0}".format(class_id))
         return None
 
-    return handlers[class_id]
+    return load_handler(handlers[class_id])
+
+def load_handler(name: str):
+    """Import a handler class given as "module:class", relative to this package.
 
+    Handlers are registered by name so that their modules (and whatever
+    they depend on, such as numpy) are only imported once actually used.
+    """
+    module, _, handler = name.partition(":")
+    return getattr(importlib.import_module(module, __name__), handler)
 
-from .HID import HID
 
 # Enumerate the handlers we have added
 handlers = {
-        0x3:  HID
+        0x3:  '.HID:HID'
         }
 
 # Describe the base classes
@@ -9,15 +9,17 @@ class Configuration:
     """Represents a USB Configuration.
 
     Args:
-        packet (dict):  json packet containing the descriptor for this object
-        pcap (list): the pcap json blob
+        packet (Gallimaufry.Packet.Packet): packet containing the descriptor for this object
+        pcap (Gallimaufry.PacketList.PacketView): the packets for this device
+        stats (Gallimaufry.Stats.Stats, optional): Where the endpoints record their handler times.
 
 
     Ref: http://www.beyondlogic.org/usbnutshell/usb5.shtml#ConfigurationDescriptors
     """
 
-    def __init__(self, packet, pcap):
+    def __init__(self, packet, pcap, stats=None):
         self.pcap = pcap
+        self.stats = stats
 
         self._parse_configuration_descriptor(packet)
 
@@ -38,7 +40,7 @@ class Configuration:
 
         # Loop through the configurations
         found_config = False
-        for layer in packet['_source']['layers'].values():
+        for layer in packet.layers.values():
             # Is this a config field?
             if 'usb.bDescriptorType' in layer and int(layer['usb.bDescriptorType'],16) == 2:
                 found_config = True
@@ -50,7 +52,7 @@ class Configuration:
 
             # Interface Descriptor
             if int(layer['usb.bDescriptorType'],16) == 0x4:
-                self.interfaces.append(Interface(layer, pcap=self.pcap))
+                self.interfaces.append(Interface(layer, pcap=self.pcap, stats=self.stats))
 
             # HID Descriptor
             elif int(layer['usb.bDescriptorType'],16) == 0x21:
@@ -84,14 +86,23 @@ class Configuration:
     ##############
 
     @property
-    def pcap(self) -> typing.List[OrderedDict]:
-        """list: List of packets relevant to this Configuration."""
+    def pcap(self) -> "PacketView":
+        """Gallimaufry.PacketList.PacketView: Packets relevant to this Configuration."""
         return self.__pcap
 
     @pcap.setter
-    def pcap(self, pcap: typing.List[OrderedDict]) -> None:
+    def pcap(self, pcap: "PacketView") -> None:
         self.__pcap = pcap
 
+    @property
+    def stats(self) -> "Stats":
+        """Gallimaufry.Stats.Stats: Where the endpoints record their handler times."""
+        return self.__stats
+
+    @stats.setter
+    def stats(self, stats) -> None:
+        self.__stats = stats if stats is not None else Stats()
+
     @property
     def summary(self) -> str:
         """str: Textual summary of this Configuration."""
@@ -187,3 +198,4 @@ class Configuration:
 
 from .helpers import *
 from .Interface import Interface
+from .Stats import Stats
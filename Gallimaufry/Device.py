@@ -1,52 +1,98 @@
 import logging
 logger = logging.getLogger("USB.Device")
 
+from .PacketList import PacketList, PacketView
+
 
 class Device:
     """Defines a USB device.
     
     Args:
-        device_descriptor (dict): The device descriptor packet to use in generating this device object.
-        pcap (list): The full list of packets as returned by tshark.
+        device_descriptor (Gallimaufry.Packet.Packet): The device descriptor packet to use in generating this device object.
+        pcap (list): The full list of packets as returned by the backend.
+        stats (Gallimaufry.Stats.Stats, optional): Where to record how long
+            resolving strings, parsing configurations and running handlers
+            take. Defaults to a new one.
 
     """
 
-    def __init__(self, device_descriptor, pcap):
+    def __init__(self, device_descriptor, pcap, stats=None):
+        self.stats = stats
         self.string_descriptors = {}
         self._parse_device_descriptor(device_descriptor)
 
         # PCAP will filter the pcap down to only this device
         self.pcap = pcap
 
-        self._resolve_string_descriptors()
-        self._parse_configuration_descriptors()
+        self._parse_descriptors()
+
+    def _parse_descriptors(self, start: int = 0) -> None:
+        """Resolve strings and parse configurations, from packet position start on, timing each."""
+        strings = len(self.string_descriptors)
+        configurations = len(self.configurations) if start else 0
+
+        owner = ("Device", "{0}.{1}".format(self.bus_id, self.device_address))
+
+        with self.stats.stage("strings", owner=owner) as timer:
+            self._resolve_string_descriptors(start)
+            timer.count = len(self.string_descriptors) - strings
+
+        with self.stats.stage("configurations", owner=owner) as timer:
+            self._parse_configuration_descriptors(start)
+            timer.count = len(self.configurations) - configurations
+
+    def update(self, start: int) -> None:
+        """Pick up packets appended to the capture from position start on.
+
+        Any new string and configuration descriptors are added, and the
+        Endpoints already found are updated in place (see Endpoint.update).
+
+        Args:
+            start (int): Number of packets in the capture before the new ones.
+        """
+        if not self.pcap.refresh(start):
+            return
+
+        for configuration in self.configurations:
+            for interface in configuration.interfaces:
+                for endpoint in interface.endpoints:
+                    endpoint.update(start)
+
+        self._parse_descriptors(start)
 
-    def _parse_configuration_descriptors(self) -> None:
-        """Discover and add configuration descriptors to this device."""
-        self.configurations = []
+    def _parse_configuration_descriptors(self, start: int = 0) -> None:
+        """Discover and add configuration descriptors to this device, from packet position start on."""
+        if not start:
+            self.configurations = []
         
         # Find all the configuration descriptors
-        for packet in self.pcap:
+        found = False
+        for packet in self.pcap.descriptors(start):
             if has_configuration_descriptor(packet) and has_endpoint_descriptor(packet):
-                self.configurations.append(Configuration(packet, pcap=self.pcap))
+                self.configurations.append(Configuration(packet, pcap=self.pcap, stats=self.stats))
+                found = True
 
         # Sanity check
-        if len(self.configurations) != self.bNumConfigurations:
+        if (found or not start) and len(self.configurations) != self.bNumConfigurations:
             logger.warn("Expected {0} Descriptors. Found {1}.".format(self.bNumConfigurations, len(self.configurations)))
 
 
-    def _resolve_string_descriptors(self):
-        """Look up any string descriptors for this device that have been transferred."""
+    def _resolve_string_descriptors(self, start: int = 0):
+        """Look up any string descriptors for this device that have been transferred, from packet position start on."""
 
         # Grab any string descriptor packets for this device
-        string_descriptors = (packet for packet in self.pcap if has_string_descriptor(packet))
+        string_descriptors = (packet for packet in self.pcap.descriptors(start) if has_string_descriptor(packet))
 
         # For each, figure out what the request was for
         for descriptor in string_descriptors:
-            request_frame = int(descriptor['_source']['layers']['usb']['usb.request_in'])
-            packet = next(packet for packet in self.pcap if int(packet['_source']['layers']['frame']['frame.number']) == request_frame)
-            iDescriptor = int(packet['_source']['layers']['URB setup']['usb.DescriptorIndex'],16)
-            bString = descriptor['_source']['layers']['STRING DESCRIPTOR']['usb.bString']
+            packet = self.pcap.request(descriptor)
+
+            # Request wasn't captured
+            if packet is None:
+                continue
+
+            iDescriptor = int(packet.raw_layers['URB setup']['usb.DescriptorIndex'],16)
+            bString = descriptor.raw_layers['STRING DESCRIPTOR']['usb.bString']
 
             self.string_descriptors[iDescriptor] = bString
 
@@ -54,25 +100,27 @@ class Device:
     def _parse_device_descriptor(self, device_descriptor) -> None:
         """Given a descriptor packet, parse out the fields."""
         
-        self.bus_id = int(device_descriptor['_source']['layers']['usb']['usb.bus_id'])
-        self.device_address = int(device_descriptor['_source']['layers']['usb']['usb.device_address'])
-        self.bNumConfigurations = int(device_descriptor['_source']['layers']['DEVICE DESCRIPTOR']['usb.bNumConfigurations'])
+        descriptor = device_descriptor.raw_layers['DEVICE DESCRIPTOR']
+
+        self.bus_id = device_descriptor.bus_id
+        self.device_address = device_descriptor.device_address
+        self.bNumConfigurations = int(descriptor['usb.bNumConfigurations'])
 
-        bcdUSB = "{0:04x}".format(int(device_descriptor['_source']['layers']['DEVICE DESCRIPTOR']['usb.bcdUSB'],16))
+        bcdUSB = "{0:04x}".format(int(descriptor['usb.bcdUSB'],16))
         self.bluetooth_major = int(bcdUSB[:2],10)
         self.bluetooth_minor = int(bcdUSB[2:3],10)
         self.bluetooth_subminor = int(bcdUSB[3:4],10)
 
-        bcdDevice = "{0:04x}".format(int(device_descriptor['_source']['layers']['DEVICE DESCRIPTOR']['usb.bcdDevice'],16))
+        bcdDevice = "{0:04x}".format(int(descriptor['usb.bcdDevice'],16))
         self.device_major = int(bcdDevice[:2],10)
         self.device_minor = int(bcdDevice[2:3],10)
         self.device_subminor = int(bcdDevice[3:4],10)
 
-        self.idVendor = int(device_descriptor['_source']['layers']['DEVICE DESCRIPTOR']['usb.idVendor'],10)
-        self.idProduct = int(device_descriptor['_source']['layers']['DEVICE DESCRIPTOR']['usb.idProduct'],16)
-        self.iManufacturer = int(device_descriptor['_source']['layers']['DEVICE DESCRIPTOR']['usb.iManufacturer'],10)
-        self.iProduct = int(device_descriptor['_source']['layers']['DEVICE DESCRIPTOR']['usb.iProduct'],10)
-        self.iSerialNumber = int(device_descriptor['_source']['layers']['DEVICE DESCRIPTOR']['usb.iSerialNumber'],10)
+        self.idVendor = int(descriptor['usb.idVendor'],10)
+        self.idProduct = int(descriptor['usb.idProduct'],16)
+        self.iManufacturer = int(descriptor['usb.iManufacturer'],10)
+        self.iProduct = int(descriptor['usb.iProduct'],10)
+        self.iSerialNumber = int(descriptor['usb.iSerialNumber'],10)
 
     def __repr__(self) -> str:
         return "<{4} {5} v{3} USB{2} bus_id={0} address={1}>".format(self.bus_id, self.device_address, self.bluetooth_version, self.device_version, self.vendor, self.product)
@@ -112,6 +160,15 @@ class Device:
 
         return summary.strip()
 
+    @property
+    def stats(self) -> "Stats":
+        """Gallimaufry.Stats.Stats: Where the time taken to build out this device is recorded."""
+        return self.__stats
+
+    @stats.setter
+    def stats(self, stats) -> None:
+        self.__stats = stats if stats is not None else Stats()
+
     @property
     def bNumConfigurations(self) -> int:
         """int: The number of Configurations this Device has."""
@@ -122,18 +179,17 @@ class Device:
         self.__bNumConfigurations = bNumConfigurations
 
     @property
-    def pcap(self):
-        """list: The packet capture specific to this USB device."""
+    def pcap(self) -> PacketView:
+        """Gallimaufry.PacketList.PacketView: The packet capture specific to this USB device."""
         return self.__pcap
 
     @pcap.setter
     def pcap(self, pcap):
+        if not isinstance(pcap, (PacketList, PacketView)):
+            pcap = PacketList(pcap)
+
         # Filter the pcap down to only packets relevant for this device.
-        self.__pcap = [packet for packet in pcap if 
-                'usb' in packet['_source']['layers'] and 
-                int(packet['_source']['layers']['usb']['usb.bus_id']) == self.bus_id and 
-                int(packet['_source']['layers']['usb']['usb.device_address']) == self.device_address
-                ]
+        self.__pcap = pcap.view(bus_id=self.bus_id, device_address=self.device_address)
 
     @property
     def configurations(self):
@@ -296,3 +352,4 @@ class Device:
 
 from .helpers import *
 from .Configuration import Configuration
+from .Stats import Stats
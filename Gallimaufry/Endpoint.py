@@ -3,6 +3,7 @@ import logging
 logger = logging.getLogger("USB.Endpoint")
 
 import typing
+from .PacketList import PacketList, PacketView
 
 # Transfer Types
 TT_CONTROL     = 0
@@ -17,14 +18,22 @@ class Endpoint:
         endpoint_descriptor_packet (dict): Packet for endpoint descriptor.
         pcap (list): list of packets in capture.
         interface (USB.Interface.Interface): pointer to parent interface object.
+        stats (Gallimaufry.Stats.Stats, optional): Where to record how long
+            the handlers take. Defaults to a new one.
 
     Note:
         This class is generally automatically instantiated through
         USB.Interface.Interface.
     """
 
-    def __init__(self, endpoint_descriptor_packet, pcap, interface):
+    def __init__(self, endpoint_descriptor_packet, pcap, interface, stats=None):
         self.interface = interface
+        self.stats = stats
+
+        # Class handlers register their decoders here, name -> class taking the
+        # pcap, or its "module:class" in Gallimaufry.Classes to import on first use
+        self.handlers = {}
+        self.__decoded = {}
 
         self._parse_endpoint_descriptor_packet(endpoint_descriptor_packet)
 
@@ -37,6 +46,69 @@ class Endpoint:
         self.wMaxPacketSize = int(endpoint_descriptor_packet['usb.wMaxPacketSize'])
         self.bInterval = int(endpoint_descriptor_packet['usb.bInterval'])
 
+    def decode(self, handlers: typing.Iterable[str] = None) -> None:
+        """Decode this Endpoint's packets now, rather than on first access.
+
+        Args:
+            handlers (list, optional): Names of the handlers to run, i.e.:
+                ["keyboard"]. Defaults to all those registered for this
+                Endpoint.
+        """
+        for name in list(self.handlers) if handlers is None else handlers:
+            self._decoded(name)
+
+    def update(self, start: int) -> None:
+        """Pick up packets appended to the capture from position start on.
+
+        Handler results already decoded are updated in place if the handler
+        can (it has an update method taking the new packets), and are
+        otherwise decoded again on next access.
+
+        Args:
+            start (int): Number of packets in the capture before the new ones.
+        """
+        new = self.pcap.refresh(start)
+
+        if not new or not self.__decoded:
+            return
+
+        packets = [self.pcap.packets[position] for position in new]
+
+        for name, result in list(self.__decoded.items()):
+            if hasattr(result, 'update'):
+                with self.stats.stage("handlers." + name, len(packets), owner=self._owner("handler", name)):
+                    result.update(packets)
+            else:
+                del self.__decoded[name]
+
+    def _decoded(self, name: str):
+        """Returns the result of the named handler, decoding on first use."""
+        if name not in self.__decoded:
+            handler = self.handlers.get(name)
+
+            if handler is None:
+                return None
+
+            if isinstance(handler, str):
+                handler = self.handlers[name] = load_handler(handler)
+
+            # Work out which packets are this Endpoint's first, so that the
+            # handler is only charged for decoding them
+            if not self.pcap.resolved:
+                with self.stats.stage("views", owner=self._owner("Endpoint")) as timer:
+                    timer.count = len(self.pcap.positions)
+
+            with self.stats.stage("handlers." + name, len(self.pcap), owner=self._owner("handler", name)):
+                self.__decoded[name] = handler(self.pcap)
+
+        return self.__decoded[name]
+
+    def _owner(self, level: str, *names: str) -> tuple:
+        """tuple: (level, name) this Endpoint's stages are recorded against, see Gallimaufry.Stats.Stats."""
+        bus_id, device_address, _ = self.pcap.selection
+        name = "{0}.{1} 0x{2:02x}".format(bus_id, device_address, self.bEndpointAddress)
+        return (level, " ".join((name,) + names))
+
     def __repr__(self) -> str:
         return "<Endpoint number={0} direction={1} transfer_type={2} packets={3}>".format(
                 self.number,
@@ -70,16 +142,49 @@ class Endpoint:
         self.__interface = interface
 
     @property
-    def pcap(self):
-        """list: Packet Capture json packets that are relevant to this specific Endpoint."""
+    def pcap(self) -> PacketView:
+        """Gallimaufry.PacketList.PacketView: Packet Capture json packets that are relevant to this specific Endpoint."""
         return self.__pcap
 
     @pcap.setter
     def pcap(self, pcap) -> None:
-        self.__pcap = [packet for packet in pcap if
-                settings.usb_endpoint_designator in packet['_source']['layers']['usb'] and
-                (int(packet['_source']['layers']['usb'][settings.usb_endpoint_designator],16) & 0b111) == self.number
-                ]
+        if not isinstance(pcap, (PacketList, PacketView)):
+            pcap = PacketList(pcap)
+
+        self.__pcap = pcap.view(endpoint_number=self.number)
+
+    @property
+    def stats(self) -> "Stats":
+        """Gallimaufry.Stats.Stats: Where the handlers' times are recorded."""
+        return self.__stats
+
+    @stats.setter
+    def stats(self, stats) -> None:
+        self.__stats = stats if stats is not None else Stats()
+
+    @property
+    def keyboard(self):
+        """Gallimaufry.Classes.HID.Keyboard.Keyboard: Keystrokes sent over this Endpoint, or None if it isn't a keyboard.
+
+        Decoded on first access.
+        """
+        return self._decoded('keyboard')
+
+    @keyboard.setter
+    def keyboard(self, keyboard) -> None:
+        self.__decoded['keyboard'] = keyboard
+
+    @property
+    def mouse(self):
+        """Gallimaufry.Classes.HID.Mouse.Mouse: Movement sent over this Endpoint, or None if it isn't a mouse.
+
+        Decoded on first access.
+        """
+        return self._decoded('mouse')
+
+    @mouse.setter
+    def mouse(self, mouse) -> None:
+        self.__decoded['mouse'] = mouse
 
     @property
     def usage_type(self) -> typing.Union[int, type(None)]:
@@ -199,3 +304,5 @@ class Endpoint:
         self.__bEndpointAddress = bEndpointAddress
 
 from . import settings
+from .Classes import load_handler
+from .Stats import Stats
@@ -0,0 +1,333 @@
+import logging
+logger = logging.getLogger("Gallimaufry.Generator")
+
+import argparse
+import random
+import struct
+import typing
+
+from .Backends.Native import DLT_USB_LINUX, DLT_USB_LINUX_MMAPPED, URB_INTERRUPT, URB_CONTROL, URB_BULK, \
+        DESC_DEVICE, DESC_CONFIGURATION, DESC_STRING, DESC_INTERFACE, DESC_ENDPOINT, DESC_HID, GET_DESCRIPTOR, \
+        PCAPNG_SHB, PCAPNG_IDB, PCAPNG_EPB
+
+# usbmon flag values for "no setup/data present"
+SETUP_ABSENT = ord('-')
+DATA_ABSENT_IN = ord('<')
+DATA_ABSENT_OUT = ord('>')
+
+EINPROGRESS = -115
+
+# Linux Foundation 2.0 root hub, Logitech keyboard
+HUB_IDS = (0x1d6b, 0x0002)
+DEVICE_IDS = (0x046d, 0xc31c)
+
+# Capture starts here, one packet every 100us
+START_TIME_NS = 1500000000 * 10**9
+PACKET_INTERVAL_NS = 100000
+
+# Boot keyboard key codes for typing
+KEYS = {chr(ord('a') + i): 0x04 + i for i in range(26)}
+KEYS.update({' ': 0x2c, '\n': 0x28})
+
+class Generator:
+    """Writes synthetic, but valid, Linux usbmon captures for scale testing.
+
+    Every bus gets a root hub at address 1, then the extra hubs and devices.
+    Each device is enumerated as the kernel would (device descriptor,
+    string descriptors, configuration descriptors) and then the reports
+    are spread round robin over every device's endpoints.
+
+    Devices are boot keyboards. Their first endpoint is the interrupt IN
+    keyboard endpoint, typing out a deterministic stream of text. Any other
+    endpoints sit on a vendor specific interface and alternate between bulk
+    IN and bulk OUT.
+
+    Args:
+        buses (int, optional): Number of buses.
+        devices (int, optional): Number of devices per bus, not counting hubs.
+        hubs (int, optional): Number of hubs per bus, not counting the root hub.
+        configurations (int, optional): Configurations per device.
+        endpoints (int, optional): Endpoints per device (max 7).
+        strings (int, optional): String descriptors per device.
+        reports (int, optional): Total interrupt/bulk transfers. Each is a
+            submission and a completion packet.
+        bulk_size (int, optional): Bytes per bulk transfer.
+        seed (int, optional): Seed for the generated content.
+        linktype (int, optional): DLT_USB_LINUX (189) or DLT_USB_LINUX_MMAPPED (220).
+
+    Example:
+        To write a capture of a little over 10 million packets::
+
+            >> from Gallimaufry.Generator import Generator
+            >> Generator(buses=2, devices=4, endpoints=3, reports=5000000).write("big.pcap")
+
+        Or from the command line::
+
+            $ python -m Gallimaufry.Generator --devices 4 --reports 5000000 big.pcap
+    """
+
+    def __init__(self, buses: int = 1, devices: int = 1, hubs: int = 0, configurations: int = 1, endpoints: int = 1,
+            strings: int = 3, reports: int = 1000, bulk_size: int = 64, seed: int = 0, linktype: int = DLT_USB_LINUX_MMAPPED) -> None:
+
+        if not 1 <= endpoints <= 7:
+            raise Exception("Devices can have between 1 and 7 endpoints.")
+
+        if linktype not in (DLT_USB_LINUX, DLT_USB_LINUX_MMAPPED):
+            raise Exception("Only usbmon link types ({0}, {1}) can be generated.".format(DLT_USB_LINUX, DLT_USB_LINUX_MMAPPED))
+
+        self.buses = buses
+        self.devices = devices
+        self.hubs = hubs
+        self.configurations = configurations
+        self.endpoints = endpoints
+        self.strings = strings
+        self.reports = reports
+        self.bulk_size = bulk_size
+        self.seed = seed
+        self.linktype = linktype
+
+        # Pad the mmapped header out to 64 bytes (interval, start_frame, xfer_flags, ndesc)
+        self._header = struct.Struct("<QBBBBHbbqiiII8s" + ("iiII" if linktype == DLT_USB_LINUX_MMAPPED else ""))
+
+    def write(self, filename: str, format: str = "pcap") -> int:
+        """Write the capture.
+
+        Args:
+            filename (str): Where to write it.
+            format (str, optional): "pcap" or "pcapng".
+
+        Returns:
+            int: Number of packets written.
+        """
+        if format == "pcap":
+            header, record = self._pcap_header, self._pcap_record
+        elif format == "pcapng":
+            header, record = self._pcapng_header, self._pcapng_record
+        else:
+            raise Exception("Unknown capture format {0}. Valid formats are: pcap, pcapng".format(format))
+
+        count = 0
+        chunk = []
+
+        with open(filename, "wb") as f:
+            f.write(header())
+
+            for count, frame in enumerate(self.frames(), 1):
+                chunk.append(record(START_TIME_NS + count * PACKET_INTERVAL_NS, frame))
+
+                if len(chunk) >= 65536:
+                    f.write(b"".join(chunk))
+                    chunk = []
+
+            f.write(b"".join(chunk))
+
+        return count
+
+    def frames(self) -> typing.Iterator[bytes]:
+        """Iterate over the usbmon frames of the capture, in order."""
+        rng = random.Random(self.seed)
+        self._urb_id = 0xffff880000000000
+
+        # (bus, address, endpoint address, transfer type) of every data endpoint
+        sources = []
+
+        for bus in range(1, self.buses + 1):
+            for address in range(1, 2 + self.hubs + self.devices):
+                hub = address <= 1 + self.hubs
+                yield from self._enumerate(bus, address, hub)
+
+                if not hub:
+                    sources.extend((bus, address, endpoint, transfer_type) for endpoint, transfer_type in self._data_endpoints())
+
+        if not sources:
+            return
+
+        text = self._text(rng)
+        bulk = bytes(rng.getrandbits(8) for _ in range(self.bulk_size))
+
+        # Per source, how far through typing the keyboard is
+        typed = [0] * len(sources)
+
+        for i in range(self.reports):
+            source = i % len(sources)
+            bus, address, endpoint, transfer_type = sources[source]
+
+            if transfer_type == URB_INTERRUPT:
+                # Alternate press and release
+                n = typed[source]
+                typed[source] += 1
+                report = bytes((0, 0, text[(n // 2) % len(text)], 0, 0, 0, 0, 0)) if n % 2 == 0 else bytes(8)
+                yield from self._transfer(bus, address, endpoint, URB_INTERRUPT, report)
+
+            else:
+                yield from self._transfer(bus, address, endpoint, URB_BULK, bulk)
+
+    @property
+    def packet_count(self) -> int:
+        """int: Number of packets the capture will have."""
+        descriptors = 1 + (1 + self.strings if self.strings else 0) + self.configurations
+        packets = 2 * descriptors * self.buses * (1 + self.hubs + self.devices)
+
+        if self.devices:
+            packets += 2 * self.reports
+
+        return packets
+
+    #
+    # Devices
+    #
+
+    def _data_endpoints(self) -> typing.List[typing.Tuple[int, int]]:
+        """(endpoint address, transfer type) for each of a device's endpoints."""
+        endpoints = [(0x81, URB_INTERRUPT)]
+
+        for number in range(2, self.endpoints + 1):
+            # Even numbers are IN, odd are OUT
+            endpoints.append((number | (0x80 if number % 2 == 0 else 0), URB_BULK))
+
+        return endpoints
+
+    def _enumerate(self, bus: int, address: int, hub: bool) -> typing.Iterator[bytes]:
+        strings = ["Manufacturer {0}".format(address), "Product {0}".format(address), "{0:08X}".format(bus << 16 | address)]
+        strings += ["String {0}".format(i) for i in range(4, self.strings + 1)]
+        strings = strings[:self.strings]
+
+        yield from self._get_descriptor(bus, address, DESC_DEVICE, 0, self._device_descriptor(hub))
+
+        if strings:
+            yield from self._get_descriptor(bus, address, DESC_STRING, 0, bytes((4, DESC_STRING)) + struct.pack("<H", 0x0409))
+
+        for index, string in enumerate(strings, 1):
+            encoded = string.encode('utf-16-le')
+            yield from self._get_descriptor(bus, address, DESC_STRING, index, bytes((2 + len(encoded), DESC_STRING)) + encoded)
+
+        for index in range(self.configurations):
+            yield from self._get_descriptor(bus, address, DESC_CONFIGURATION, index, self._configuration_descriptor(hub, index + 1))
+
+    def _device_descriptor(self, hub: bool) -> bytes:
+        vendor, product = HUB_IDS if hub else DEVICE_IDS
+        iManufacturer, iProduct, iSerialNumber = [i if i <= self.strings else 0 for i in (1, 2, 3)]
+        return struct.pack("<BBHBBBBHHHBBBB", 18, DESC_DEVICE, 0x0200, 0x09 if hub else 0, 0, 0, 64,
+                vendor, product, 0x0105, iManufacturer, iProduct, iSerialNumber, self.configurations)
+
+    def _configuration_descriptor(self, hub: bool, value: int) -> bytes:
+        if hub:
+            descriptors = [
+                struct.pack("<BBBBBBBBB", 9, DESC_INTERFACE, 0, 0, 1, 0x09, 0, 0, 0),
+                struct.pack("<BBBBHB", 7, DESC_ENDPOINT, 0x81, URB_INTERRUPT + 2, 2, 12),
+                ]
+
+        else:
+            endpoints = self._data_endpoints()
+
+            # Boot keyboard
+            descriptors = [
+                struct.pack("<BBBBBBBBB", 9, DESC_INTERFACE, 0, 0, 1, 0x03, 1, 1, 0),
+                struct.pack("<BBHBBBH", 9, DESC_HID, 0x0111, 0, 1, 0x22, 63),
+                struct.pack("<BBBBHB", 7, DESC_ENDPOINT, 0x81, 0x03, 8, 10),
+                ]
+
+            # Everything else is bulk on a vendor specific interface
+            if len(endpoints) > 1:
+                descriptors.append(struct.pack("<BBBBBBBBB", 9, DESC_INTERFACE, 1, 0, len(endpoints) - 1, 0xff, 0, 0, 0))
+                for endpoint, _ in endpoints[1:]:
+                    descriptors.append(struct.pack("<BBBBHB", 7, DESC_ENDPOINT, endpoint, 0x02, self.bulk_size, 0))
+
+        body = b"".join(descriptors)
+        interfaces = sum(1 for descriptor in descriptors if descriptor[1] == DESC_INTERFACE)
+
+        # Bus powered, 100mA
+        return struct.pack("<BBHBBBBB", 9, DESC_CONFIGURATION, 9 + len(body), interfaces, value, 0, 0x80, 50) + body
+
+    def _text(self, rng: random.Random) -> typing.List[int]:
+        words = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 8))) for _ in range(64)]
+        return [KEYS[c] for c in " ".join(words) + "\n"]
+
+    #
+    # URBs
+    #
+
+    def _urb(self, event: str, bus: int, address: int, endpoint: int, transfer_type: int, status: int,
+            length: int, data: bytes = b"", setup: bytes = None, data_flag: int = 0) -> bytes:
+        fields = [self._urb_id, ord(event), transfer_type, endpoint, address, bus,
+                0 if setup is not None else SETUP_ABSENT, data_flag if not data else 0,
+                0, 0, status, length, len(data), setup or bytes(8)]
+
+        if self.linktype == DLT_USB_LINUX_MMAPPED:
+            fields += [0, 0, 0, 0]
+
+        return self._header.pack(*fields) + data
+
+    def _transfer(self, bus: int, address: int, endpoint: int, transfer_type: int, data: bytes) -> typing.Iterator[bytes]:
+        self._urb_id += 0x40
+
+        if endpoint & 0x80:
+            yield self._urb('S', bus, address, endpoint, transfer_type, EINPROGRESS, len(data), data_flag=DATA_ABSENT_IN)
+            yield self._urb('C', bus, address, endpoint, transfer_type, 0, len(data), data)
+        else:
+            yield self._urb('S', bus, address, endpoint, transfer_type, EINPROGRESS, len(data), data)
+            yield self._urb('C', bus, address, endpoint, transfer_type, 0, len(data), data_flag=DATA_ABSENT_OUT)
+
+    def _get_descriptor(self, bus: int, address: int, descriptor_type: int, index: int, descriptor: bytes) -> typing.Iterator[bytes]:
+        self._urb_id += 0x40
+
+        language = 0x0409 if descriptor_type == DESC_STRING and index != 0 else 0
+        setup = struct.pack("<BBHHH", 0x80, GET_DESCRIPTOR, descriptor_type << 8 | index, language, len(descriptor))
+
+        yield self._urb('S', bus, address, 0x80, URB_CONTROL, EINPROGRESS, len(descriptor), setup=setup, data_flag=DATA_ABSENT_IN)
+        yield self._urb('C', bus, address, 0x80, URB_CONTROL, 0, len(descriptor), descriptor)
+
+    #
+    # File formats
+    #
+
+    def _pcap_header(self) -> bytes:
+        return struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 262144, self.linktype)
+
+    def _pcap_record(self, timestamp_ns: int, frame: bytes) -> bytes:
+        seconds, nanoseconds = divmod(timestamp_ns, 10**9)
+        return struct.pack("<IIII", seconds, nanoseconds // 1000, len(frame), len(frame)) + frame
+
+    def _pcapng_header(self) -> bytes:
+        shb = struct.pack("<IIIHHqI", PCAPNG_SHB, 28, 0x1a2b3c4d, 1, 0, -1, 28)
+
+        # if_tsresol of 9, nanoseconds
+        options = struct.pack("<HHB3x", 9, 1, 9) + struct.pack("<HH", 0, 0)
+        idb = struct.pack("<IIHHI", PCAPNG_IDB, 20 + len(options), self.linktype, 0, 262144) + options + struct.pack("<I", 20 + len(options))
+
+        return shb + idb
+
+    def _pcapng_record(self, timestamp_ns: int, frame: bytes) -> bytes:
+        padding = -len(frame) % 4
+        length = 32 + len(frame) + padding
+        return struct.pack("<IIIIIII", PCAPNG_EPB, length, 0, timestamp_ns >> 32, timestamp_ns & 0xffffffff, len(frame), len(frame)) + \
+                frame + bytes(padding) + struct.pack("<I", length)
+
+    def __repr__(self) -> str:
+        return "<Generator buses={0} devices={1} hubs={2} reports={3}>".format(self.buses, self.devices, self.hubs, self.reports)
+
+
+def main(argv: typing.List[str] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m Gallimaufry.Generator", description="Write a synthetic usbmon capture.")
+    parser.add_argument("filename", help="Capture file to write.")
+    parser.add_argument("--format", choices=["pcap", "pcapng"], default="pcap")
+    parser.add_argument("--buses", type=int, default=1)
+    parser.add_argument("--devices", type=int, default=1, help="Devices per bus, not counting hubs.")
+    parser.add_argument("--hubs", type=int, default=0, help="Hubs per bus, not counting the root hub.")
+    parser.add_argument("--configurations", type=int, default=1)
+    parser.add_argument("--endpoints", type=int, default=1, help="Endpoints per device, max 7.")
+    parser.add_argument("--strings", type=int, default=3)
+    parser.add_argument("--reports", type=int, default=1000, help="Interrupt/bulk transfers, two packets each.")
+    parser.add_argument("--bulk-size", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--linktype", type=int, choices=[DLT_USB_LINUX, DLT_USB_LINUX_MMAPPED], default=DLT_USB_LINUX_MMAPPED)
+    args = parser.parse_args(argv)
+
+    generator = Generator(buses=args.buses, devices=args.devices, hubs=args.hubs, configurations=args.configurations,
+            endpoints=args.endpoints, strings=args.strings, reports=args.reports, bulk_size=args.bulk_size,
+            seed=args.seed, linktype=args.linktype)
+
+    print("Wrote {0} packets to {1}".format(generator.write(args.filename, format=args.format), args.filename))
+
+if __name__ == "__main__":
+    main()
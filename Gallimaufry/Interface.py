@@ -3,22 +3,25 @@ from .HID import HID
 from .UVC import StreamingDescriptor, ControlDescriptor
 from .Endpoint import Endpoint
 from .Classes import get_class_handler
+from .Stats import Stats
 
 class Interface:
     """Describes a USB Interface.
 
     Args:
         interface_descriptor_packet (dict): json of the interface descriptor packet that defines this interface.
-        pcap (list): list of pcap packets from capture.
+        pcap (Gallimaufry.PacketList.PacketView): packets for this interface's device.
+        stats (Gallimaufry.Stats.Stats, optional): Where the endpoints record their handler times.
 
     Note:
         This is generally created automatically from the
         Gallimaufry.Configuration.Configuration class.
     """
 
-    def __init__(self,interface_descriptor_packet, pcap):
-        # Store the pcap
+    def __init__(self,interface_descriptor_packet, pcap, stats=None):
+        # Store the (lazy) view of the device's packets for the endpoints
         self.pcap = pcap
+        self.__stats = stats if stats is not None else Stats()
 
         # These will be filled in by the handler
         self.subclass_str = None
@@ -55,7 +58,7 @@ class Interface:
 
     def _parse_endpoint_descriptor_packet(self, endpoint_descriptor_packet):
         # This is called from the Configuration Descriptor parsing
-        self.endpoints.append(Endpoint(endpoint_descriptor_packet, pcap=self.pcap, interface=self))
+        self.endpoints.append(Endpoint(endpoint_descriptor_packet, pcap=self.pcap, interface=self, stats=self.stats))
 
     def __repr__(self) -> str:
         return "<Interface {1} bInterfaceNumber={0}>".format(self.bInterfaceNumber, self.class_str)
@@ -134,6 +137,11 @@ class Interface:
 
         return self.__handler
 
+    @property
+    def stats(self) -> Stats:
+        """Gallimaufry.Stats.Stats: Where the endpoints record their handler times."""
+        return self.__stats
+
     @property
     def endpoints(self) -> typing.List[Endpoint]:
         """list: List of Endpoints for this Interface."""
@@ -0,0 +1,276 @@
+import logging
+logger = logging.getLogger("Gallimaufry.Live")
+
+import subprocess
+import sys
+import typing
+from collections import OrderedDict
+
+import numpy
+
+from . import settings
+from .Backends.Native import URBDecoder, URB_INTERRUPT, iter_stream_frames, iter_usbmon
+from .Classes import load_handler
+from .Device import Device
+from .PacketList import PacketList
+from .helpers import has_configuration_descriptor, has_device_descriptor, has_endpoint_descriptor, has_string_descriptor
+
+Callback = typing.Optional[typing.Callable]
+
+class Live:
+    """Decodes USB traffic as it is captured, rather than from a finished file.
+
+    Devices are enumerated as their descriptors go by, and keyboard and mouse
+    reports are decoded and handed to callbacks as each arrives. Only the
+    descriptor traffic of each device is kept (and only max_descriptors
+    packets of it), so memory stays flat however long the capture runs.
+
+    Args:
+        frames (iterable): (linktype, timestamp, data) for each frame, as
+            they are captured. See from_usbmon, from_tshark and from_stream.
+        on_device (callable, optional): Called with the Device each time one
+            is enumerated or more of its descriptors arrive.
+        on_keystroke (callable, optional): Called with (device, endpoint,
+            keystroke) for each key pressed on a keyboard.
+        on_mouse (callable, optional): Called with (device, endpoint, report)
+            for each mouse report, report being a dict of button, dx, dy and wheel.
+        max_descriptors (int, optional): Descriptor packets kept per device.
+            The device and configuration descriptors, and the latest
+            packet, are always kept.
+        max_outstanding (int, optional): Unanswered requests remembered
+            before the oldest are forgotten.
+
+    Example:
+        To print keystrokes as they are typed on any keyboard on bus 1::
+
+            >> from Gallimaufry.Live import Live
+            >> live = Live.from_usbmon(1, on_keystroke=lambda device, endpoint, key: print(key, end=""))
+            >> live.run()
+    """
+
+    def __init__(self, frames: typing.Iterable[tuple], on_device: Callback = None, on_keystroke: Callback = None,
+            on_mouse: Callback = None, max_descriptors: int = 256, max_outstanding: int = 4096) -> None:
+        self.frames = frames
+        self.on_device = on_device
+        self.on_keystroke = on_keystroke
+        self.on_mouse = on_mouse
+        self.max_descriptors = max_descriptors
+        self.max_outstanding = max_outstanding
+
+        # (bus_id, device_address) -> Device
+        self.devices = OrderedDict()
+        self.packets = 0
+
+        self.__decoder = URBDecoder()
+        self.__running = False
+        self.__process = None
+
+        # (bus_id, device_address) -> descriptor packets of that device
+        self.__descriptors = {}
+
+        # (bus_id, device_address) -> string descriptors of that device seen so far
+        self.__strings = {}
+
+        # (bus_id, device_address, endpoint address) -> (handler name, handler class, Endpoint)
+        self.__endpoints = {}
+
+    @classmethod
+    def from_usbmon(cls, bus: int = 0, **kwargs) -> "Live":
+        """Capture straight from /dev/usbmonN. Bus 0 is every bus.
+
+        See Gallimaufry.Backends.Native.iter_usbmon.
+        """
+        return cls(iter_usbmon(bus), **kwargs)
+
+    @classmethod
+    def from_tshark(cls, interface: str, tshark: str = "tshark", **kwargs) -> "Live":
+        """Capture with tshark (or dumpcap), i.e.: interface="usbmon1"."""
+        live = cls((), **kwargs)
+        live.__process = subprocess.Popen([tshark, "-i", interface, "-w", "-", "-q"], stdout=subprocess.PIPE)
+        live.frames = iter_stream_frames(live.__process.stdout)
+        return live
+
+    @classmethod
+    def from_stream(cls, stream = None, **kwargs) -> "Live":
+        """Read a pcap or pcapng stream, i.e.: piped in on stdin. Defaults to stdin."""
+        return cls(iter_stream_frames(stream if stream is not None else sys.stdin.buffer), **kwargs)
+
+    def run(self, max_packets: int = None) -> None:
+        """Process packets until the capture ends or stop() is called.
+
+        Args:
+            max_packets (int, optional): Return after this many packets.
+        """
+        settings.usb_endpoint_designator = "usb.endpoint_address"
+        decode = self.__decoder.decode
+        self.__running = True
+
+        try:
+            for linktype, timestamp, data in self.frames:
+                self.packets += 1
+                self.process(decode(self.packets, linktype, timestamp, data))
+
+                if not self.__running or max_packets is not None and self.packets >= max_packets:
+                    break
+        finally:
+            self.__running = False
+
+    def stop(self) -> None:
+        """Stop capturing. run() returns after the packet it is on."""
+        self.__running = False
+
+        if self.__process is not None:
+            self.__process.terminate()
+            self.__process.wait()
+            self.__process = None
+
+    def process(self, packet) -> None:
+        """Handle one decoded packet."""
+        requests = self.__decoder.requests
+        if len(requests) > self.max_outstanding:
+            # Completions that never came. Dicts are ordered, so these are the oldest.
+            for urb_id in list(requests)[:len(requests) - self.max_outstanding]:
+                del requests[urb_id]
+
+        if packet.raw_layers is not None:
+            self._descriptor(packet)
+
+        elif packet.data is not None and packet.transfer_type == URB_INTERRUPT:
+            endpoint = self.__endpoints.get((packet.bus_id, packet.device_address, packet.endpoint))
+            if endpoint is not None:
+                self._report(packet, *endpoint)
+
+    def _descriptor(self, packet) -> None:
+        key = (packet.bus_id, packet.device_address)
+
+        # A new device descriptor means the device has (re)enumerated
+        if has_device_descriptor(packet):
+            self.__descriptors[key] = []
+            self.__strings[key] = {}
+
+        descriptors = self.__descriptors.get(key)
+        if descriptors is None:
+            return
+
+        descriptors.append(packet)
+
+        try:
+            self._update_device(key, packet, descriptors)
+        finally:
+            # Drop the oldest, but never the device or configuration descriptors the Device is built
+            # from, nor the latest packet, which may be a request still waiting for its completion
+            while len(descriptors) > self.max_descriptors:
+                old = next((i for i, p in enumerate(descriptors[:-1]) if not self._builds_device(p)), None)
+                if old is None:
+                    break
+                del descriptors[old]
+
+    def _update_device(self, key: tuple, packet, descriptors: list) -> None:
+        """Note down what a new descriptor packet tells us about the device, rebuilding it if it changes shape."""
+        # Requests don't tell us anything new yet
+        if packet.request_in is None:
+            return
+
+        # Strings don't change the shape of the Device, so are noted down
+        # as they come rather than kept around for a rebuild
+        if has_string_descriptor(packet) and not self._builds_device(packet):
+            request = next((p for p in descriptors if p.number == packet.request_in), None)
+            if request is None:
+                return
+
+            iDescriptor = int(request.raw_layers['URB setup']['usb.DescriptorIndex'], 16)
+            self.__strings[key][iDescriptor] = packet.raw_layers['STRING DESCRIPTOR']['usb.bString']
+
+            device = self.devices.get(key)
+            if device is not None:
+                device.string_descriptors.update(self.__strings[key])
+
+                if self.on_device is not None:
+                    self.on_device(device)
+            return
+
+        if not self._builds_device(packet):
+            return
+
+        # Wait for a full configuration, there's nothing to decode before then
+        if not any(has_configuration_descriptor(p) and has_endpoint_descriptor(p) for p in descriptors):
+            return
+
+        device = Device(descriptors[0], PacketList(descriptors))
+        device.string_descriptors.update(self.__strings[key])
+        self.devices[key] = device
+
+        for endpoint_key in [k for k in self.__endpoints if k[:2] == key]:
+            del self.__endpoints[endpoint_key]
+
+        for configuration in device.configurations:
+            for interface in configuration.interfaces:
+                for endpoint in interface.endpoints:
+                    for name in ('keyboard', 'mouse'):
+                        handler = endpoint.handlers.get(name)
+                        if handler is not None:
+                            handler = load_handler(handler) if isinstance(handler, str) else handler
+                            self.__endpoints[key + (endpoint.bEndpointAddress,)] = (name, handler, endpoint)
+
+        if self.on_device is not None:
+            self.on_device(device)
+
+    @staticmethod
+    def _builds_device(packet) -> bool:
+        """bool: Is this the device descriptor, or a full configuration descriptor, that a Device is built from?"""
+        return has_device_descriptor(packet) or has_configuration_descriptor(packet) and has_endpoint_descriptor(packet)
+
+    def _report(self, packet, name: str, handler: type, endpoint) -> None:
+        device = self.devices[(packet.bus_id, packet.device_address)]
+        data = packet.data
+
+        if name == 'keyboard' and self.on_keystroke is not None and len(data) == 8:
+            for keystroke in handler.decode_reports(numpy.frombuffer(data, dtype=numpy.uint8).reshape(1, 8)):
+                self.on_keystroke(device, endpoint, keystroke)
+
+        elif name == 'mouse' and self.on_mouse is not None and len(data) >= 3:
+            report = numpy.frombuffer(data[:4].ljust(4, b"\x00"), dtype=numpy.uint8).reshape(1, 4)
+            button, dx, dy, wheel = (int(column[0]) for column in handler.decode_reports(report))
+            self.on_mouse(device, endpoint, {'button': button, 'dx': dx, 'dy': dy, 'wheel': wheel})
+
+    def __repr__(self) -> str:
+        return "<Live devices={0} packets={1}>".format(len(self.devices), self.packets)
+
+
+def main(argv: typing.List[str] = None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m Gallimaufry.Live", description="Print USB keystrokes and devices as they are captured.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--usbmon", type=int, metavar="BUS", help="Read /dev/usbmonBUS directly (0 for every bus).")
+    source.add_argument("--interface", "-i", help="Capture with tshark from this interface, i.e.: usbmon1.")
+    parser.add_argument("--mouse", action="store_true", help="Print mouse reports too.")
+    args = parser.parse_args(argv)
+
+    def on_device(device):
+        print("\n[device {0}.{1}: {2}]".format(device.bus_id, device.device_address, device), file=sys.stderr, flush=True)
+
+    def on_keystroke(device, endpoint, keystroke):
+        print(keystroke, end="", flush=True)
+
+    def on_mouse(device, endpoint, report):
+        print("[mouse {0}.{1} {2}]".format(device.bus_id, device.device_address, report), file=sys.stderr, flush=True)
+
+    callbacks = dict(on_device=on_device, on_keystroke=on_keystroke, on_mouse=on_mouse if args.mouse else None)
+
+    if args.usbmon is not None:
+        live = Live.from_usbmon(args.usbmon, **callbacks)
+    elif args.interface is not None:
+        live = Live.from_tshark(args.interface, **callbacks)
+    else:
+        live = Live.from_stream(**callbacks)
+
+    try:
+        live.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        live.stop()
+
+if __name__ == "__main__":
+    main()
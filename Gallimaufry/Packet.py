@@ -0,0 +1,172 @@
+import logging
+logger = logging.getLogger("Gallimaufry.Packet")
+
+import typing
+from collections import OrderedDict
+
+from . import settings
+
+class Packet:
+    """Compact record of a single captured packet.
+
+    The fields the library works with are kept already parsed. The full
+    tshark style layer tree is only kept for frames carrying descriptors
+    (see raw_layers); for everything else it is rebuilt on demand from the
+    parsed fields by the layers property.
+
+    Args:
+        number (int): Frame number.
+        timestamp (float): Capture time, seconds since the epoch.
+        bus_id (int, optional): USB bus id. None if this isn't a USB packet.
+        device_address (int, optional): USB device address.
+        endpoint (int, optional): Full endpoint address, including the direction bit.
+        transfer_type (int, optional): URB transfer type (0 iso, 1 interrupt, 2 control, 3 bulk).
+        urb_status (int, optional): URB/USBD status of the transfer.
+        request_in (int, optional): For completions, the frame number of the submission.
+        data (bytes, optional): Captured payload (usb.capdata).
+        raw_layers (OrderedDict, optional): The tshark style layer tree, for descriptor frames.
+    """
+
+    __slots__ = 'number', 'timestamp', 'bus_id', 'device_address', 'endpoint', \
+                'transfer_type', 'urb_status', 'request_in', 'data', 'raw_layers'
+
+    def __init__(self, number: int, timestamp: float = 0.0, bus_id: int = None, device_address: int = None,
+            endpoint: int = None, transfer_type: int = None, urb_status: int = None, request_in: int = None,
+            data: bytes = None, raw_layers: OrderedDict = None) -> None:
+        self.number = number
+        self.timestamp = timestamp
+        self.bus_id = bus_id
+        self.device_address = device_address
+        self.endpoint = endpoint
+        self.transfer_type = transfer_type
+        self.urb_status = urb_status
+        self.request_in = request_in
+        self.data = data
+        self.raw_layers = raw_layers
+
+    def __reduce__(self):
+        # Much smaller and faster than pickling the slots by name, which
+        # matters when shipping packets between processes or to the cache
+        return Packet, (self.number, self.timestamp, self.bus_id, self.device_address, self.endpoint,
+                self.transfer_type, self.urb_status, self.request_in, self.data, self.raw_layers)
+
+    @staticmethod
+    def to_columns(packets: typing.List["Packet"]) -> list:
+        """Split packets into one list per field, which pickles far faster
+        than the packets themselves. Undone by from_columns."""
+        return [[getattr(packet, field) for packet in packets] for field in Packet.__slots__]
+
+    @staticmethod
+    def from_columns(columns: list) -> typing.List["Packet"]:
+        """Rebuild the packets split up by to_columns."""
+        return list(map(Packet, *columns))
+
+    @classmethod
+    def from_layers(cls, layers: OrderedDict) -> "Packet":
+        """Build a Packet from a tshark style layer tree.
+
+        The layers are only kept if they carry a descriptor.
+        """
+        frame = layers['frame']
+        usb = layers.get('usb')
+        packet = cls(int(frame['frame.number']), float(frame.get('frame.time_epoch', 0)))
+
+        if usb is not None and 'usb.bus_id' in usb:
+            endpoint = usb.get(settings.usb_endpoint_designator)
+            transfer_type = usb.get('usb.transfer_type')
+            urb_status = usb.get('usb.urb_status', usb.get('usb.usbd_status'))
+            request_in = usb.get('usb.request_in')
+
+            packet.bus_id = int(usb['usb.bus_id'])
+            packet.device_address = int(usb['usb.device_address'])
+            packet.endpoint = int(endpoint, 16) if endpoint is not None else None
+            packet.transfer_type = int(transfer_type, 16) if transfer_type is not None else None
+            packet.urb_status = int(urb_status, 0) if urb_status is not None else None
+            packet.request_in = int(request_in) if request_in is not None else None
+
+        capdata = layers.get('usb.capdata')
+        if capdata is not None:
+            packet.data = bytes.fromhex(capdata.replace(":", ""))
+
+        if any(isinstance(layer, dict) and 'usb.bDescriptorType' in layer for layer in layers.values()):
+            packet.raw_layers = layers
+
+        return packet
+
+    @classmethod
+    def from_json(cls, packet: dict) -> "Packet":
+        """Build a Packet from one packet of tshark json output."""
+        return cls.from_layers(packet['_source']['layers'])
+
+    def __getitem__(self, key):
+        # Backwards compatibility with code written against raw tshark json packets
+        if key == '_source':
+            return {'layers': self.layers}
+
+        raise KeyError(key)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Packet):
+            return NotImplemented
+
+        return all(getattr(self, attr) == getattr(other, attr) for attr in self.__slots__)
+
+    def __hash__(self) -> int:
+        # Everything __eq__ compares but the layers, which can't be hashed
+        return hash((self.number, self.timestamp, self.bus_id, self.device_address, self.endpoint,
+                self.transfer_type, self.urb_status, self.request_in, self.data))
+
+    def __repr__(self) -> str:
+        return "<Packet number={0} bus_id={1} device_address={2} endpoint={3}>".format(
+                self.number,
+                self.bus_id,
+                self.device_address,
+                "0x{0:02x}".format(self.endpoint) if self.endpoint is not None else None,
+                )
+
+    ##############
+    # Properties #
+    ##############
+
+    @property
+    def direction(self) -> typing.Optional[int]:
+        """int: 1 for In (device to host), 0 for Out, from the endpoint address."""
+        return (self.endpoint >> 7) & 1 if self.endpoint is not None else None
+
+    @property
+    def layers(self) -> OrderedDict:
+        """OrderedDict: tshark style layer tree for this packet.
+
+        For frames without descriptors this is rebuilt from the parsed fields
+        on each access, and only holds the fields this library tracks.
+        """
+        if self.raw_layers is not None:
+            return self.raw_layers
+
+        layers = OrderedDict()
+        layers['frame'] = OrderedDict([
+            ('frame.time_epoch', "{0:.9f}".format(self.timestamp)),
+            ('frame.number', str(self.number)),
+            ])
+
+        if self.bus_id is not None:
+            usb = layers['usb'] = OrderedDict()
+            usb['usb.bus_id'] = str(self.bus_id)
+            usb['usb.device_address'] = str(self.device_address)
+
+            if self.endpoint is not None:
+                usb[settings.usb_endpoint_designator] = "0x{0:02x}".format(self.endpoint)
+
+            if self.transfer_type is not None:
+                usb['usb.transfer_type'] = "0x{0:02x}".format(self.transfer_type)
+
+            if self.urb_status is not None:
+                usb['usb.urb_status'] = str(self.urb_status)
+
+            if self.request_in is not None:
+                usb['usb.request_in'] = str(self.request_in)
+
+        if self.data is not None:
+            layers['usb.capdata'] = ":".join("{0:02x}".format(byte) for byte in self.data)
+
+        return layers
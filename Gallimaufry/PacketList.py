@@ -0,0 +1,346 @@
+import logging
+logger = logging.getLogger("Gallimaufry.PacketList")
+
+import bisect
+import heapq
+import itertools
+import typing
+
+
+TypeIntOptional = typing.Optional[int]
+
+# Selects nothing. Never equal to a bus id, device address or endpoint number.
+NOTHING = object()
+
+class PacketList(list):
+    """A list of packets, indexed by bus id, device address and endpoint address.
+
+    The index is built as packets are appended, so selecting the packets for
+    a device or endpoint with filter() only touches the packets that match
+    rather than rescanning the whole capture. Packets are also indexed by
+    frame number, and URB submissions are linked to their completions (see
+    request() and response()).
+
+    Args:
+        packets (iterable, optional): Packets to start the list with.
+
+    Note:
+        The index is only maintained through append and extend.
+    """
+
+    def __init__(self, packets=()) -> None:
+        super().__init__()
+
+        # (bus_id, device_address, endpoint_address) -> [positions]
+        self.index = {}
+
+        # frame number -> position
+        self.frames = {}
+
+        # request frame number -> response frame number
+        self.responses = {}
+
+        # positions of packets carrying descriptors
+        self.descriptors = []
+
+        self.extend(packets)
+
+    @staticmethod
+    def key(packet) -> typing.Optional[tuple]:
+        """tuple: (bus_id, device_address, endpoint_address) of the packet, or None if it isn't USB."""
+        if packet.bus_id is None:
+            return None
+
+        return (packet.bus_id, packet.device_address, packet.endpoint)
+
+    @staticmethod
+    def matches(key: tuple, bus_id: TypeIntOptional = None, device_address: TypeIntOptional = None, endpoint_number: TypeIntOptional = None) -> bool:
+        """bool: Does the index key match ALL of the selection?"""
+        if key is None:
+            return False
+
+        if bus_id is not None and key[0] != bus_id:
+            return False
+
+        if device_address is not None and key[1] != device_address:
+            return False
+
+        # Remember, the endpoint number is the lower 3 bits of the actual endpoint address
+        if endpoint_number is not None and (key[2] is None or key[2] & 0b111 != endpoint_number):
+            return False
+
+        return True
+
+    def append(self, packet, key: tuple = False) -> None:
+        if key is False:
+            key = self.key(packet)
+
+        # Completions point back at their submission. Keep the first, later ones are status stages.
+        if packet.request_in is not None:
+            self.responses.setdefault(packet.request_in, packet.number)
+
+        if packet.raw_layers is not None:
+            self.descriptors.append(len(self))
+
+        self.frames[packet.number] = len(self)
+        self.index.setdefault(key, []).append(len(self))
+        super().append(packet)
+
+    def extend(self, packets) -> None:
+        for packet in packets:
+            self.append(packet)
+
+    def frame(self, number: int):
+        """Look up a packet by frame number.
+
+        Args:
+            number (int): The frame number.
+
+        Returns:
+            Gallimaufry.Packet.Packet: The packet, or None if it is not in this list.
+        """
+        position = self.frames.get(number)
+        return self[position] if position is not None else None
+
+    def request(self, packet):
+        """Find the URB submission a completion packet is answering.
+
+        Returns:
+            Gallimaufry.Packet.Packet: The request packet, or None if it is not in this list.
+        """
+        if packet.request_in is None:
+            return None
+
+        return self.frame(packet.request_in)
+
+    def response(self, packet):
+        """Find the URB completion answering a submission packet.
+
+        Returns:
+            Gallimaufry.Packet.Packet: The response packet, or None if it is not in this list.
+        """
+        number = self.responses.get(packet.number)
+        return self.frame(number) if number is not None else None
+
+    def pairs(self) -> typing.Iterator[tuple]:
+        """Iterate over (request, response) packet pairs, in order of the request."""
+        for request_number, response_number in sorted(self.responses.items()):
+            request = self.frame(request_number)
+            response = self.frame(response_number)
+
+            if request is not None and response is not None:
+                yield request, response
+
+    def positions(self, bus_id: TypeIntOptional = None, device_address: TypeIntOptional = None, endpoint_number: TypeIntOptional = None,
+            start: int = 0) -> typing.Iterator[typing.Tuple[int, tuple]]:
+        """Iterate, in capture order, over (position, key) for packets matching ALL of the selection, from position start on."""
+        selected = []
+
+        for key, positions in self.index.items():
+            if self.matches(key, bus_id, device_address, endpoint_number):
+                if start:
+                    positions = positions[bisect.bisect_left(positions, start):]
+                selected.append(zip(positions, itertools.repeat(key)))
+
+        if len(selected) == 1:
+            return selected[0]
+
+        return heapq.merge(*selected)
+
+    def filter(self, bus_id: TypeIntOptional = None, device_address: TypeIntOptional = None, endpoint_number: TypeIntOptional = None) -> "PacketList":
+        """Return only those packets that match ALL of the input selection.
+
+        Args:
+            bus_id: The bus id to select
+            device_address: The device address to select
+            endpoint_number: The endpoint number to select
+
+        Returns:
+            PacketList: The matching packets, in capture order, with their own index.
+        """
+        filtered = PacketList()
+
+        for position, key in self.positions(bus_id, device_address, endpoint_number):
+            filtered.append(self[position], key)
+
+        return filtered
+
+    def view(self, bus_id: TypeIntOptional = None, device_address: TypeIntOptional = None, endpoint_number: TypeIntOptional = None) -> "PacketView":
+        """Like filter(), but without copying anything.
+
+        Returns:
+            PacketView: Lazy view of the matching packets.
+        """
+        return PacketView(self, bus_id=bus_id, device_address=device_address, endpoint_number=endpoint_number)
+
+class PacketView:
+    """Read-only, lazy view of the packets in a PacketList matching a selection.
+
+    Nothing is computed until the view is used. len() is answered straight
+    from the index, and iteration, indexing and slicing read through to the
+    underlying PacketList rather than copying packets out of it.
+
+    Args:
+        packets (PacketList): The packets to view.
+        bus_id (int, optional): The bus id to select
+        device_address (int, optional): The device address to select
+        endpoint_number (int, optional): The endpoint number to select
+        positions (list, optional): Explicit, sorted positions in packets to
+            view, already matching the selection.
+    """
+
+    def __init__(self, packets: PacketList, bus_id: TypeIntOptional = None, device_address: TypeIntOptional = None,
+            endpoint_number: TypeIntOptional = None, positions: typing.Union[list, "Positions"] = None) -> None:
+        self.packets = packets
+        self.selection = (bus_id, device_address, endpoint_number)
+        self.__positions = Positions(positions) if isinstance(positions, list) else positions
+
+    @property
+    def positions(self) -> "Positions":
+        """Positions: Positions in packets of the packets in this view."""
+        if self.__positions is None:
+            self.__positions = Positions([position for position, _ in self.packets.positions(*self.selection)])
+
+        return self.__positions
+
+    @property
+    def resolved(self) -> bool:
+        """bool: Have the positions of the packets in this view been worked out yet?"""
+        return self.__positions is not None
+
+    def view(self, bus_id: TypeIntOptional = None, device_address: TypeIntOptional = None, endpoint_number: TypeIntOptional = None) -> "PacketView":
+        """Narrow this view down further.
+
+        Returns:
+            PacketView: Lazy view of the packets matching both selections.
+        """
+        selection = []
+        for current, new in zip(self.selection, (bus_id, device_address, endpoint_number)):
+            # Nothing can match both, not even packets appended later on
+            if current is not None and new is not None and current != new:
+                return PacketView(self.packets, NOTHING, NOTHING, NOTHING, positions=[])
+            selection.append(current if new is None else new)
+
+        if self.__positions is None:
+            return PacketView(self.packets, *selection)
+
+        positions = [position for position in self.__positions if self.packets.matches(self.packets.key(self.packets[position]), *selection)]
+        return PacketView(self.packets, *selection, positions=positions)
+
+    def filter(self, bus_id: TypeIntOptional = None, device_address: TypeIntOptional = None, endpoint_number: TypeIntOptional = None) -> PacketList:
+        """Return only those packets that match ALL of the input selection, copied into a new PacketList."""
+        return PacketList(self.view(bus_id, device_address, endpoint_number))
+
+    def descriptors(self, start: int = 0) -> typing.Iterator:
+        """Iterate over only the packets in this view that carry descriptors, from position start on."""
+        descriptors = self.packets.descriptors
+
+        for position in itertools.islice(descriptors, bisect.bisect_left(descriptors, start) if start else 0, None):
+            if self.__contains_position(position):
+                yield self.packets[position]
+
+    def refresh(self, start: int) -> list:
+        """Pick up packets appended to the underlying PacketList from position start on.
+
+        A view works out which packets it holds on first use, so it doesn't
+        see any appended after that until refreshed. Views of a slice stay
+        as they are.
+
+        Returns:
+            list: Positions of the appended packets matching this view.
+        """
+        new = [position for position, _ in self.packets.positions(*self.selection, start=start)]
+        positions = self.__positions
+
+        # Only grow views that cover all of their positions, slices share them
+        if new and positions is not None and positions.window == range(len(positions.base)):
+            positions.base.extend(new)
+            positions.window = range(len(positions.base))
+
+        return new
+
+    def frame(self, number: int):
+        """Look up a packet by frame number.
+
+        Returns:
+            Gallimaufry.Packet.Packet: The packet, or None if it is not in this view.
+        """
+        position = self.packets.frames.get(number)
+        return self.packets[position] if position is not None and self.__contains_position(position) else None
+
+    def request(self, packet):
+        """Find the URB submission a completion packet is answering, if it is in this view."""
+        if packet.request_in is None:
+            return None
+
+        return self.frame(packet.request_in)
+
+    def response(self, packet):
+        """Find the URB completion answering a submission packet, if it is in this view."""
+        number = self.packets.responses.get(packet.number)
+        return self.frame(number) if number is not None else None
+
+    def __contains_position(self, position: int) -> bool:
+        if self.__positions is None:
+            return self.packets.matches(self.packets.key(self.packets[position]), *self.selection)
+
+        return position in self.__positions
+
+    def __len__(self) -> int:
+        if self.__positions is not None:
+            return len(self.__positions)
+
+        return sum(len(positions) for key, positions in self.packets.index.items() if self.packets.matches(key, *self.selection))
+
+    def __iter__(self):
+        if self.__positions is None:
+            return (self.packets[position] for position, _ in self.packets.positions(*self.selection))
+
+        return (self.packets[position] for position in self.__positions)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return PacketView(self.packets, *self.selection, positions=self.positions[item])
+
+        return self.packets[self.positions[item]]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (PacketView, list)):
+            return NotImplemented
+
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self) -> str:
+        return "<PacketView packets={0}>".format(len(self))
+
+class Positions:
+    """Sorted list of positions, sliced without copying.
+
+    Args:
+        positions (list): Positions, in increasing order.
+        window (range, optional): Which indices of positions this covers.
+            Defaults to all of them.
+    """
+
+    __slots__ = 'base', 'window'
+
+    def __init__(self, positions: list, window: range = None) -> None:
+        self.base = positions
+        self.window = range(len(positions)) if window is None else window
+
+    def __len__(self) -> int:
+        return len(self.window)
+
+    def __iter__(self):
+        base = self.base
+        return (base[i] for i in self.window)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return Positions(self.base, self.window[item])
+
+        return self.base[self.window[item]]
+
+    def __contains__(self, position: int) -> bool:
+        i = bisect.bisect_left(self.base, position)
+        return i < len(self.base) and self.base[i] == position and i in self.window
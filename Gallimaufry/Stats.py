@@ -0,0 +1,338 @@
+import logging
+logger = logging.getLogger("Gallimaufry.Stats")
+
+import os
+import sys
+import time
+import typing
+from collections import OrderedDict
+
+Hook = typing.Callable[[str, float, float, int], None]
+
+# Object levels, in the order they are reported
+LEVELS = ("USB", "Device", "Endpoint", "handler")
+
+class Stage:
+    """Totals for one stage, or for one object over all its stages.
+
+    Attributes:
+        name (str): The stage.
+        calls (int): How many times it ran.
+        count (int): Items it handled, summed over every run.
+        wall (float): Wall clock seconds, summed over every run.
+        cpu (float): CPU seconds, summed over every run.
+        peak (int): Most memory allocated at once by any run, on top of
+            what was allocated when it started. None unless measuring memory.
+        retained (int): Memory allocated by the runs and still allocated at
+            their end, summed over every run. None unless measuring memory.
+    """
+
+    __slots__ = 'name', 'calls', 'count', 'wall', 'cpu', 'peak', 'retained'
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls = 0
+        self.count = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak = None
+        self.retained = None
+
+    def add(self, wall: float, cpu: float, count: int, memory: tuple = None) -> None:
+        """Add a run, memory being its (peak, retained) if measured."""
+        self.calls += 1
+        self.count += count
+        self.wall += wall
+        self.cpu += cpu
+
+        if memory is not None:
+            peak, retained = memory
+            self.peak = peak if self.peak is None else max(self.peak, peak)
+            self.retained = retained + (self.retained or 0)
+
+    def to_dict(self) -> OrderedDict:
+        """OrderedDict: The totals as plain types."""
+        names = ('calls', 'count', 'wall', 'cpu') + (('peak', 'retained') if self.peak is not None else ())
+        return OrderedDict((name, getattr(self, name)) for name in names)
+
+    def __repr__(self) -> str:
+        return "<Stage {0} calls={1} count={2} wall={3:.6f}>".format(self.name, self.calls, self.count, self.wall)
+
+class Timer:
+    """Times one run of a stage, see Stats.stage. Set count on it if the
+    number of items isn't known up front."""
+
+    __slots__ = 'stats', 'name', 'count', 'owner', 'wall', 'cpu', 'memory'
+
+    def __init__(self, stats: "Stats", name: str, count: int, owner: tuple) -> None:
+        self.stats = stats
+        self.name = name
+        self.count = count
+        self.owner = owner
+
+    def __enter__(self) -> "Timer":
+        if self.stats.memory:
+            import tracemalloc
+            tracemalloc.reset_peak()
+            self.memory = tracemalloc.get_traced_memory()[0]
+
+        self.cpu = cpu_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        wall = time.perf_counter() - self.wall
+        cpu = cpu_time() - self.cpu
+        memory = None
+
+        if self.stats.memory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            memory = (peak - self.memory, current - self.memory)
+
+        self.stats.record(self.name, wall, cpu, self.count, self.owner, memory)
+
+class Stats:
+    """Where the time went while loading a capture, stage by stage.
+
+    Stages are timed as a whole rather than per packet, so keeping these
+    costs next to nothing. Each stage records how often it ran, how many
+    items it handled and the wall clock and CPU time it took:
+
+    * tshark: running tshark. Counts bytes output. The CPU time includes tshark's own.
+    * preprocess: fixing up tshark's json before decoding it. Counts bytes.
+    * decode: turning the backend's output into Packets. Counts packets.
+      When streaming (see Gallimaufry.USB.USB), tshark and enumeration run
+      interleaved with decoding and are included here.
+    * cache.load, cache.store: the on-disk cache. Counts packets.
+    * enumeration: indexing the packets and finding the devices. Counts packets.
+    * strings: resolving each device's string descriptors. Counts strings.
+    * configurations: parsing the configuration descriptors. Counts configurations.
+    * views: picking out the packets of an endpoint, the first time it's
+      decoded. Counts packets.
+    * handlers.<name>: running a class handler, i.e.: handlers.keyboard. Counts packets.
+
+    The same runs are also totalled up by the object they were for (see
+    objects), at each level: the USB capture as a whole, each Device,
+    each Endpoint and each handler's result.
+
+    With memory=True, each run also records how much memory it allocated at
+    its peak and how much it still held at the end, using tracemalloc. That
+    slows everything down a few times over, so is off by default. Stages
+    don't nest, so each one's memory is its own.
+
+    Args:
+        hooks (list, optional): Called with (stage, wall, cpu, count) as
+            each run of a stage finishes, i.e.: to forward the numbers on to
+            a metrics system.
+        memory (bool, optional): Also measure memory. Starts tracemalloc if
+            it isn't already tracing, see stop().
+
+    Example:
+        To see where the time went::
+
+            >> from Gallimaufry.USB import USB
+            >> usb = USB("pcap.pcap")
+            >> print(usb.stats)
+
+        And which stage, and which device, the memory went to::
+
+            >> usb = USB("pcap.pcap", stats=Stats(memory=True))
+            >> print(usb.stats.memory_table())
+
+        Or from the command line::
+
+            $ python -m Gallimaufry.Stats pcap.pcap --json --memory
+    """
+
+    def __init__(self, hooks: typing.Iterable[Hook] = None, memory: bool = False) -> None:
+        self.stages = OrderedDict()
+        self.objects = OrderedDict()
+        self.hooks = list(hooks) if hooks is not None else []
+        self.memory = memory
+
+        # Stages not run for an object of their own are counted against this one
+        self.owner = ("USB", "")
+
+        self.__tracing = False
+        if memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.__tracing = True
+
+    def stop(self) -> None:
+        """Stop measuring memory, and stop tracemalloc if it was started for these stats."""
+        if self.__tracing:
+            import tracemalloc
+            tracemalloc.stop()
+            self.__tracing = False
+
+        self.memory = False
+
+    def stage(self, name: str, count: int = 0, owner: tuple = None) -> Timer:
+        """Time a run of a stage, as a context manager.
+
+        Args:
+            name (str): The stage.
+            count (int, optional): Items handled, if already known.
+            owner (tuple, optional): (level, name) of the object the stage
+                is run for, i.e.: ("Device", "1.2"). Defaults to owner.
+
+        Example:
+            >> with stats.stage("decode") as timer:
+            ..     packets = decode()
+            ..     timer.count = len(packets)
+        """
+        return Timer(self, name, count, owner)
+
+    def record(self, name: str, wall: float, cpu: float, count: int = 0, owner: tuple = None, memory: tuple = None) -> None:
+        """Add a run of a stage that was timed some other way.
+
+        Args:
+            memory (tuple, optional): (peak, retained) bytes, if measured.
+        """
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = Stage(name)
+        stage.add(wall, cpu, count, memory)
+
+        owner = owner if owner is not None else self.owner
+        total = self.objects.get(owner)
+        if total is None:
+            total = self.objects[owner] = Stage(" ".join(part for part in owner if part))
+        total.add(wall, cpu, count, memory)
+
+        for hook in self.hooks:
+            hook(name, wall, cpu, count)
+
+    def __getitem__(self, name: str) -> Stage:
+        return self.stages[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.stages
+
+    def __iter__(self) -> typing.Iterator[Stage]:
+        return iter(self.stages.values())
+
+    @property
+    def wall(self) -> float:
+        """float: Wall clock seconds over every stage."""
+        return sum(stage.wall for stage in self.stages.values())
+
+    @property
+    def cpu(self) -> float:
+        """float: CPU seconds over every stage."""
+        return sum(stage.cpu for stage in self.stages.values())
+
+    def to_dict(self) -> OrderedDict:
+        """OrderedDict: stage -> its totals, as plain types."""
+        return OrderedDict((stage.name, stage.to_dict()) for stage in self.stages.values())
+
+    def to_json(self, **kwargs) -> str:
+        """str: The stages as json. kwargs are passed on to json.dumps."""
+        import json
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def report(self) -> OrderedDict:
+        """The stages and the objects they were run for, as plain types.
+
+        Returns:
+            OrderedDict: stages -> (stage -> totals) and objects -> list of
+                totals, each with its level and name, by level.
+        """
+        objects = []
+
+        for (level, name), total in sorted(self.objects.items(), key=lambda item: LEVELS.index(item[0][0]) if item[0][0] in LEVELS else len(LEVELS)):
+            objects.append(OrderedDict([('level', level), ('name', name)], **total.to_dict()))
+
+        return OrderedDict([('stages', self.to_dict()), ('objects', objects)])
+
+    def memory_table(self) -> str:
+        """str: Peak and retained memory of each stage, then of each object by level."""
+        row = "{0:<32} {1:>12} {2:>14}"
+        lines = [row.format("stage", "peak (MB)", "retained (MB)")]
+
+        def cells(total):
+            if total.peak is None:
+                return "-", "-"
+            return "{0:.2f}".format(total.peak / 1024 / 1024), "{0:.2f}".format(total.retained / 1024 / 1024)
+
+        for stage in self.stages.values():
+            lines.append(row.format(stage.name, *cells(stage)))
+
+        lines.append("")
+        lines.append(row.format("object", "peak (MB)", "retained (MB)"))
+
+        for total in self.report()['objects']:
+            name = "{0} {1}".format(total['level'], total['name']).strip()
+            lines.append(row.format(name, *cells(self.objects[(total['level'], total['name'])])))
+
+        return "\n".join(lines)
+
+    def table(self) -> str:
+        """str: One row per stage, and the total."""
+        lines = ["{0:<24} {1:>6} {2:>12} {3:>10} {4:>10}".format("stage", "calls", "count", "wall (s)", "cpu (s)")]
+
+        for stage in self.stages.values():
+            lines.append("{0:<24} {1:>6} {2:>12} {3:>10.4f} {4:>10.4f}".format(stage.name, stage.calls, stage.count, stage.wall, stage.cpu))
+
+        lines.append("{0:<24} {1:>6} {2:>12} {3:>10.4f} {4:>10.4f}".format("total", "", "", self.wall, self.cpu))
+        return "\n".join(lines)
+
+    def __str__(self) -> str:
+        return self.table()
+
+    def __repr__(self) -> str:
+        return "<Stats stages={0} wall={1:.6f}>".format(len(self.stages), self.wall)
+
+
+def cpu_time() -> float:
+    """float: CPU seconds used by this process and the children it has waited for (i.e.: tshark)."""
+    children = os.times()
+    return time.process_time() + children.children_user + children.children_system
+
+def main(argv: typing.List[str] = None) -> int:
+    import argparse
+    import json
+    from .USB import USB
+
+    parser = argparse.ArgumentParser(prog="python -m Gallimaufry.Stats", description="Show where the time goes while loading a USB capture.")
+    parser.add_argument("pcap", help="The capture to load.")
+    parser.add_argument("--backend", default="auto")
+    parser.add_argument("--stream", action="store_true", help="Decode the backend output as it is produced.")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="Number of processes to parse with.")
+    parser.add_argument("--no-decode", action="store_true", help="Don't run the class handlers (keyboard, mouse, ...).")
+    parser.add_argument("--json", action="store_true", help="Print the stages as json. With --memory, the objects they were for too.")
+    parser.add_argument("--memory", action="store_true", help="Also measure memory per stage and object with tracemalloc (slow).")
+    parser.add_argument("--max-memory", type=float, metavar="MB", help="Load within this much memory, or stop with an error.")
+    args = parser.parse_args(argv)
+
+    stats = Stats(memory=args.memory)
+    max_memory = int(args.max_memory * 1024 * 1024) if args.max_memory is not None else None
+
+    try:
+        usb = USB(args.pcap, backend=args.backend, stream=args.stream, jobs=args.jobs, stats=stats, max_memory=max_memory)
+
+        if not args.no_decode:
+            usb.decode()
+
+    except Exception as e:
+        print("Failed to load {0}: {1}".format(args.pcap, e), file=sys.stderr)
+        return 1
+
+    finally:
+        stats.stop()
+
+    if args.json:
+        print(json.dumps(stats.report(), indent=2) if args.memory else stats.to_json(indent=2))
+    else:
+        print(stats.table())
+        if args.memory:
+            print()
+            print(stats.memory_table())
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
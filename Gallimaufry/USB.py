@@ -2,13 +2,17 @@ import logging
 logger = logging.getLogger("Gallimaufry.USB")
 
 from . import Colorer, settings
+from .Backends import get_backend, parse_parallel
+from .Packet import Packet
+from .PacketList import PacketList
 import typing
 from collections import OrderedDict
 from .Device import Device
+from .Stats import Stats
 
 Devices = typing.List[type(Device)]
-Packets = typing.List[typing.Dict]
-PacketsOut = typing.List[OrderedDict]
+Packets = typing.List[Packet]
+PacketsOut = typing.List[Packet]
 TypeIntOptional = typing.Optional[int]
 
 class USB:
@@ -16,25 +20,72 @@ class USB:
 
     Args:
         pcap (str): Path to a pcap file to parse.
+        backend (str, optional): How to parse the pcap. "tshark" runs tshark
+            over the file, "fields" has tshark extract only the fields this
+            library uses (much cheaper on large captures), "native" reads
+            usbmon and USBPcap captures directly without needing Wireshark
+            installed. Defaults to "auto", which
+            uses tshark when it is installed and native otherwise.
+        stream (bool, optional): Decode the backend output one packet at a
+            time instead of buffering all of it first. Keeps peak memory down
+            on large captures.
+        cache (bool or Gallimaufry.Cache.Cache, optional): Cache the parsed
+            packets on disk so opening the same capture again skips parsing.
+            True uses the default cache directory. Defaults to False.
+        jobs (int, optional): Split the capture into this many chunks and
+            parse them in separate processes. None uses every core.
+            Defaults to 1, parsing in this process. Only the native backend
+            splits captures up, the others parse in one process regardless.
+        packets (list, optional): The packets of the capture, already
+            parsed. The backend isn't run, and the cache not looked in.
+        stats (Gallimaufry.Stats.Stats, optional): Where to record how long
+            each stage of loading and decoding takes, i.e.: to give it hooks.
+            Defaults to a new one, see the stats property.
+        max_memory (int, optional): Bytes loading the capture may use. If
+            loading it as asked looks like it won't fit, the capture is
+            streamed in this process instead (stream=True, jobs=1). It is
+            refused up front if it plainly won't fit even so, and loading
+            stops with an error as soon as it goes over. Only loading is held to it,
+            not decoding or update() later. See Gallimaufry.Budget.Budget.
+            Defaults to None, no limit.
     """
 
-    def __init__(self, pcap) -> None:
+    def __init__(self, pcap, backend: str = "auto", stream: bool = False, cache = False, jobs: TypeIntOptional = 1,
+            packets: Packets = None, stats: Stats = None, max_memory: TypeIntOptional = None) -> None:
+        self.stats = stats
+        self.max_memory = max_memory
+        self.backend = get_backend(backend)
+        self.stream = stream
+        self.cache = cache
+        self.jobs = jobs
+        self.__packets = packets
+        self.__checkpoint = None
+        self.__budget = None
         self.__prechecks__()
 
-        self.pcap_filename = pcap
-        self.devices = []
+        if max_memory is not None:
+            from .Budget import Budget
+            self.__budget = Budget(max_memory, os.path.abspath(pcap))
+            self.stats.hooks.append(self.__budget)
 
-        self._enumerate_devices()
+        try:
+            self.pcap_filename = pcap
+            self.devices = []
+
+            self._enumerate_devices()
+
+        finally:
+            # The budget is for loading, decoding and updating later aren't held to it
+            if self.__budget is not None:
+                self.stats.hooks.remove(self.__budget)
+                self.__budget = None
 
     def _enumerate_devices(self) -> None:
         """Given the pcap loaded, enumerate and setup what devices are in the capture."""
 
-        # Grab the descriptors
-        device_descriptors = (packet for packet in self.pcap if has_device_descriptor(packet))
-
-        # Build out a new device for each
-        for device in device_descriptors:
-            self.devices.append(Device(device, self.pcap))
+        # Build out a new device for each descriptor found while loading
+        for device in self.__device_descriptors:
+            self.devices.append(Device(device, self.pcap, stats=self.stats))
 
 
     def __find_packets_by_field_name(self, field_name: str, field_value, packets: Packets) -> Packets:
@@ -42,13 +93,13 @@ class USB:
         # Not filtering on value
         if field_value == None:
             return [packet for packet in packets if 
-                    any(field_name in packet['_source']['layers'][layer] for layer in packet['_source']['layers'])
+                    any(field_name in layer for layer in packet.layers.values())
                     ]
 
         # Filtering on value
         return [packet for packet in packets if 
-                any(field_name in packet['_source']['layers'][layer] and packet['_source']['layers'][layer][field_name] == field_value
-                    for layer in packet['_source']['layers'])
+                any(field_name in layer and layer[field_name] == field_value
+                    for layer in packet.layers.values())
                 ]
 
     def _find_packets(self, field_name: str = None, field_value = None) -> Packets:
@@ -69,43 +120,137 @@ class USB:
         Makes sure things needed are installed.
         """
 
-        if shutil.which("tshark") == None:
-            raise Exception("tshark not found. Please install it.")
+        if not self.backend.available():
+            raise Exception("{0} backend is not available. Please install tshark or use backend='native'.".format(self.backend.__name__))
 
     def __parse_pcap(self) -> bool:
         """Loads up the pcap for this object.
         
         Returns True on successful load, False otherwise"""
 
-        def determine_endpoint_designator(pcap: str) -> None:
-            """tshark has been changing names of fields... Try to determine what the endpoint designator field is called."""
-            if "usb.endpoint_address" in pcap:
-                settings.usb_endpoint_designator = "usb.endpoint_address"
-            elif "usb.endpoint_number" in pcap:
-                settings.usb_endpoint_designator = "usb.endpoint_number"
+        packets = self.__packets
+        self.__packets = None
+        cached = False
+        streaming = False
+        budget = self.__budget
+
+        self.stats.owner = ("USB", os.path.basename(self.pcap_filename))
+
+        # Fall back to streaming, or refuse, before reading any of it
+        if budget is not None and packets is None:
+            self.stream, self.jobs = budget.plan(self.pcap_filename, self.stream, self.jobs)
+
+        if packets is None and self.cache is not None:
+            with self.stats.stage("cache.load") as timer:
+                packets = self.cache.load(self.pcap_filename, self.backend)
+                cached = packets is not None
+                timer.count = len(packets) if cached else 0
+
+        if packets is None and self.jobs > 1:
+            with self.stats.stage("decode") as timer:
+                packets = parse_parallel(self.backend, self.pcap_filename, self.jobs)
+                timer.count = len(packets)
+
+        elif packets is None:
+            backend = self.backend(self.pcap_filename, stats=self.stats)
+            streaming = self.stream
+
+            if self.backend is get_backend("native"):
+                from .Backends.Native import Checkpoint
+
+                # Note how far we got, so update() can carry on from there
+                self.__checkpoint = Checkpoint()
+                packets = backend.iter_packets(self.__checkpoint) if self.stream else backend.parse(self.__checkpoint)
             else:
-                logger.warn("Unable to dynamically determine endpoint_number designator in pcap. Results may be skewed.")
-
-        def preprocess(pcap: str) -> str:
-            determine_endpoint_designator(pcap)
-
-            # Work around the tshark issue where the json fields are not unique...
-            # For now, just give them each a unique int. Because who cares.
-            bad_words = ["HID DESCRIPTOR","ENDPOINT DESCRIPTOR"]
-            pcap2 = []
-            i = 0
-            for line in pcap.split("\n"):
-                for bad_word in bad_words:
-                    if bad_word in line:
-                        line = line.replace(bad_word, "{0} {1}".format(bad_word, i))
-                        i += 1
-                pcap2.append(line)
-            return '\n'.join(pcap2)
-
-        self.__pcap = json.loads(preprocess(subprocess.check_output(["tshark","-r",self.pcap_filename,"-T","json","-O","usb"]).decode('cp1252')),object_pairs_hook=OrderedDict)
+                packets = backend.iter_packets() if self.stream else backend.parse()
+
+        # Note the device descriptors as they go by so we don't have to rescan
+        self.__pcap = PacketList()
+        self.__device_descriptors = []
+
+        if budget is not None:
+            packets = budget.watch(packets, "decode" if streaming else "enumeration")
+
+        # When streaming, the backend does its work as the packets are pulled through here
+        with self.stats.stage("decode" if streaming else "enumeration") as timer:
+            for packet in packets:
+                self.__pcap.append(packet)
+
+                if has_device_descriptor(packet):
+                    self.__device_descriptors.append(packet)
+
+            timer.count = len(self.__pcap)
+
+        if budget is not None:
+            from .Budget import PACKET_MEMORY
+
+        if self.cache is not None and not cached and budget is not None and not budget.fits(len(self.__pcap) * PACKET_MEMORY):
+            logger.warning("Not caching {0}, pickling it would go over max_memory.".format(self.pcap_filename))
+
+        elif self.cache is not None and not cached:
+            with self.stats.stage("cache.store", len(self.__pcap)):
+                self.cache.store(self.pcap_filename, self.backend, list(self.__pcap))
 
         return True
 
+    def update(self) -> int:
+        """Read the packets appended to the capture since it was last read.
+
+        For captures that are still being written. Only the new packets are
+        read, whichever backend the capture was opened with (they are read
+        natively), and the existing Devices, Endpoints and decoded handler
+        results (i.e.: endpoint.keyboard) are updated in place. New devices
+        are added to devices.
+
+        If the capture wasn't read by the native backend in this process
+        (another backend, the cache, or jobs > 1), the first update reads it
+        once more to find where it left off.
+
+        Returns:
+            int: Number of new packets.
+
+        Example:
+            To keep printing keystrokes as they are captured::
+
+                >> from Gallimaufry.USB import USB
+                >> usb = USB("growing.pcap", backend="native")
+                >> keyboard = usb.devices[1].configurations[0].interfaces[0].endpoints[0].keyboard
+                >> while True:
+                ..     if usb.update():
+                ..         print(keyboard.keystrokes)
+                ..     time.sleep(1)
+        """
+        with self.stats.stage("decode") as timer:
+            packets = get_backend("native")(self.pcap_filename).iter_appended(self.checkpoint)
+
+            if self.checkpoint.frame == 1 and len(self.pcap):
+                # Skip what was read by whatever else parsed the capture
+                packets = itertools.islice(packets, len(self.pcap), None)
+
+            packets = list(packets)
+            timer.count = len(packets)
+
+        if not packets:
+            return 0
+
+        start = len(self.pcap)
+        device_descriptors = []
+
+        with self.stats.stage("enumeration", len(packets)):
+            for packet in packets:
+                self.__pcap.append(packet)
+
+                if has_device_descriptor(packet):
+                    device_descriptors.append(packet)
+
+        for device in self.devices:
+            device.update(start)
+
+        for device in device_descriptors:
+            self.devices.append(Device(device, self.pcap, stats=self.stats))
+
+        return len(self.pcap) - start
+
     def pcap_filter(self, bus_id: TypeIntOptional = None, device_address: TypeIntOptional = None, endpoint_number: TypeIntOptional = None) -> PacketsOut:
         """Return only those packets that match ALL of the input selection.
         
@@ -115,7 +260,7 @@ class USB:
             endpoint_number: The endpoint number to select
 
         Returns:
-            list: A list of OrderedDict packets matching the filter criteria.
+            Gallimaufry.PacketList.PacketList: The packets matching the filter criteria.
 
         Example:
             If you wanted to select only those packets with a bus_id of 1,
@@ -127,19 +272,151 @@ class USB:
                 >> filt = pcap.pcap_filter(bus_id=1,device_address=0,endpoint_number=1)
         """
 
-        pcap = self.pcap
+        return self.pcap.filter(bus_id=bus_id, device_address=device_address, endpoint_number=endpoint_number)
 
-        if bus_id is not None:
-            pcap = [packet for packet in pcap if 'usb' in packet['_source']['layers'] and int(packet['_source']['layers']['usb']['usb.bus_id'],10) == bus_id]
+    def decode(self, handlers: typing.Iterable[str] = None) -> None:
+        """Decode the packets of every endpoint now, rather than on first access.
 
-        if device_address is not None:
-            pcap = [packet for packet in pcap if 'usb' in packet['_source']['layers'] and int(packet['_source']['layers']['usb']['usb.device_address'],10) == device_address]
+        Class handlers (i.e.: the keyboard decoder) otherwise only run when
+        their result is first asked for, such as endpoint.keyboard.
 
-        if endpoint_number is not None:
-            # Remember, the endpoint number is the lower 3 bits of the actual endpoint_number field
-            pcap = [packet for packet in pcap if 'usb' in packet['_source']['layers'] and int(packet['_source']['layers']['usb'][settings.usb_endpoint_designator],16) & 0b111 == endpoint_number]
+        Args:
+            handlers (list, optional): Names of the handlers to run, i.e.:
+                ["keyboard"]. Defaults to all of them.
 
-        return pcap
+        Example:
+            To decode every keyboard up front::
+
+                >> from Gallimaufry.USB import USB
+                >> pcap = USB("pcap.pcap")
+                >> pcap.decode(handlers=["keyboard"])
+        """
+        for device in self.devices:
+            for configuration in device.configurations:
+                for interface in configuration.interfaces:
+                    for endpoint in interface.endpoints:
+                        endpoint.decode(handlers)
+
+    @classmethod
+    async def open(cls, pcap: str, backend: str = "auto", cache = False, stream: bool = False, jobs: TypeIntOptional = 1,
+            max_memory: TypeIntOptional = None) -> "USB":
+        """Parse a capture without blocking the event loop.
+
+        The backend's output is read and decoded incrementally, giving other
+        tasks a turn between each batch of packets. tshark is run with
+        asyncio.create_subprocess_exec, so many captures can be opened at
+        once from one event loop without a thread each. Looking in the cache
+        and enumerating the devices run in the loop's default executor.
+
+        Streaming, parallel and budgeted loads (stream, jobs and max_memory)
+        are loaded just as USB would, all of it in the loop's default
+        executor.
+
+        Args:
+            pcap (str): Path to a pcap file to parse.
+            backend (str, optional): See USB.
+            cache (bool or Gallimaufry.Cache.Cache, optional): See USB.
+            stream (bool, optional): See USB.
+            jobs (int, optional): See USB.
+            max_memory (int, optional): See USB.
+
+        Returns:
+            USB: The parsed capture.
+
+        Example:
+            To open a capture and decode its keyboards::
+
+                >> usb = await USB.open("pcap.pcap")
+                >> async for endpoint, name, result in usb.iter_decoded(["keyboard"]):
+                ..     print(result.keystrokes)
+        """
+        import asyncio
+        import functools
+
+        loop = asyncio.get_running_loop()
+        backend_class = get_backend(backend)
+
+        if not backend_class.available():
+            raise Exception("{0} backend is not available. Please install tshark or use backend='native'.".format(backend_class.__name__))
+
+        pcap = os.path.abspath(pcap)
+        if not os.path.isfile(pcap):
+            raise Exception("PCAP file doesn't exist.")
+
+        if stream or jobs != 1 or max_memory is not None:
+            return await loop.run_in_executor(None, functools.partial(cls, pcap, backend=backend, stream=stream, cache=cache,
+                jobs=jobs, max_memory=max_memory))
+
+        packets = None
+
+        if cache is not False:
+            from .Cache import Cache
+            cache = Cache() if cache is True else cache
+            packets = await loop.run_in_executor(None, cache.load, pcap, backend_class)
+
+            # Already cached, nothing more to store
+            if packets is not None:
+                cache = False
+
+        if packets is None:
+            packets = [packet async for packet in backend_class(pcap).aiter_packets()]
+
+        # Enumeration, and storing to the cache, are plain CPU work
+        return await loop.run_in_executor(None, functools.partial(cls, pcap, backend=backend, cache=cache, packets=packets))
+
+    async def decode_async(self, handlers: typing.Iterable[str] = None) -> None:
+        """Like decode, but gives other tasks a turn between each endpoint.
+
+        Args:
+            handlers (list, optional): Names of the handlers to run, i.e.:
+                ["keyboard"]. Defaults to all of them.
+        """
+        async for _ in self.iter_decoded(handlers):
+            pass
+
+    async def iter_decoded(self, handlers: typing.Iterable[str] = None):
+        """Run the class handlers, yielding each result as it is decoded.
+
+        Each handler runs in the event loop's default executor, so the loop
+        carries on while it decodes.
+
+        Args:
+            handlers (list, optional): Names of the handlers to run, i.e.:
+                ["keyboard"]. Defaults to all of them.
+
+        Yields:
+            tuple: (Gallimaufry.Endpoint.Endpoint, handler name, result)
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+
+        for device in self.devices:
+            for configuration in device.configurations:
+                for interface in configuration.interfaces:
+                    for endpoint in interface.endpoints:
+                        for name in list(endpoint.handlers) if handlers is None else handlers:
+                            result = await loop.run_in_executor(None, endpoint._decoded, name)
+
+                            if result is not None:
+                                yield endpoint, name, result
+
+    @staticmethod
+    def batch(paths: typing.Iterable[str], jobs: TypeIntOptional = None, backend: str = "auto") -> typing.Iterator["Result"]:
+        """Analyse many captures at once, in a pool of processes.
+
+        See Gallimaufry.Batch.batch.
+
+        Args:
+            paths (iterable): Captures to analyse.
+            jobs (int, optional): Number of processes. Defaults to one per core.
+            backend (str, optional): How to parse the captures.
+
+        Yields:
+            Gallimaufry.Batch.Result: One per capture, as each finishes.
+        """
+        from .Batch import batch
+        return batch(paths, jobs=jobs, backend=backend)
 
     def __repr__(self) -> str:
         return "<USB packets={0}>".format(len(self.pcap))
@@ -165,8 +442,8 @@ class USB:
         return summary.strip()
 
     @property
-    def pcap(self) -> list:
-        """list: list of dictionaries describing the packets of this pcap."""
+    def pcap(self) -> PacketList:
+        """Gallimaufry.PacketList.PacketList: list of dictionaries describing the packets of this pcap."""
         return self.__pcap
 
 
@@ -185,6 +462,78 @@ class USB:
         # Load it up!
         self.__parse_pcap()
 
+    @property
+    def stats(self) -> Stats:
+        """Gallimaufry.Stats.Stats: How long each stage of loading and decoding this capture took.
+
+        Handlers are only timed once they run, see decode.
+        """
+        return self.__stats
+
+    @stats.setter
+    def stats(self, stats: Stats) -> None:
+        self.__stats = stats if stats is not None else Stats()
+
+    @property
+    def max_memory(self) -> TypeIntOptional:
+        """int: Bytes loading the capture may use, or None for no limit."""
+        return self.__max_memory
+
+    @max_memory.setter
+    def max_memory(self, max_memory: TypeIntOptional) -> None:
+        self.__max_memory = max_memory
+
+    @property
+    def checkpoint(self) -> "Checkpoint":
+        """Gallimaufry.Backends.Native.Checkpoint: How far into the capture update() has read."""
+        if self.__checkpoint is None:
+            from .Backends.Native import Checkpoint
+            self.__checkpoint = Checkpoint()
+
+        return self.__checkpoint
+
+    @property
+    def backend(self) -> type:
+        """type: The backend class used to parse the pcap (see Gallimaufry.Backends)."""
+        return self.__backend
+
+    @backend.setter
+    def backend(self, backend: type) -> None:
+        self.__backend = backend
+
+    @property
+    def cache(self) -> typing.Optional["Cache"]:
+        """Gallimaufry.Cache.Cache: The on-disk cache used for this pcap, or None."""
+        return self.__cache
+
+    @cache.setter
+    def cache(self, cache) -> None:
+        if cache is True:
+            # Only imported when caching, it pulls in hashlib/pickle/tempfile
+            from .Cache import Cache
+            cache = Cache()
+        elif cache is False:
+            cache = None
+        self.__cache = cache
+
+    @property
+    def stream(self) -> bool:
+        """bool: Are packets decoded one at a time as the backend produces them?"""
+        return self.__stream
+
+    @stream.setter
+    def stream(self, stream: bool) -> None:
+        self.__stream = stream
+
+    @property
+    def jobs(self) -> int:
+        """int: Number of processes the capture is parsed with."""
+        return self.__jobs
+
+    @jobs.setter
+    def jobs(self, jobs: TypeIntOptional) -> None:
+        self.__jobs = jobs if jobs is not None else os.cpu_count() or 1
+
     @property
     def devices(self) -> Devices:
         """list: The USB devices discovered (USB.Device.Device)."""
@@ -194,8 +543,6 @@ class USB:
     def devices(self, devices: Devices) -> None:
         self.__devices = devices
 
+import itertools
 import os
-import shutil
-import subprocess
-import json
 from .helpers import *
@@ -1,86 +1,224 @@
+import logging
 import os
 import re
+import threading
+import typing
+
+logger = logging.getLogger("Gallimaufry.helpers")
 
 here = os.path.dirname(os.path.realpath(__file__))
 
 class Bits(object):
-    """Array index are INCLUSIVE. I.e.: bits[0:2] includes bits 0,1,2."""
+    """Array index are INCLUSIVE. I.e.: bits[0:2] includes bits 0,1,2.
+
+    Note:
+        For decoding reports, declare a Gallimaufry.Bitfield.Bitfield instead.
+    """
 
     def __init__(self, value, size):
 
         assert type(value) is int
         assert type(size) is int
 
-        self._fmt = "0{size}b".format(size=size)
-        self.value = format(value, self._fmt)[::-1]
+        self.value = value & ((1 << size) - 1)
         self.size = size
 
     def __getitem__(self, key):
 
         if type(key) is int:
-            return bool(int(self.value[key],2))
+            return bool((self.value >> key) & 1)
 
         # Slice
-        s = slice(key.start, key.stop+1, key.step)
-        return int(self.value[s][::-1],2)
+        return (self.value >> key.start) & ((1 << (key.stop - key.start + 1)) - 1)
+
+usb_ids_lock = threading.Lock()
+usb_ids_path = os.path.join(here,"usb.ids")
+usb_ids_index = None
+
+# Where to save the parsed index between runs. None is the cache directory
+# (see Gallimaufry.Cache.Cache.default_directory), False keeps it in memory only.
+usb_ids_index_directory = None
 
 def read_usb_ids():
-    with open(os.path.join(here,"usb.ids"),"rb") as f:
+    with open(usb_ids_path,"rb") as f:
         ids = f.read().decode('cp1252')
     return ids
 
-def resolve_vendor_id(vendor_id: int) -> str:
-    ids = read_usb_ids()
+def parse_usb_ids(ids: str) -> dict:
+    """Parse the text of a usb.ids file.
+
+    Returns:
+        dict: vendor id -> (vendor name, {product id: product name})
+    """
+    index = {}
+    products = None
+
+    for line in ids.split("\n"):
+        vendor = usb_ids_vendor.match(line)
+        if vendor is not None:
+            vendor_id = int(vendor.group(1),16)
+
+            if vendor_id in index:
+                logger.debug("Vendor {0:04x} is listed more than once in usb.ids. Sticking with the first.".format(vendor_id))
+                products = None
+                continue
+
+            products = {}
+            index[vendor_id] = (vendor.group(2).strip(), products)
+            continue
+
+        # Products directly follow their vendor
+        if not line.startswith("\t"):
+            products = None
+            continue
+
+        product = usb_ids_product.match(line)
+        if products is not None and product is not None:
+            products.setdefault(int(product.group(1),16), product.group(2).strip())
+
+    return index
+
+def usb_ids_index_path() -> typing.Optional[str]:
+    """str: Where the parsed index for the current usb.ids is saved, or None if it isn't."""
+    if usb_ids_index_directory is False:
+        return None
+
+    directory = usb_ids_index_directory
+
+    if directory is None:
+        from .Cache import Cache
+        directory = Cache.default_directory()
+
+    import hashlib
+    name = hashlib.sha256(os.path.abspath(usb_ids_path).encode()).hexdigest()[:16]
+    return os.path.join(directory, "usb.ids.{0}.index".format(name))
+
+def set_usb_ids_index_directory(directory: typing.Union[str, bool, None]) -> None:
+    """Choose where the parsed usb.ids index is saved, to skip parsing it again next run.
+
+    By default it is saved in the cache directory, $GALLIMAUFRY_CACHE_DIR or
+    ~/.cache/gallimaufry. The saved index is a pickle, so only use a
+    directory you trust.
+
+    Args:
+        directory (str): Where to save it. None for the cache directory,
+            False to only keep it in memory (i.e.: on a read-only filesystem).
+    """
+    global usb_ids_index_directory
+    usb_ids_index_directory = os.path.abspath(directory) if isinstance(directory, str) else directory
+
+def load_usb_ids() -> dict:
+    """Returns the parsed usb.ids index, building it on first use.
+
+    The index is also saved (see set_usb_ids_index_directory), and reused
+    by later runs until usb.ids changes.
+    """
+    global usb_ids_index
 
-    vendors = re.findall("\n{0:04x} +(.*)?\n".format(vendor_id),ids)
+    if usb_ids_index is not None:
+        return usb_ids_index
 
-    if len(vendors) > 1:
-        print("Matched on multiple vendors?? Please report this (https://github.com/Owlz/usb_pcap). Sticking with the first vendor.")
-        vendors = [vendors[0]]
+    with usb_ids_lock:
+        if usb_ids_index is not None:
+            return usb_ids_index
 
-    if len(vendors) == 0:
+        index_path = usb_ids_index_path()
+
+        if index_path is None:
+            usb_ids_index = parse_usb_ids(read_usb_ids())
+        else:
+            usb_ids_index = load_saved_usb_ids(index_path)
+
+    return usb_ids_index
+
+def load_saved_usb_ids(index_path: str) -> dict:
+    """Load the usb.ids index saved at index_path, parsing usb.ids and saving it there if
+    it is missing or was built from a different usb.ids (by path, size or mtime)."""
+    # Only needed when saving the index, keep them out of "import Gallimaufry"
+    import pickle
+    import tempfile
+
+    stat = os.stat(usb_ids_path)
+    fingerprint = (os.path.abspath(usb_ids_path), stat.st_size, stat.st_mtime_ns)
+
+    try:
+        with open(index_path, "rb") as f:
+            saved_fingerprint, index = pickle.load(f)
+        if saved_fingerprint == fingerprint:
+            return index
+    except Exception:
+        pass
+
+    index = parse_usb_ids(read_usb_ids())
+
+    try:
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(index_path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump((fingerprint, index), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, index_path)
+    except OSError as e:
+        logger.debug("Unable to save usb.ids index: {0}".format(e))
+
+    return index
+
+def set_usb_ids(path: str) -> None:
+    """Use a different (i.e.: newer) usb.ids file for name resolution.
+
+    Args:
+        path (str): Path to the usb.ids file, such as one downloaded from
+            http://www.linux-usb.org/usb.ids
+    """
+    global usb_ids_path, usb_ids_index
+
+    if not os.path.isfile(path):
+        raise Exception("usb.ids file doesn't exist.")
+
+    with usb_ids_lock:
+        usb_ids_path = os.path.abspath(path)
+        usb_ids_index = None
+
+def resolve_vendor_id(vendor_id: int) -> str:
+    vendor = load_usb_ids().get(vendor_id)
+
+    if vendor is None:
         return "Unknown..."
 
-    return vendors[0]
+    return vendor[0]
 
 def resolve_product_id(vendor_id: int, product_id: int) -> str:
-    ids = read_usb_ids()
-    
-    if "\n{0:04x}".format(vendor_id) not in ids:
+    vendor = load_usb_ids().get(vendor_id)
+
+    if vendor is None:
         return "Unknown..."
 
-    # Need to find the product id that is part of this vendor
-    products = ids.split("\n{0:04x}".format(vendor_id))[1]
-    products = products.split("\n")[1:]
+    return vendor[1].get(product_id, "Unknown...")
 
-    for product in products:
-        if not product.startswith("\t"):
-            return "Unknown..."
-        
-        if product.startswith("\t{0:04x}".format(product_id)):
-            return product.split("\t{0:04x}".format(product_id))[1].strip()
-    
-    raise Exception("How did I get here?!")
+usb_ids_vendor = re.compile("([0-9a-f]{4}) +(.*)$")
+usb_ids_product = re.compile("\t([0-9a-f]{4}) +(.*)$")
 
 #
 # Does it have the field?
 # 
 
+# Only descriptor frames keep their layers (Packet.raw_layers), so anything
+# without them can be skipped without looking any further.
+
 def has_device_descriptor(packet) -> bool:
-    return any(True for layer in packet['_source']['layers'].values() if 'usb.bDescriptorType' in layer and int(layer['usb.bDescriptorType'],16) == 1 and 'usb.bmRequestType' not in layer)
+    return packet.raw_layers is not None and any(True for layer in packet.raw_layers.values() if 'usb.bDescriptorType' in layer and int(layer['usb.bDescriptorType'],16) == 1 and 'usb.bmRequestType' not in layer)
 
 def has_configuration_descriptor(packet) -> bool:
-    return any(True for layer in packet['_source']['layers'].values() if 'usb.bDescriptorType' in layer and int(layer['usb.bDescriptorType'],16) == 2)
+    return packet.raw_layers is not None and any(True for layer in packet.raw_layers.values() if 'usb.bDescriptorType' in layer and int(layer['usb.bDescriptorType'],16) == 2)
 
 def has_string_descriptor(packet) -> bool:
-    return any(True for layer in packet['_source']['layers'].values() if 'usb.bDescriptorType' in layer and int(layer['usb.bDescriptorType'],16) == 3 and 'usb.bString' in layer)
+    return packet.raw_layers is not None and any(True for layer in packet.raw_layers.values() if 'usb.bDescriptorType' in layer and int(layer['usb.bDescriptorType'],16) == 3 and 'usb.bString' in layer)
 
 def has_endpoint_descriptor(packet) -> bool:
-    return any(True for layer in packet['_source']['layers'].values() if 'usb.bDescriptorType' in layer and int(layer['usb.bDescriptorType'],16) == 4)
+    return packet.raw_layers is not None and any(True for layer in packet.raw_layers.values() if 'usb.bDescriptorType' in layer and int(layer['usb.bDescriptorType'],16) == 4)
 
 #
 # Get the fields (assumes we know they exist)
 #
 
 def get_configuration_descriptor(packet):
-    return next(layer for layer in packet['_source']['layers'].values() if 'usb.bDescriptorType' in layer and int(layer['usb.bDescriptorType'],16) == 2)
+    return next(layer for layer in packet.layers.values() if 'usb.bDescriptorType' in layer and int(layer['usb.bDescriptorType'],16) == 2)
@@ -30,9 +30,10 @@ setup(
         'Environment :: Console'
     ],
     extras_require={
+        'plot': ['matplotlib'],
         'dev': ['six','ipython','twine','pytest','python-coveralls','coverage','pytest-cov','pytest-xdist','sphinxcontrib-napoleon', 'sphinx_rtd_theme','sphinx-autodoc-typehints'],
     },
-    install_requires=["matplotlib"],
+    install_requires=["numpy"],
     keywords='usb pcap parse',
     packages=find_packages(exclude=['contrib', 'docs', 'tests','lib','examples']),
     data_files=[('Gallimaufry', ['Gallimaufry/usb.ids'])],
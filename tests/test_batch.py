@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+import os
+import pickle
+import Gallimaufry.Batch
+from Gallimaufry.Batch import Result, analyse, find_captures, main
+from Gallimaufry.USB import USB
+
+here = os.path.dirname(os.path.realpath(__file__))
+
+def crashing_analyse(path, backend="auto"):
+    if path.endswith("crash.pcap"):
+        os._exit(1)
+    return analyse(path, backend)
+
+def test_batch():
+    keyboards = os.path.join(here, "examples", "keyboards")
+    paths = find_captures([keyboards]) + [os.path.join(keyboards, "missing.pcap")]
+    assert len(paths) == 4
+
+    results = {result.path: result for result in USB.batch(paths, jobs=2, backend="native")}
+    assert set(results) == set(paths)
+
+    missing = results[paths[-1]]
+    assert not missing.ok
+    assert "doesn't exist" in missing.error
+    assert "Traceback" in missing.traceback
+
+    csaw = results[os.path.join(keyboards, "csaw_2012_net300.pcap")]
+    assert csaw.ok
+    assert csaw.packets == 2844
+    assert [(d['bus_id'], d['device_address']) for d in csaw.devices] == [(2, 0), (2, 26)]
+    assert csaw.keyboards[0]['keystrokes'].startswith('[RIGHT_GUI]rxterm -geometry 12x1+0+0\necho k\n')
+    assert csaw.summary.startswith("PCAP: ")
+
+    hackit = results[os.path.join(keyboards, "hackit_2017_foren100.pcap")]
+    assert 'flag{k3yb0ard_sn4ke_2.0}' in hackit.keyboards[0]['interpreted']
+
+    # Nothing but plain data comes back
+    assert pickle.loads(pickle.dumps(csaw)).to_dict() == csaw.to_dict()
+
+def test_batch_crash(tmpdir, monkeypatch):
+    crash = str(tmpdir.join("crash.pcap"))
+    open(crash, "wb").close()
+    hackit = os.path.join(here, "examples", "keyboards", "hackit_2017_foren100.pcap")
+
+    monkeypatch.setattr(Gallimaufry.Batch, "analyse", crashing_analyse)
+    results = {result.path: result for result in USB.batch([crash, hackit, hackit], jobs=2, backend="native")}
+
+    assert "died" in results[crash].error
+    assert results[hackit].ok
+
+def test_batch_cli(capsys):
+    assert main(["--jobs", "1", "--backend", "native", os.path.join(here, "examples", "keyboards", "hackit_2017_foren100.pcap")]) == 0
+    assert "835 packets, 1 devices" in capsys.readouterr().out
+
+    assert main(["--json", "--backend", "native", "missing.pcap"]) == 1
+    assert '"error": "Exception: PCAP file doesn\'t exist."' in capsys.readouterr().out
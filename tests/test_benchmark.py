@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+import copy
+import json
+from Gallimaufry.Benchmark import Benchmark, main
+
+def test_benchmark(tmpdir):
+    benchmark = Benchmark(sizes=[200, 20000], backend="native", devices=2, endpoints=2)
+    results = benchmark.run()
+
+    assert results['backend'] == "native"
+    assert [run['packets'] for run in results['results']] == [200, 20000]
+
+    for run in results['results']:
+        # The stages are those USB records while loading and decoding
+        assert list(run['stages'])[:4] == ["decode", "enumeration", "strings", "configurations"]
+        assert any(stage.startswith("handlers.") for stage in run['stages'])
+        assert all(stage['wall'] >= 0 and stage['peak'] >= 0 for stage in run['stages'].values())
+        assert run['stages']['decode']['count'] == run['packets']
+        assert run['time'] == sum(stage['wall'] for stage in run['stages'].values())
+
+    # Reading the capture must take memory proportional to it. The sizes are
+    # far enough apart that allocator noise can't reorder them.
+    assert results['results'][1]['stages']['decode']['peak'] > 10 * results['results'][0]['stages']['decode']['peak']
+
+    fname = str(tmpdir.join("results.json"))
+    Benchmark.save(results, fname)
+    assert Benchmark.load(fname) == json.loads(json.dumps(results))
+
+    assert Benchmark.compare(results, results) == []
+    assert "enumeration" in Benchmark.table(results)
+
+def test_benchmark_compare():
+    stages = {"decode": {"wall": 1.0, "peak": 10*1024*1024}, "handlers.keyboard": {"wall": 0.001, "peak": 0}}
+    baseline = {"results": [{"packets": 1000, "stages": stages}]}
+
+    results = copy.deepcopy(baseline)
+    results['results'][0]['stages']['decode']['wall'] = 2.0
+    results['results'][0]['stages']['handlers.keyboard']['wall'] = 0.003
+    results['results'].append({"packets": 5000, "stages": stages})
+
+    # Tiny stages tripling is noise, unmatched sizes are skipped
+    regressions = Benchmark.compare(results, baseline)
+    assert len(regressions) == 1
+    assert "decode wall" in regressions[0]
+
+    results['results'][0]['stages']['decode']['peak'] = 30*1024*1024
+    assert len(Benchmark.compare(results, baseline)) == 2
+    assert len(Benchmark.compare(results, baseline, tolerance=4)) == 0
+
+def test_benchmark_cli(tmpdir, capsys):
+    fname = str(tmpdir.join("results.json"))
+    assert main(["--sizes", "200", "--backend", "native", "--no-memory", "--output", fname]) == 0
+    assert "packets" in capsys.readouterr().out
+
+    # Pretend decoding used to be instant
+    baseline = Benchmark.load(fname)
+    baseline['results'][0]['stages']['decode']['wall'] = 0
+    Benchmark.save(baseline, fname)
+
+    assert main(["--sizes", "200", "--backend", "native", "--no-memory", "--baseline", fname, "--min-time", "0"]) == 1
+    assert "REGRESSION" in capsys.readouterr().out
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+import os
+import numpy
+from collections import OrderedDict
+from Gallimaufry.Bitfield import Bitfield
+from Gallimaufry.helpers import Bits
+
+fields = OrderedDict([
+    ('first',  (0, 8)),
+    ('flag',   (9, 1)),
+    ('nibble', (12, 4)),
+    ('across', (14, 6)),
+    ('word',   (20, 16)),
+    ('wide',   (33, 40)),
+    ])
+
+def test_bitfield():
+    reports = [os.urandom(10) for _ in range(500)]
+    array = numpy.frombuffer(b"".join(reports), dtype=numpy.uint8).reshape(-1, 10)
+
+    for layout in (Bitfield(fields), Bitfield(fields, tables=True)):
+        decoded = layout.decode(array)
+
+        for report, entry in zip(reports, decoded):
+            value = int.from_bytes(report, 'little')
+            expected = OrderedDict((name, (value >> offset) & ((1 << width) - 1)) for name, (offset, width) in fields.items())
+            expected['flag'] = bool(expected['flag'])
+
+            assert layout.extract(value) == expected
+            assert layout.extract(report) == expected
+            assert layout.get(report, 'word') == expected['word']
+            assert entry.item() == tuple(expected.values())
+
+        assert layout.decode(reports[0]).item(0) == tuple(layout.extract(reports[0]).values())
+
+    assert Bitfield(fields).size == 10
+    assert set(Bitfield(fields, tables=True).lookup) == {'first', 'flag', 'nibble'}
+
+def test_bits():
+    bits = Bits(0b10110100, 8)
+    assert [bits[i] for i in range(8)] == [False, False, True, False, True, True, False, True]
+    assert bits[0:3] == 0b0100
+    assert bits[2:7] == 0b101101
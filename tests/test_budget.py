@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+import os
+import pytest
+from Gallimaufry.USB import USB
+from Gallimaufry.Budget import Budget, PACKET_MEMORY, BUFFERED
+from Gallimaufry.Stats import Stats
+from Gallimaufry.Backends.Native import count_frames
+
+here = os.path.dirname(os.path.realpath(__file__))
+keyboard = os.path.join(here,"examples","keyboards","csaw_2012_net300.pcap")
+
+def test_estimate():
+    assert count_frames(keyboard) == 2844
+
+    budget = Budget(1024**3)
+    assert budget.estimate(keyboard) == 2844 * PACKET_MEMORY + os.path.getsize(keyboard)
+
+    with pytest.raises(Exception, match="would need about"):
+        Budget(1024).estimate(keyboard)
+
+def test_check():
+    budget = Budget(1024)
+    budget.check("nothing")
+
+    hog = b"\x01" * (16 * 1024**2)
+    with pytest.raises(Exception, match="over max_memory during decode"):
+        list(budget.watch(range(10), "decode", every=5))
+    del hog
+
+def test_max_memory():
+    with pytest.raises(Exception, match="max_memory"):
+        USB(keyboard, backend="native", max_memory=1024)
+
+    # Plenty of room, loaded as asked
+    pcap = USB(keyboard, backend="native", jobs=4, max_memory=1024**3)
+    assert not pcap.stream
+    assert pcap.jobs == 4
+    assert len(pcap.pcap) == 2844
+
+def test_max_memory_streams(monkeypatch):
+    estimate = Budget(1024**3).estimate(keyboard)
+
+    # Too little to load it all at once, enough to stream it
+    budget = Budget(estimate * BUFFERED - 1)
+    assert budget.plan(keyboard, stream=False, jobs=4) == (True, 1)
+    assert budget.plan(keyboard, stream=True, jobs=1) == (True, 1)
+    assert Budget(estimate * BUFFERED).plan(keyboard, stream=False, jobs=4) == (False, 4)
+
+    with pytest.raises(Exception, match="would need about"):
+        Budget(estimate - 1).plan(keyboard, stream=False, jobs=1)
+
+    # Only the plan is under test here, not how much this process happens to use
+    monkeypatch.setattr(Budget, "check", lambda self, stage: None)
+    pcap = USB(keyboard, backend="native", jobs=4, max_memory=estimate * BUFFERED - 1)
+    assert pcap.stream
+    assert pcap.jobs == 1
+    assert len(pcap.pcap) == 2844
+    assert pcap.devices[1].configurations[0].interfaces[0].endpoints[0].keyboard.keystrokes
+
+def test_max_memory_only_while_loading(monkeypatch):
+    stats = Stats()
+    pcap = USB(keyboard, backend="native", stats=stats, max_memory=1024**3)
+    assert stats.hooks == []
+
+    # Decoding afterwards isn't held to the budget
+    monkeypatch.setattr(Budget, "check", lambda self, stage: pytest.fail("checked the budget during " + stage))
+    pcap.decode(handlers=["keyboard"])
+    assert "handlers.keyboard" in stats
+
+def test_max_memory_shared_stats():
+    seen = []
+    stats = Stats(hooks=[lambda *args: seen.append(args[0])])
+
+    for _ in range(2):
+        pcap = USB(keyboard, backend="native", stats=stats, max_memory=1024**3)
+        assert len(stats.hooks) == 1
+
+    assert stats["decode"].calls == 2
+    pcap.decode(handlers=["keyboard"])
+    assert seen[-1] == "handlers.keyboard"
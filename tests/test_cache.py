@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+import os
+from Gallimaufry.USB import USB
+from Gallimaufry.Cache import Cache
+
+here = os.path.dirname(os.path.realpath(__file__))
+
+pcap_file_name = os.path.join(here,"examples","keyboards","hackit_2017_foren100.pcap")
+
+def test_cache(tmpdir):
+    cache = Cache(str(tmpdir))
+
+    pcap = USB(pcap_file_name, backend="native", cache=cache)
+    assert len(cache.entries) == 1
+
+    cached = USB(pcap_file_name, backend="native", cache=cache)
+    assert cached.pcap == pcap.pcap
+    assert cached.summary == pcap.summary
+
+    cache.invalidate(pcap_file_name)
+    assert cache.entries == []
+
+def test_cache_eviction(tmpdir):
+    cache = Cache(str(tmpdir))
+    USB(pcap_file_name, backend="native", cache=cache)
+
+    cache.max_size = cache.size - 1
+    cache.evict()
+    assert cache.entries == []
+
+def test_cache_hashes_once(tmpdir, monkeypatch):
+    hashed = []
+    hash_file = Cache.hash_file
+    monkeypatch.setattr(Cache, "hash_file", staticmethod(lambda path: hashed.append(path) or hash_file(path)))
+
+    cache = Cache(str(tmpdir))
+    USB(pcap_file_name, backend="native", cache=cache)
+    assert len(cache.entries) == 1
+    assert hashed == [pcap_file_name]
+
+    # A changed capture is hashed again
+    capture = tmpdir.join("capture.pcap")
+    capture.write_binary(open(pcap_file_name, "rb").read())
+    cache.key(str(capture))
+    capture.write_binary(open(pcap_file_name, "rb").read()[:-1])
+    cache.key(str(capture))
+    assert len(hashed) == 3
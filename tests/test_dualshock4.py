@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+
+import os
+from Gallimaufry.Packet import Packet
+from Gallimaufry.Classes.DualShock4 import DualShock4, DualShock4Action
+
+def test_dualshock4():
+    reports = [os.urandom(64) for _ in range(200)]
+    ds4 = DualShock4([Packet(i, data=data) for i, data in enumerate(reports)] + [Packet(200)])
+
+    assert len(ds4.actions) == 200
+    assert len(ds4.actions[10:20]) == 10
+
+    for data, action in zip(reports, ds4.actions):
+        assert isinstance(action, DualShock4Action)
+        assert (action.report_id, action.l_x_axis, action.l_y_axis, action.r_x_axis, action.r_y_axis) == tuple(data[:5])
+
+        assert action.button_triangle == bool(data[5] >> 7 & 1)
+        assert action.button_circle == bool(data[5] >> 6 & 1)
+        assert action.button_x == bool(data[5] >> 5 & 1)
+        assert action.button_square == bool(data[5] >> 4 & 1)
+        assert action.dpad == data[5] & 0xf
+
+        assert [action.button_l1, action.button_r1, action.button_l2, action.button_r2,
+                action.button_share, action.button_options, action.button_l3, action.button_r3] == [bool(data[6] >> i & 1) for i in range(8)]
+
+        assert action.counter == data[7] >> 2
+        assert action.button_tpad_click == bool(data[7] >> 1 & 1)
+        assert action.button_ps == bool(data[7] & 1)
+
+        assert (action.l2_pressure, action.r2_pressure, action.battery) == (data[8], data[9], data[12])
+
+    assert ds4.reports['l_x_axis'].tolist() == [data[1] for data in reports]
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+import random
+from Gallimaufry.Classes.HID.Editor import Editor, GapBuffer
+
+def reference(keys):
+    # Plain list of strings, the slow and obvious way
+    lines, row, col, goal = [""], 0, 0, None
+
+    for key in keys:
+        line = lines[row]
+
+        if key in ("[Up Arrow]", "[Down Arrow]"):
+            goal = col if goal is None else goal
+            row = max(row - 1, 0) if key == "[Up Arrow]" else min(row + 1, len(lines) - 1)
+            col = min(goal, len(lines[row]))
+            continue
+
+        goal = None
+
+        if key == "\n":
+            lines[row:row+1] = [line[:col], line[col:]]
+            row, col = row + 1, 0
+        elif key == "[Left Arrow]":
+            col = max(col - 1, 0)
+        elif key == "[Right Arrow]":
+            col = min(col + 1, len(line))
+        elif key == "[Home]":
+            col = 0
+        elif key == "[End]":
+            col = len(line)
+        elif key == "[DELETE]":
+            if col > 0:
+                lines[row] = line[:col-1] + line[col:]
+                col -= 1
+            elif row > 0:
+                col = len(lines[row-1])
+                lines[row-1:row+1] = [lines[row-1] + line]
+                row -= 1
+        elif key == "[Delete Fwd]":
+            if col < len(line):
+                lines[row] = line[:col] + line[col+1:]
+            elif row + 1 < len(lines):
+                lines[row:row+2] = [line + lines[row+1]]
+        elif key != "\r":
+            lines[row] = line[:col] + key + line[col:]
+            col += 1
+
+    return "\n".join(lines)
+
+def test_editor():
+    rng = random.Random(0)
+    special = ["\n", "\r", "[Up Arrow]", "[Down Arrow]", "[Left Arrow]", "[Right Arrow]", "[Home]", "[End]", "[DELETE]", "[Delete Fwd]"]
+    keys = [rng.choice("abc") if rng.random() < 0.6 else rng.choice(special) for _ in range(5000)]
+
+    for i in range(0, len(keys), 500):
+        assert Editor().replay(keys[:i]).text == reference(keys[:i])
+
+    editor = Editor()
+    for key in "hello\nworld":
+        editor.feed(key)
+    editor.replay(["[Up Arrow]", "[End]", "!", "[Home]", "[Delete Fwd]", "H", "[Down Arrow]", "[Home]", "[DELETE]", "[F1]"])
+    assert editor.text == "Hello![F1]world"
+
+def test_gap_buffer():
+    buffer = GapBuffer("abcdef")
+    buffer.insert(2, "X")
+    assert list(buffer) == list("abXcdef")
+    assert buffer.pop(5) == "e"
+    assert [buffer[i] for i in range(len(buffer))] == list("abXcdf")
+    tail = buffer.split(3)
+    assert list(buffer) == list("abX") and list(tail) == list("cdf")
+    buffer.extend(tail)
+    assert list(buffer) == list("abXcdf")
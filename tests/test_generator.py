@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+import os
+import pytest
+from Gallimaufry.USB import USB
+from Gallimaufry.Generator import Generator, main
+
+@pytest.mark.parametrize("format", ["pcap", "pcapng"])
+@pytest.mark.parametrize("linktype", [189, 220])
+def test_generator(tmpdir, format, linktype):
+    generator = Generator(buses=2, devices=2, hubs=1, configurations=2, endpoints=3, strings=4, reports=120, linktype=linktype)
+    fname = str(tmpdir.join("generated." + format))
+
+    count = generator.write(fname, format=format)
+    assert count == generator.packet_count
+
+    pcap = USB(fname, backend="native")
+    assert len(pcap.pcap) == count
+
+    # Root hub + hub + 2 devices per bus
+    assert [(d.bus_id, d.device_address) for d in pcap.devices] == [(bus, address) for bus in (1, 2) for address in (1, 2, 3, 4)]
+    assert [d.idVendor for d in pcap.devices if d.bus_id == 1] == [0x1d6b, 0x1d6b, 0x046d, 0x046d]
+
+    device = pcap.devices[2]
+    assert device.string_descriptors == {1: 'Manufacturer 3', 2: 'Product 3', 3: '00010003', 4: 'String 4'}
+    assert len(device.configurations) == 2
+
+    keyboard, vendor = device.configurations[0].interfaces
+    assert [e.bEndpointAddress for e in vendor.endpoints] == [0x82, 0x03]
+    assert [e.transfer_type_str for e in vendor.endpoints] == ["Bulk"] * 2
+
+    # 120 transfers round robin over 4 devices * 3 endpoints
+    endpoint = keyboard.endpoints[0]
+    assert len(endpoint.pcap) == 20
+    assert len(endpoint.keyboard.keystrokes) == 5
+
+    # Same seed, same capture
+    other = str(tmpdir.join("other." + format))
+    generator.write(other, format=format)
+    with open(fname, "rb") as f, open(other, "rb") as g:
+        assert f.read() == g.read()
+
+def test_generator_cli(tmpdir, capsys):
+    fname = str(tmpdir.join("cli.pcap"))
+    main(["--devices", "1", "--reports", "10", fname])
+
+    assert "Wrote 44 packets" in capsys.readouterr().out
+    assert len(USB(fname, backend="native").pcap) == 44
+
+def test_generator_bad_args():
+    with pytest.raises(Exception):
+        Generator(endpoints=8)
+
+    with pytest.raises(Exception):
+        Generator(linktype=249)
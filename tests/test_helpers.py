@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+import os
+from Gallimaufry import helpers
+
+def test_usb_ids(tmpdir, monkeypatch):
+    monkeypatch.setenv("GALLIMAUFRY_CACHE_DIR", str(tmpdir))
+    monkeypatch.setattr(helpers, "usb_ids_path", helpers.usb_ids_path)
+    monkeypatch.setattr(helpers, "usb_ids_index", None)
+    monkeypatch.setattr(helpers, "usb_ids_index_directory", None)
+
+    # Saved in the cache directory by default
+    assert helpers.resolve_vendor_id(0x054c) == "Sony Corp."
+    assert helpers.resolve_product_id(0x054c, 0x05c4) == "DualShock 4 [CUH-ZCT1x]"
+    assert helpers.resolve_product_id(0x054c, 0xfffe) == "Unknown..."
+    assert os.path.dirname(helpers.usb_ids_index_path()) == str(tmpdir)
+    assert os.path.isfile(helpers.usb_ids_index_path())
+
+    # Or nowhere, if asked
+    monkeypatch.setattr(helpers, "usb_ids_index", None)
+    helpers.set_usb_ids_index_directory(False)
+    assert helpers.usb_ids_index_path() is None
+    assert helpers.resolve_vendor_id(0x054c) == "Sony Corp."
+    assert len(tmpdir.listdir()) == 1
+
+    monkeypatch.setattr(helpers, "usb_ids_index", None)
+    helpers.set_usb_ids_index_directory(str(tmpdir.join("index")))
+    assert helpers.resolve_vendor_id(0x054c) == "Sony Corp."
+    assert os.path.isfile(helpers.usb_ids_index_path())
+
+    # The saved index is used next time
+    monkeypatch.setattr(helpers, "usb_ids_index", None)
+    with monkeypatch.context() as m:
+        m.setattr(helpers, "read_usb_ids", None)
+        assert helpers.resolve_vendor_id(0x054c) == "Sony Corp."
+
+    # Newer usb.ids supplied at runtime
+    ids = tmpdir.join("usb.ids")
+    ids.write("# comment\n1234  Some Vendor\n\t5678  Some Product\n\t\t00  Interface\n")
+    helpers.set_usb_ids(str(ids))
+
+    assert helpers.resolve_vendor_id(0x1234) == "Some Vendor"
+    assert helpers.resolve_product_id(0x1234, 0x5678) == "Some Product"
+    assert helpers.resolve_vendor_id(0x054c) == "Unknown..."
+
+    # Changes to the file are picked up rather than served from the saved index
+    ids.write("1234  Renamed Vendor\n")
+    os.utime(str(ids), ns=(0, 0))
+    monkeypatch.setattr(helpers, "usb_ids_index", None)
+    assert helpers.resolve_vendor_id(0x1234) == "Renamed Vendor"
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+import os
+import subprocess
+import sys
+
+here = os.path.dirname(os.path.realpath(__file__))
+
+# Standard library modules most programs have loaded anyway
+preload = "import logging, typing, collections, re, threading, os, platform, itertools, functools, sys, time"
+
+script = preload + """
+start = time.perf_counter()
+import Gallimaufry
+print(time.perf_counter() - start)
+print(",".join(sorted(sys.modules)))
+"""
+
+# Generous, to keep slow CI machines happy. Typically a few milliseconds.
+IMPORT_BUDGET = 0.1
+
+def test_import_time():
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    env["PYTHONPATH"] = os.path.dirname(here) + os.pathsep + env.get("PYTHONPATH", "")
+
+    # Best of a few runs. The first also writes out any bytecode.
+    runs = [subprocess.check_output([sys.executable, "-c", script], env=env).decode().split("\n") for _ in range(3)]
+
+    assert min(float(run[0]) for run in runs) < IMPORT_BUDGET
+
+    # Heavy dependencies are only imported once actually used
+    modules = set(runs[0][1].split(","))
+    for module in ("numpy", "matplotlib", "json", "subprocess", "pickle", "Gallimaufry.Classes.HID", "Gallimaufry.Backends.TShark",
+            "Gallimaufry.Backends.Native", "Gallimaufry.Cache", "Gallimaufry.Budget", "mmap"):
+        assert module not in modules
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+import numpy
+from Gallimaufry.Classes.HID.Keyboard import Keyboard, key_codes
+
+def decode_report(report):
+    # One report at a time, the straightforward way
+    modifier = Keyboard._parse_modifier(report[0])
+    stroke = ""
+
+    for key in report[2:]:
+        if key == 0:
+            continue
+
+        key = key_codes[key][1 if modifier['LEFT_SHIFT'] or modifier['RIGHT_SHIFT'] else 0]
+
+        for k, v in modifier.items():
+            if k not in ["LEFT_SHIFT", "RIGHT_SHIFT"] and v == True:
+                key = "[{0}]".format(k) + key
+
+        stroke += key
+
+    return stroke
+
+def test_decode_reports():
+    rng = numpy.random.RandomState(0)
+
+    reports = numpy.zeros((5000, 8), dtype=numpy.uint8)
+    reports[:, 0] = rng.randint(0, 256, len(reports))
+    reports[:, 2:] = rng.choice(sorted(key_codes) + [0] * 200, (len(reports), 6))
+
+    expected = [decode_report(report) for report in reports.tolist()]
+    assert Keyboard.decode_reports(reports) == [stroke for stroke in expected if stroke != ""]
+
+    assert Keyboard.decode_reports(numpy.zeros((0, 8), dtype=numpy.uint8)) == []
+    assert Keyboard.decode_reports(numpy.zeros((3, 8), dtype=numpy.uint8)) == []
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+import os
+import stat
+import sys
+from Gallimaufry.Live import Live
+from Gallimaufry.USB import USB
+from Gallimaufry.Generator import Generator
+
+here = os.path.dirname(os.path.realpath(__file__))
+
+def keystrokes_by_endpoint(usb):
+    keystrokes = {}
+
+    for device in usb.devices:
+        for configuration in device.configurations:
+            for interface in configuration.interfaces:
+                for endpoint in interface.endpoints:
+                    if endpoint.keyboard is not None and endpoint.keyboard.keystrokes_list:
+                        keystrokes[(device.bus_id, device.device_address, endpoint.bEndpointAddress)] = endpoint.keyboard.keystrokes_list
+
+    return keystrokes
+
+def live_keystrokes(live_factory):
+    devices = []
+    keystrokes = {}
+
+    def on_keystroke(device, endpoint, keystroke):
+        keystrokes.setdefault((device.bus_id, device.device_address, endpoint.bEndpointAddress), []).append(keystroke)
+
+    live = live_factory(on_device=devices.append, on_keystroke=on_keystroke)
+    live.run()
+    return live, devices, keystrokes
+
+def test_live_stream():
+    for name in ("csaw_2012_net300.pcap", "hackit_2017_foren100.pcap"):
+        pcap_file_name = os.path.join(here, "examples", "keyboards", name)
+
+        with open(pcap_file_name, "rb") as f:
+            live, devices, keystrokes = live_keystrokes(lambda **kwargs: Live.from_stream(f, **kwargs))
+
+        usb = USB(pcap_file_name, backend="native")
+        assert live.packets == len(usb.pcap)
+        assert keystrokes == keystrokes_by_endpoint(usb)
+        assert set(live.devices) == set((d.bus_id, d.device_address) for d in devices)
+
+def test_live_tshark(tmpdir):
+    pcap_file_name = str(tmpdir.join("generated.pcapng"))
+    Generator(buses=2, devices=2, reports=400).write(pcap_file_name, format="pcapng")
+
+    # Stand in for tshark -i usbmonN -w -, dribbling the capture out
+    tshark = tmpdir.join("tshark")
+    tshark.write("#!{0}\nimport sys, time\nf = open({1!r}, 'rb')\nfor block in iter(lambda: f.read(1000), b''):\n"
+            "    sys.stdout.buffer.write(block); sys.stdout.flush(); time.sleep(0.001)\n".format(sys.executable, pcap_file_name))
+    os.chmod(str(tshark), os.stat(str(tshark)).st_mode | stat.S_IEXEC)
+
+    live, devices, keystrokes = live_keystrokes(lambda **kwargs: Live.from_tshark("usbmon0", tshark=str(tshark), **kwargs))
+    live.stop()
+
+    usb = USB(pcap_file_name, backend="native")
+    assert sorted(live.devices) == [(d.bus_id, d.device_address) for d in usb.devices]
+    assert keystrokes == keystrokes_by_endpoint(usb)
+    assert len(keystrokes) == 4
+
+def test_live_bounded():
+    pcap_file_name = os.path.join(here, "examples", "keyboards", "hackit_2017_foren100.pcap")
+
+    with open(pcap_file_name, "rb") as f:
+        live = Live.from_stream(f, max_descriptors=4, max_outstanding=2)
+        live.run(max_packets=500)
+
+    assert live.packets == 500
+    assert len(live._Live__decoder.requests) <= 3
+    assert all(len(descriptors) <= 4 for descriptors in live._Live__descriptors.values())
+
+def test_live_keeps_configuration(monkeypatch):
+    import Gallimaufry.Live
+
+    built = []
+
+    class CountingDevice(Gallimaufry.Live.Device):
+        def __init__(self, *args, **kwargs):
+            built.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(Gallimaufry.Live, "Device", CountingDevice)
+    pcap_file_name = os.path.join(here, "examples", "keyboards", "hackit_2017_foren100.pcap")
+
+    # Far fewer packets kept than the device sends descriptors in
+    with open(pcap_file_name, "rb") as f:
+        live, devices, keystrokes = live_keystrokes(lambda **kwargs: Live.from_stream(f, max_descriptors=2, **kwargs))
+
+    usb = USB(pcap_file_name, backend="native")
+    assert keystrokes == keystrokes_by_endpoint(usb)
+
+    for device in usb.devices:
+        if not device.configurations:
+            continue
+        rebuilt = live.devices[(device.bus_id, device.device_address)]
+        assert len(rebuilt.configurations) == len(device.configurations)
+        assert rebuilt.string_descriptors == device.string_descriptors
+
+    # Built once, when its configuration arrived, rather than again on every later descriptor
+    assert len(built) == len(live.devices)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+import os
+import numpy
+from Gallimaufry.USB import USB
+from Gallimaufry.Packet import Packet
+from Gallimaufry.Classes.HID.Mouse import Mouse
+
+here = os.path.dirname(os.path.realpath(__file__))
+
+def test_mouse():
+    reports = [b"\x01\x05\xfb\x00", b"\x00\x7f\x80\x01", None, b"\x02\xff\x01\xff", b"\x00\x00\x00"]
+    mouse = Mouse([Packet(i, data=data) for i, data in enumerate(reports)])
+
+    assert mouse.button.tolist() == [1, 0, 2, 0]
+    assert mouse.dx.dtype == numpy.int8
+    assert mouse.dx.tolist() == [5, 127, -1, 0]
+    assert mouse.dy.tolist() == [-5, -128, 1, 0]
+    assert mouse.wheel.tolist() == [0, 1, -1, 0]
+    assert mouse.x.tolist() == [5, 132, 131, 131]
+    assert mouse.y.tolist() == [-5, -133, -132, -132]
+    assert mouse.actions_list[1] == {'x': 127, 'y': -128, 'wheel': 1, 'button': 0}
+    assert mouse.actions.startswith("X=5 Y=-5 W=0] B=1\n")
+
+def test_mouse_endpoint():
+    pcap = USB(os.path.join(here,"examples","keyboards","csaw_2012_net300.pcap"))
+
+    device = next(d for d in pcap.devices if d.device_address == 26)
+    endpoint = device.configurations[0].interfaces[1].endpoints[0]
+
+    assert endpoint.keyboard is None
+    assert isinstance(endpoint.mouse, Mouse)
+    assert len(endpoint.mouse.x) == 0
+
+def test_mouse_update():
+    reports = [b"\x01\x05\xfb\x00", b"\x00\x7f\x80\x01", b"\x02\xff\x01\xff", b"\x00\x00\x00"]
+    packets = [Packet(i, data=data) for i, data in enumerate(reports)]
+
+    mouse = Mouse(packets[:1])
+    mouse.update(packets[1:])
+    whole = Mouse(packets)
+
+    for column in ("button", "dx", "dy", "wheel", "x", "y"):
+        assert getattr(mouse, column).tolist() == getattr(whole, column).tolist()
+
+    assert (mouse.reports == whole.reports).all()
+
+def test_mouse_update_only_decodes_new(monkeypatch):
+    reports = [bytes([i % 3, i % 256, (-i) % 256, 0]) for i in range(1000)]
+    packets = [Packet(i, data=data) for i, data in enumerate(reports)]
+
+    mouse = Mouse(packets[:10])
+    decoded = []
+    decode_reports = Mouse.decode_reports
+    monkeypatch.setattr(Mouse, "decode_reports", staticmethod(lambda reports: decoded.append(len(reports)) or decode_reports(reports)))
+
+    for start in range(10, 1000, 7):
+        new = packets[start:start + 7]
+        decoded.clear()
+        mouse.update(new)
+        assert decoded == [len(new)]
+
+    monkeypatch.undo()
+    whole = Mouse(packets)
+
+    for column in ("button", "dx", "dy", "wheel", "x", "y"):
+        assert getattr(mouse, column).tolist() == getattr(whole, column).tolist()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+import os
+from Gallimaufry.USB import USB
+from Gallimaufry.Backends import parse_parallel
+from Gallimaufry.Backends.Native import Native, iter_frames, split_frames
+
+here = os.path.dirname(os.path.realpath(__file__))
+
+def test_native_usbmon_pcap():
+    pcap = USB(os.path.join(here,"examples","keyboards","csaw_2012_net300.pcap"), backend="native")
+
+    assert len(pcap.pcap) == 2844
+    assert set(d.device_address for d in pcap.devices) == set([0,26])
+
+    d = next(d for d in pcap.devices if d.device_address == 26)
+    i = next(i for i in d.configurations[0].interfaces if i.bInterfaceNumber == 0)
+    assert i.endpoints[0].keyboard.keystrokes.startswith('[RIGHT_GUI]rxterm -geometry 12x1+0+0\necho k\n')
+
+def test_native_usbpcap_pcap():
+    pcap = USB(os.path.join(here,"examples","keyboards","hackit_2017_foren100.pcap"), backend="native")
+
+    assert len(pcap.pcap) == 835
+    d = pcap.devices[0]
+    assert d.idVendor == 0x05ac
+    assert d.device_version == '0.6.9'
+    assert d.configurations[0].bMaxPower == 20
+    assert 'flag{k3yb0ard_sn4ke_2.0}' in d.configurations[0].interfaces[0].endpoints[0].keyboard.keystrokes_interpret
+
+    pcap = USB(os.path.join(here,"examples","general","device_string_descriptor.pcap"), backend="native")
+    assert pcap.devices[0].string_descriptors == {1: 'XHC MACH3 CARD'}
+
+def test_native_usbmon_pcapng():
+    pcap = USB(os.path.join(here,"examples","webcam","logitech_C310_enum.pcapng"), backend="native")
+
+    device = pcap.devices[0]
+    assert device.string_descriptors == {2: '7DC902A0'}
+    assert len(device.configurations[0].interfaces[0].uvc) == 8
+    # tshark names both color matching descriptors identically, so one is lost in its json
+    assert len(device.configurations[0].interfaces[1].uvc) == 43
+
+def test_native_stream():
+    pcap_file_name = os.path.join(here,"examples","keyboards","hackit_2017_foren100.pcap")
+
+    assert USB(pcap_file_name, backend="native", stream=True).summary == USB(pcap_file_name, backend="native").summary
+
+def test_split_frames(tmpdir):
+    from Gallimaufry.Generator import Generator
+
+    for format in ("pcap", "pcapng"):
+        fname = str(tmpdir.join("split." + format))
+        count = Generator(devices=2, reports=500).write(fname, format=format)
+
+        chunks = split_frames(fname, 4)
+        assert len(chunks) == 4
+        assert chunks[0].first == 1
+        assert sum(chunk.count for chunk in chunks) == count
+        assert [chunk.offset for chunk in chunks[1:]] == [chunk.stop for chunk in chunks[:-1]]
+        assert chunks[-1].stop == os.path.getsize(fname)
+
+        # Reading chunk by chunk gives the same frames as reading it all
+        assert [frame for chunk in chunks for frame in iter_frames(fname, chunk)] == list(iter_frames(fname))
+
+def test_native_parallel():
+    key = lambda p: (p.number, p.timestamp, p.bus_id, p.device_address, p.endpoint, p.transfer_type,
+            p.urb_status, p.request_in, p.data, p.raw_layers)
+
+    for name in ("keyboards/csaw_2012_net300.pcap", "keyboards/hackit_2017_foren100.pcap", "webcam/logitech_C310_enum.pcapng"):
+        pcap_file_name = os.path.join(here, "examples", *name.split("/"))
+        packets = [key(packet) for packet in Native(pcap_file_name).parse()]
+
+        # Enough chunks that requests and responses get split up
+        for jobs in (2, 17):
+            assert [key(packet) for packet in parse_parallel(Native, pcap_file_name, jobs)] == packets
+
+    pcap_file_name = os.path.join(here, "examples", "keyboards", "hackit_2017_foren100.pcap")
+    assert USB(pcap_file_name, backend="native", jobs=3).summary == USB(pcap_file_name, backend="native").summary
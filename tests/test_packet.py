@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+from collections import OrderedDict
+from Gallimaufry.Packet import Packet
+
+def layers(**extra):
+    layers = OrderedDict([
+        ('frame', OrderedDict([('frame.time_epoch', '1.500000000'), ('frame.number', '7')])),
+        ('usb', OrderedDict([('usb.bus_id', '1'), ('usb.device_address', '3'), ('usb.endpoint_address', '0x81'), ('usb.transfer_type', '0x01'), ('usb.urb_status', '0')])),
+        ])
+    layers.update(extra)
+    return layers
+
+def test_packet_from_layers():
+    packet = Packet.from_layers(layers(**{'usb.capdata': '02:00:04:00:00:00:00:00'}))
+
+    assert (packet.number, packet.timestamp, packet.bus_id, packet.device_address) == (7, 1.5, 1, 3)
+    assert (packet.endpoint, packet.direction, packet.transfer_type, packet.urb_status) == (0x81, 1, 1, 0)
+    assert packet.data == bytes([2, 0, 4, 0, 0, 0, 0, 0])
+
+    # Data frames don't hold on to their layers, but can rebuild them
+    assert packet.raw_layers is None
+    assert packet['_source']['layers'] == layers(**{'usb.capdata': '02:00:04:00:00:00:00:00'})
+
+def test_packet_keeps_descriptor_layers():
+    descriptor = layers(**{'DEVICE DESCRIPTOR': OrderedDict([('usb.bDescriptorType', '0x01')])})
+    packet = Packet.from_layers(descriptor)
+
+    assert packet.raw_layers is descriptor
+    assert packet.layers is descriptor
+
+def test_packet_hash():
+    data = layers(**{'usb.capdata': '02:00:04:00:00:00:00:00'})
+    descriptor = Packet.from_layers(layers(**{'DEVICE DESCRIPTOR': OrderedDict([('usb.bDescriptorType', '0x01')])}))
+
+    # Equal packets hash the same, and can be used in sets and as keys
+    assert Packet.from_layers(data) == Packet.from_layers(data)
+    assert len({Packet.from_layers(data), Packet.from_layers(data), descriptor}) == 2
+    assert {descriptor: 1}[descriptor] == 1
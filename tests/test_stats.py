@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+import os
+import json
+from Gallimaufry.USB import USB
+from Gallimaufry.Stats import Stats, main
+
+here = os.path.dirname(os.path.realpath(__file__))
+
+def test_stats():
+    seen = []
+    stats = Stats(hooks=[lambda *args: seen.append(args)])
+
+    with stats.stage("decode") as timer:
+        timer.count = 10
+
+    with stats.stage("decode", 5):
+        pass
+
+    stats.record("strings", 0.5, 0.25, 2)
+
+    assert [stage.name for stage in stats] == ["decode", "strings"]
+    assert stats["decode"].calls == 2
+    assert stats["decode"].count == 15
+    assert stats["strings"].wall == 0.5
+    assert stats.cpu >= 0.25
+    assert [args[0] for args in seen] == ["decode", "decode", "strings"]
+    assert seen[-1] == ("strings", 0.5, 0.25, 2)
+
+    assert json.loads(stats.to_json())["strings"] == {"calls": 1, "count": 2, "wall": 0.5, "cpu": 0.25}
+    assert str(stats).split("\n")[-1].startswith("total")
+
+def test_usb_stats():
+    seen = []
+    pcap = USB(os.path.join(here,"examples","keyboards","csaw_2012_net300.pcap"), backend="native", stats=Stats(hooks=[lambda *args: seen.append(args[0])]))
+
+    assert list(pcap.stats.to_dict()) == ["decode", "enumeration", "strings", "configurations"]
+    assert pcap.stats["decode"].count == len(pcap.pcap)
+    assert pcap.stats["enumeration"].count == len(pcap.pcap)
+    assert pcap.stats["strings"].calls == len(pcap.devices)
+
+    # Handlers are only timed once they have run
+    pcap.decode(handlers=["keyboard"])
+    assert "handlers.keyboard" in pcap.stats
+    assert "handlers.mouse" not in pcap.stats
+    # The hooks saw every run of every stage
+    assert len(seen) == sum(stage.calls for stage in pcap.stats)
+    assert seen[-1] == "handlers.keyboard"
+
+    # Each endpoint's packets are only picked out once, however many handlers run
+    endpoints = [endpoint for device in pcap.devices for configuration in device.configurations
+            for interface in configuration.interfaces for endpoint in interface.endpoints]
+    assert pcap.stats["views"].calls == 1
+    assert pcap.stats["views"].count == sum(len(endpoint.pcap) for endpoint in endpoints if endpoint.pcap.resolved)
+    pcap.decode()
+    assert pcap.stats["views"].calls == sum(endpoint.pcap.resolved for endpoint in endpoints)
+
+def test_stats_main(capsys):
+    assert main([os.path.join(here,"examples","keyboards","csaw_2012_net300.pcap"), "--backend", "native", "--json"]) == 0
+    stages = json.loads(capsys.readouterr().out)
+    assert "handlers.keyboard" in stages
+    assert stages["decode"]["count"] == 2844
+
+def test_stats_memory():
+    stats = Stats(memory=True)
+    try:
+        pcap = USB(os.path.join(here,"examples","keyboards","csaw_2012_net300.pcap"), backend="native", stats=stats)
+        pcap.decode(handlers=["keyboard"])
+    finally:
+        stats.stop()
+
+    assert stats["decode"].peak > 0
+    assert stats["decode"].retained > 0
+    assert stats["handlers.keyboard"].peak >= stats["handlers.keyboard"].retained
+
+    report = stats.report()
+    assert list(report["stages"]) == list(stats.to_dict())
+    levels = [total["level"] for total in report["objects"]]
+    assert levels == sorted(levels, key=["USB", "Device", "Endpoint", "handler"].index)
+    assert {"USB", "Device", "Endpoint", "handler"} <= set(levels)
+    assert report["objects"][0]["name"] == "csaw_2012_net300.pcap"
+    assert any(total["name"].endswith("keyboard") for total in report["objects"] if total["level"] == "handler")
+    assert "handler" in stats.memory_table()
+
+def test_stats_main_memory(capsys):
+    assert main([os.path.join(here,"examples","keyboards","csaw_2012_net300.pcap"), "--backend", "native", "--json", "--memory"]) == 0
+    report = json.loads(capsys.readouterr().out)
+    assert report["stages"]["decode"]["peak"] > 0
+    assert report["objects"][0]["level"] == "USB"
+
+    assert main([os.path.join(here,"examples","keyboards","csaw_2012_net300.pcap"), "--backend", "native", "--max-memory", "0.01"]) == 1
+    assert "max_memory" in capsys.readouterr().err
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+import json
+from Gallimaufry.Backends.TShark import TShark
+from Gallimaufry import settings
+
+def test_iter_json_packets():
+    packets = [
+            {"_source": {"layers": {"frame": {"frame.number": str(i)}, "usb": {"usb.bus_id": "1", "usb.device_address": "2", "usb.endpoint_address": "0x81"}}}}
+            for i in range(1, 4)
+            ]
+    packets[1]["_source"]["layers"]["usb.capdata"] = "00:00"
+
+    lines = json.dumps(packets, indent=2).splitlines(keepends=True)
+    streamed = list(TShark.iter_json_packets(iter(lines)))
+
+    assert [packet.number for packet in streamed] == [1, 2, 3]
+    assert all(packet.endpoint == 0x81 for packet in streamed)
+    assert streamed[1].data == b'\x00\x00'
+    assert settings.usb_endpoint_designator == "usb.endpoint_address"
+
+def test_packet_from_fields():
+    from Gallimaufry.Backends.Fields import Fields
+
+    packet = Fields.packet_from_fields("12\t1521454822.920480967\t1\t3\t0x81\t0x01\t0\t\t11\t0000160000000000\n")
+
+    assert (packet.number, packet.bus_id, packet.device_address, packet.endpoint, packet.request_in) == (12, 1, 3, 0x81, 11)
+    assert (packet.transfer_type, packet.urb_status, packet.direction) == (1, 0, 1)
+    assert packet.data == bytes([0, 0, 0x16, 0, 0, 0, 0, 0])
+
+    # USBPcap captures carry a USBD status instead
+    packet = Fields.packet_from_fields("12\t0.0\t1\t3\t0x02\t0x03\t\t0xc0000004\t\t\n")
+    assert (packet.transfer_type, packet.urb_status, packet.direction) == (3, 0xc0000004, 0)
+
+    packet = Fields.packet_from_fields("1\t0.0\t\t\t\t\t\t\t\t\n")
+    assert packet.bus_id is None
+    assert list(packet.layers) == ['frame']
+
+def test_aiter_packets(tmpdir, monkeypatch):
+    import asyncio
+    import sys
+
+    packets = [
+            {"_source": {"layers": {"frame": {"frame.number": str(i)}, "usb": {"usb.bus_id": "1", "usb.device_address": "2", "usb.endpoint_address": "0x81"}}}}
+            for i in range(1, 2001)
+            ]
+
+    output = tmpdir.join("output.json")
+    output.write(json.dumps(packets, indent=2))
+
+    # Stand in for tshark, writing its json out in small pieces
+    script = "import sys, time\nfor line in open(sys.argv[1]):\n    sys.stdout.write(line)\n    if line.startswith('  }'): sys.stdout.flush(); time.sleep(0.0001)\n"
+    monkeypatch.setattr(TShark, "command", property(lambda self: [sys.executable, "-c", script, str(output)]))
+
+    async def main():
+        return [packet async for packet in TShark("unused.pcap").aiter_packets()]
+
+    streamed = asyncio.run(main())
+    assert [packet.number for packet in streamed] == list(range(1, 2001))
+    assert all(packet.endpoint == 0x81 for packet in streamed)
+
+def test_aiter_packets_failure(monkeypatch):
+    import asyncio
+    import subprocess
+    import sys
+    import pytest
+
+    monkeypatch.setattr(TShark, "command", property(lambda self: [sys.executable, "-c", "import sys; sys.exit(2)"]))
+
+    async def main():
+        return [packet async for packet in TShark("unused.pcap").aiter_packets()]
+
+    with pytest.raises(subprocess.CalledProcessError):
+        asyncio.run(main())
+
+def test_parse_stats(tmpdir, monkeypatch):
+    import sys
+    from Gallimaufry.Stats import Stats
+
+    packets = [{"_source": {"layers": {"frame": {"frame.number": str(i)}, "usb": {"usb.bus_id": "1", "usb.device_address": "2", "usb.endpoint_address": "0x81"}}}}
+            for i in range(1, 101)]
+
+    output = tmpdir.join("output.json")
+    output.write(json.dumps(packets, indent=2))
+
+    monkeypatch.setattr(TShark, "command", property(lambda self: [sys.executable, "-c", "import sys; sys.stdout.write(open(sys.argv[1]).read())", str(output)]))
+
+    stats = Stats()
+    assert len(TShark("unused.pcap", stats=stats).parse()) == 100
+
+    assert list(stats.to_dict()) == ["tshark", "preprocess", "decode"]
+    assert stats["tshark"].count == len(output.read())
+    assert stats["decode"].count == 100
+
+def test_fields_matches_tshark(tmpdir, monkeypatch):
+    import os
+    import sys
+    from Gallimaufry.Backends.Fields import Fields
+    from Gallimaufry.Backends.Native import Native
+
+    here = os.path.dirname(os.path.realpath(__file__))
+
+    # Stand in for tshark's output with the native backend's packets, which are laid out the same way
+    packets = Native(os.path.join(here, "examples", "keyboards", "csaw_2012_net300.pcap")).parse()
+    layers = [packet.layers for packet in packets]
+
+    def field(layer, name):
+        for value in (layer.get(name), layer['frame'].get(name), layer.get('usb', {}).get(name)):
+            if value is not None:
+                return value
+        return ""
+
+    output = tmpdir.join("output.json")
+    output.write(json.dumps([{"_source": {"layers": layer}} for layer in layers], indent=2))
+
+    descriptors = tmpdir.join("descriptors.json")
+    descriptors.write(json.dumps([{"_source": {"layers": packet.raw_layers}} for packet in packets if packet.raw_layers is not None], indent=2))
+
+    fields = tmpdir.join("fields.txt")
+    fields.write("".join("\t".join(field(layer, name) for name in Fields.field_names("usb.endpoint_address")) + "\n" for layer in layers))
+
+    cat = "import sys; sys.stdout.write(open(sys.argv[1]).read())"
+    monkeypatch.setattr(TShark, "command", property(lambda self: [sys.executable, "-c", cat, str(output)]))
+    monkeypatch.setattr(Fields, "command", property(lambda self: [sys.executable, "-c", cat, str(fields)]))
+    monkeypatch.setattr(Fields, "descriptor_command", property(lambda self: [sys.executable, "-c", cat, str(descriptors)]))
+    monkeypatch.setattr(Fields, "endpoint_designator", staticmethod(lambda: "usb.endpoint_address"))
+
+    from_json = TShark("unused.pcap").parse()
+    from_fields = Fields("unused.pcap").parse()
+
+    assert len(from_fields) == len(packets)
+    assert all(packet.transfer_type is not None and packet.urb_status is not None for packet in from_fields)
+    assert from_fields == from_json
+
+def test_parallel_runs_tshark_once(tmpdir, monkeypatch, caplog):
+    import os
+    import sys
+    from Gallimaufry.Backends import parse_parallel
+
+    here = os.path.dirname(os.path.realpath(__file__))
+    packets = [{"_source": {"layers": {"frame": {"frame.number": str(i)}, "usb": {"usb.bus_id": "1", "usb.device_address": "2", "usb.endpoint_address": "0x81"}}}}
+            for i in range(1, 101)]
+
+    output = tmpdir.join("output.json")
+    output.write(json.dumps(packets, indent=2))
+    runs = tmpdir.join("runs")
+
+    # Note down each command line tshark is run with
+    script = "import sys; open(sys.argv[2], 'a').write(repr(sys.argv[3:]) + '\\n'); sys.stdout.write(open(sys.argv[1]).read())"
+    monkeypatch.setattr(TShark, "command", property(lambda self: [sys.executable, "-c", script, str(output), str(runs), "-r", self.pcap_filename]
+        + (["-Y", self.display_filter] if self.display_filter is not None else [])))
+
+    capture = os.path.join(here, "examples", "keyboards", "csaw_2012_net300.pcap")
+    assert len(parse_parallel(TShark, capture, 4)) == 100
+
+    # One tshark over the whole capture, rather than one per chunk each reading all of it
+    assert runs.read().splitlines() == [repr(["-r", capture])]
+    assert "one process" in caplog.text
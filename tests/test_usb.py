@@ -1,7 +1,13 @@
 #!/usr/bin/env python
 
 import os
+import pytest
 from Gallimaufry.USB import USB
+from Gallimaufry.Backends.Native import Native
+from Gallimaufry.Generator import Generator
+from Gallimaufry import settings
+from Gallimaufry.PacketList import PacketList
+from Gallimaufry.Classes.HID.Keyboard import Keyboard
 
 here = os.path.dirname(os.path.realpath(__file__))
 
@@ -15,3 +21,275 @@ def test_pcap_filter():
 
     assert len(pcap.pcap) == len(pcap.pcap_filter(bus_id=2, device_address=1, endpoint_number=1))
 
+
+def test_pcap_filter_index():
+    pcap = USB(os.path.join(here,"examples","keyboards","csaw_2012_net300.pcap"))
+
+    for bus_id, device_address, endpoint_number in [(2, 26, 1), (2, 26, None), (None, None, 0), (2, None, None)]:
+        expected = [packet for packet in pcap.pcap if
+                (bus_id is None or int(packet['_source']['layers']['usb']['usb.bus_id']) == bus_id) and
+                (device_address is None or int(packet['_source']['layers']['usb']['usb.device_address']) == device_address) and
+                (endpoint_number is None or int(packet['_source']['layers']['usb'][settings.usb_endpoint_designator], 16) & 0b111 == endpoint_number)
+                ]
+        assert pcap.pcap_filter(bus_id=bus_id, device_address=device_address, endpoint_number=endpoint_number) == expected
+
+def test_request_response():
+    pcap = USB(os.path.join(here,"examples","general","device_string_descriptor.pcap"))
+
+    pairs = list(pcap.pcap.pairs())
+    assert len(pairs) > 0
+
+    for request, response in pairs:
+        assert pcap.pcap.request(response) is request
+        assert pcap.pcap.response(request) is response
+        assert pcap.pcap.frame(int(request['_source']['layers']['frame']['frame.number'])) is request
+
+def test_pcap_view():
+    pcap = USB(os.path.join(here,"examples","keyboards","csaw_2012_net300.pcap"))
+
+    for device in pcap.devices:
+        expected = pcap.pcap_filter(bus_id=device.bus_id, device_address=device.device_address)
+        view = device.pcap
+
+        assert len(view) == len(expected)
+        assert list(view) == expected
+        assert view[3] is expected[3]
+        assert view[-1] is expected[-1]
+        assert list(view[2:10:3]) == expected[2:10:3]
+        assert list(view[5:][1:4]) == expected[6:9]
+        assert view.view(endpoint_number=1) == expected.filter(endpoint_number=1)
+        assert view[10:].view(endpoint_number=1) == PacketList(expected[10:]).filter(endpoint_number=1)
+
+        for configuration in device.configurations:
+            for interface in configuration.interfaces:
+                for endpoint in interface.endpoints:
+                    assert endpoint.pcap == expected.filter(endpoint_number=endpoint.number)
+
+def test_pcap_view_conflicting():
+    pcap = USB(os.path.join(here,"examples","keyboards","csaw_2012_net300.pcap"))
+    device = pcap.devices[1]
+    packets = PacketList(pcap.pcap)
+
+    view = packets.view(bus_id=device.bus_id, device_address=device.device_address)
+    nothing = view.view(device_address=device.device_address + 1)
+    assert len(nothing) == 0
+
+    # Packets appended later that match the first selection still don't match both
+    start = len(packets)
+    packets.extend(list(view))
+    assert nothing.refresh(start) == []
+    assert len(nothing) == 0
+    assert list(nothing) == []
+    assert len(nothing.view(endpoint_number=1)) == 0
+
+def test_decode():
+    pcap = USB(os.path.join(here,"examples","keyboards","csaw_2012_net300.pcap"))
+
+    device = next(d for d in pcap.devices if d.device_address == 26)
+    endpoint = device.configurations[0].interfaces[0].endpoints[0]
+    calls = []
+
+    class Counting(Keyboard):
+        def __init__(self, pcap):
+            calls.append(pcap)
+            super().__init__(pcap)
+
+    endpoint.handlers['keyboard'] = Counting
+
+    # Opted out
+    pcap.decode(handlers=[])
+    assert calls == []
+
+    pcap.decode(handlers=["keyboard"])
+    assert len(calls) == 1
+
+    # Cached from here on
+    keyboard = endpoint.keyboard
+    assert endpoint.keyboard is keyboard
+    assert len(calls) == 1
+    assert keyboard.keystrokes.startswith('[RIGHT_GUI]rxterm')
+
+    # Not a keyboard
+    assert device.configurations[0].interfaces[1].endpoints[0].keyboard is None
+
+def test_open(monkeypatch):
+    import asyncio
+    import time
+    from Gallimaufry.Endpoint import Endpoint
+
+    names = ["csaw_2012_net300.pcap", "hackit_2017_foren100.pcap", "pico_2017_Just_Keyp_Trying.pcap"]
+    paths = [os.path.join(here, "examples", "keyboards", name) for name in names]
+
+    ticks = []
+    # Ticks of the event loop while each of enumeration and decoding ran
+    during = {"enumeration": [], "decode": []}
+
+    def slowed(stage, function):
+        def slow(*args, **kwargs):
+            start = len(ticks)
+            time.sleep(0.02)
+            result = function(*args, **kwargs)
+            during[stage].append(len(ticks) - start)
+            return result
+        return slow
+
+    monkeypatch.setattr(USB, "_enumerate_devices", slowed("enumeration", USB._enumerate_devices))
+    monkeypatch.setattr(Endpoint, "_decoded", slowed("decode", Endpoint._decoded))
+
+    async def ticker(ticks):
+        while True:
+            ticks.append(None)
+            await asyncio.sleep(0)
+
+    async def main():
+        task = asyncio.ensure_future(ticker(ticks))
+
+        captures = await asyncio.gather(*(USB.open(path, backend="native") for path in paths))
+        keystrokes = [(name, result.keystrokes) for capture in captures async for _, name, result in capture.iter_decoded(["keyboard"])]
+
+        task.cancel()
+        return captures, keystrokes, ticks
+
+    captures, keystrokes, ticks = asyncio.run(main())
+
+    # The event loop kept running while they were parsed, enumerated and decoded
+    assert len(ticks) > 3
+    assert len(during["enumeration"]) == len(paths) and all(during["enumeration"])
+    assert during["decode"] and all(during["decode"])
+
+    for path, capture in zip(paths, captures):
+        assert capture.summary == USB(path, backend="native").summary
+
+    assert [name for name, _ in keystrokes] == ["keyboard", "keyboard"]
+    assert keystrokes[0][1].startswith('[RIGHT_GUI]rxterm -geometry 12x1+0+0\necho k\n')
+
+def test_open_stream(monkeypatch):
+    import asyncio
+    import time
+    from Gallimaufry.Backends.Native import Native
+
+    path = os.path.join(here, "examples", "keyboards", "csaw_2012_net300.pcap")
+    ticks = []
+    during = []
+
+    iter_packets = Native.iter_packets
+
+    def slow(*args, **kwargs):
+        start = len(ticks)
+        time.sleep(0.02)
+        yield from iter_packets(*args, **kwargs)
+        during.append(len(ticks) - start)
+
+    monkeypatch.setattr(Native, "iter_packets", slow)
+
+    async def ticker():
+        while True:
+            ticks.append(None)
+            await asyncio.sleep(0)
+
+    async def main():
+        task = asyncio.ensure_future(ticker())
+        capture = await USB.open(path, backend="native", stream=True, max_memory=1024**3)
+        task.cancel()
+        return capture
+
+    capture = asyncio.run(main())
+
+    # Streamed through the backend, off the event loop
+    assert capture.stream
+    assert during and all(during)
+    assert capture.stats["decode"].count == len(capture.pcap) == 2844
+    assert capture.summary == USB(path, backend="native").summary
+
+def test_open_cache(tmpdir):
+    import asyncio
+    from Gallimaufry.Cache import Cache
+
+    cache = Cache(str(tmpdir))
+    path = os.path.join(here, "examples", "keyboards", "hackit_2017_foren100.pcap")
+
+    first = asyncio.run(USB.open(path, backend="native", cache=cache))
+    assert len(cache.entries) == 1
+
+    second = asyncio.run(USB.open(path, backend="native", cache=cache))
+    assert second.summary == first.summary
+
+def snapshot(usb):
+    """What a capture was decoded into, for comparing two parses of it."""
+    return [(device.bus_id, device.device_address, dict(device.string_descriptors), len(device.pcap),
+            [(endpoint.bEndpointAddress, len(endpoint.pcap), endpoint.keyboard.keystrokes if endpoint.keyboard else None)
+                for configuration in device.configurations for interface in configuration.interfaces for endpoint in interface.endpoints])
+            for device in usb.devices]
+
+@pytest.mark.parametrize("format", ["pcap", "pcapng"])
+def test_update(tmpdir, format):
+    source = str(tmpdir.join("whole." + format))
+    Generator(devices=2, strings=2, reports=300).write(source, format=format)
+    whole = USB(source, backend="native")
+
+    with open(source, "rb") as f:
+        data = f.read()
+
+    # Written out bit by bit, cutting records in half along the way
+    fname = str(tmpdir.join("growing." + format))
+    cuts = [100, 101, 2000, 2001, 7777, len(data) // 2, len(data) - 3, len(data)]
+
+    with open(fname, "wb") as f:
+        f.write(data[:cuts[0]])
+
+    usb = USB(fname, backend="native")
+    assert usb.devices == []
+
+    keyboards = {}
+
+    for previous, cut in zip(cuts, cuts[1:]):
+        with open(fname, "ab") as f:
+            f.write(data[previous:cut])
+
+        count = len(usb.pcap)
+        assert usb.update() == len(usb.pcap) - count
+
+        for device in usb.devices:
+            for configuration in device.configurations:
+                for endpoint in configuration.interfaces[0].endpoints:
+                    keyboards.setdefault(endpoint, endpoint.keyboard)
+
+    assert usb.update() == 0
+
+    # Decoded handlers were updated in place
+    assert keyboards
+    for endpoint, keyboard in keyboards.items():
+        assert endpoint.keyboard is keyboard
+
+    assert usb.checkpoint.frame == len(whole.pcap) + 1
+    assert [(p.number, p.request_in, p.data) for p in usb.pcap] == [(p.number, p.request_in, p.data) for p in whole.pcap]
+    assert snapshot(usb) == snapshot(whole)
+
+def test_update_parsed_elsewhere(tmpdir):
+    source = str(tmpdir.join("whole.pcap"))
+    Generator(devices=2, reports=100).write(source)
+    whole = USB(source, backend="native")
+
+    with open(source, "rb") as f:
+        data = f.read()
+
+    fname = str(tmpdir.join("growing.pcap"))
+    with open(fname, "wb") as f:
+        f.write(data[:len(data) // 2])
+
+    # Not read by the native backend, so the first update has to find where it got to
+    usb = USB(fname, backend="native", packets=list(Native(fname).parse()))
+
+    with open(fname, "ab") as f:
+        f.write(data[len(data) // 2:])
+
+    count = len(usb.pcap)
+    assert usb.update() == len(whole.pcap) - count
+    assert snapshot(usb) == snapshot(whole)
+
+    # Replaced with something shorter
+    with open(fname, "wb") as f:
+        f.write(data[:100])
+
+    with pytest.raises(Exception):
+        usb.update()
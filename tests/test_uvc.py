@@ -1,12 +1,15 @@
 #!/usr/bin/env python
 
 import os
+import shutil
+import pytest
 from Gallimaufry.USB import USB
 
 here = os.path.dirname(os.path.realpath(__file__))
 
+@pytest.mark.skipif(shutil.which("tshark") is None, reason="tshark not installed")
 def test_device_string_descriptor():
-    pcap = USB(os.path.join(here,"examples","webcam","logitech_C310_enum.pcapng"))
+    pcap = USB(os.path.join(here,"examples","webcam","logitech_C310_enum.pcapng"), backend="tshark")
     
     device = pcap.devices[0]
 